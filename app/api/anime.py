@@ -1,15 +1,34 @@
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.auth.deps import get_current_user
-from app.db.session import get_db
-from app.models.user import User, WatchedAnime as WatchedAnimeModel, Genre
-from app.schemas.anime import AnimeBase, AnimeSearch
-from app.services.anilist import anilist_service
+from app.auth.deps import get_current_read_user, get_read_db
+from app.core.config import settings
+from app.core.rate_limit import RateLimitExceeded
+from app.core.responses import (
+    RawJSONResponse,
+    anime_list_response,
+    cached_response,
+    render_anime,
+    render_anime_list,
+)
+from app.models.user import User
+from app.schemas.anime import AnimeBase, AnimeSearch, AnimeSuggestion
+from app.services.anilist import AniListUnavailable, anilist_service
+from app.services.broadcast import SSE_HEADERS
+from app.services.catalog import SORT_COLUMNS, catalog_store
+from app.services.genre_index import genre_index
+from app.services.ranking import UserProfile
+from app.services.recommender import recommend
+from app.services.search_index import search_index
+from app.services.trending import trending_streams
 
 router = APIRouter()
+
 logger = logging.getLogger(__name__)
 
 @router.get("/search", response_model=List[AnimeBase], include_in_schema=True)
@@ -30,11 +49,27 @@ async def search_anime(
     print(f"Parsed genre list: {genre_list}")
     
     try:
-        results = await anilist_service.search_anime(query, genre_list, sort)
+        local_results = _search_local(query, genre_list, sort, limit=20)
+        if len(local_results) >= settings.SEARCH_MIN_LOCAL_RESULTS:
+            logger.debug(f"Search returned {len(local_results)} local results")
+            return anime_list_response(local_results)
+
+        try:
+            results = await anilist_service.search_anime(query, genre_list, sort)
+        except (AniListUnavailable, RateLimitExceeded):
+            if not local_results:
+                raise
+            results = []
         print(f"Search returned {len(results)} results")
+        if local_results:
+            local_ids = {anime.id for anime in local_results}
+            results = local_results + [anime for anime in results if anime.id not in local_ids]
+            results = results[:20]
         if not results:
             print("No results found")
-        return results
+        return anime_list_response(results)
+    except (AniListUnavailable, RateLimitExceeded):
+        raise
     except Exception as e:
         print(f"Error in search endpoint: {str(e)}")
         raise HTTPException(
@@ -42,17 +77,100 @@ async def search_anime(
             detail=f"Failed to search anime: {str(e)}"
         )
 
+def _search_local(query: str, genre_list: Optional[List[str]], sort: Optional[str], limit: int) -> List[AnimeBase]:
+    """Search the local catalog; empty when it can't answer the query the way AniList would."""
+    if not search_index.available or (sort and sort not in SORT_COLUMNS):
+        return []
+    genre_mask = catalog_store.genre_mask(genre_list) if genre_list else 0
+    if genre_list and not genre_mask:
+        return []
+    rows = search_index.search(query, limit=limit, genre_mask=genre_mask, prefix=False, sort=sort)
+    return [catalog_store.view(row) for row in rows]
+
+@router.get("/autocomplete", response_model=List[AnimeSuggestion])
+async def autocomplete(
+    q: str,
+    limit: int = Query(10, ge=1, le=50),
+) -> Any:
+    """
+    Suggest titles for a partially typed query, answered from the local catalog.
+
+    AniList is only asked when the catalog has no match for a query of three or more characters.
+    """
+    q = q.strip()
+    if not q:
+        return []
+
+    if search_index.available:
+        rows = search_index.search(q, limit=limit)
+        if rows:
+            return RawJSONResponse([
+                {
+                    "id": int(catalog_store.ids[row]),
+                    "title": catalog_store.string("title_english", row) or catalog_store.string("title_romaji", row) or "Unknown",
+                    "coverImage": catalog_store.string("cover_medium", row) or None,
+                }
+                for row in rows
+            ])
+
+    if len(q) < 3:
+        return []
+    results = await anilist_service.search_anime(q)
+    return RawJSONResponse([
+        {
+            "id": anime.id,
+            "title": anime.title,
+            "coverImage": anime.coverImage.get("medium") if anime.coverImage else None,
+        }
+        for anime in results[:limit]
+    ])
+
+def filter_by_genres(
+    results: List[AnimeBase],
+    genres: Optional[List[str]],
+    match: str = "any",
+    exclude: Optional[List[str]] = None,
+) -> List[AnimeBase]:
+    """Keep titles with any (or, for match=all, every) genre in `genres` and none in `exclude`."""
+    wanted = set(genres or [])
+    excluded = set(exclude or [])
+    return [
+        anime for anime in results
+        if (not wanted or (wanted.issubset(anime.genres) if match == "all" else not wanted.isdisjoint(anime.genres)))
+        and excluded.isdisjoint(anime.genres)
+    ]
+
 @router.get("/sort/{sort_type}", response_model=List[AnimeBase])
 async def get_anime_by_sort(
+    request: Request,
     sort_type: str,
     genres: Optional[str] = None,
-    limit: int = 20
+    limit: int = 20,
+    match: str = "any",
+    exclude_genres: Optional[str] = None,
 ) -> List[AnimeBase]:
-    """Get anime sorted by the specified criteria and optionally filtered by genres."""
+    """
+    Get anime sorted by the specified criteria and optionally filtered by genres.
+
+    `match=any` returns titles with at least one of `genres`, `match=all` only
+    titles with every one of them; titles with any of `exclude_genres` are dropped.
+    """
     try:
         genre_list = genres.split(',') if genres else None
+        exclude_list = exclude_genres.split(',') if exclude_genres else None
         logger.info(f"Sort request - Type: {sort_type}, Genres: {genre_list}, Limit: {limit}")
-        
+
+        if match not in ("any", "all"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid genre match mode: {match}"
+            )
+
+        if genre_index.supports(sort_type):
+            results = genre_index.query(sort_type, genre_list, match, exclude_list, limit)
+            logger.info(f"Returning {len(results)} results from local genre index")
+            return cached_response(request, render_anime_list(results), settings.LIST_CACHE_TTL)
+
         if sort_type == "popularity":
             logger.info("Fetching popular anime with genres: %s", genre_list)
             results = await anilist_service.get_popular_anime(genres=genre_list, limit=limit)
@@ -70,18 +188,15 @@ async def get_anime_by_sort(
                 status_code=400,
                 detail=f"Invalid sort type: {sort_type}"
             )
-        
+
         logger.info(f"Returning {len(results)} results")
-        if genre_list:
-            logger.info(f"Results genres: {[anime.genres for anime in results]}")
-            # Verify that results contain the requested genres
-            filtered_results = [
-                anime for anime in results 
-                if any(genre in anime.genres for genre in genre_list)
-            ]
-            logger.info(f"After genre filtering: {len(filtered_results)} results")
-            return filtered_results
-        return results
+        # AniList already applied genre_in; only the extra query modes need filtering here
+        if (match == "all" and genre_list) or exclude_list:
+            results = filter_by_genres(results, genre_list, match, exclude_list)
+            logger.info(f"After genre filtering: {len(results)} results")
+        return cached_response(request, render_anime_list(results), settings.LIST_CACHE_TTL)
+    except (HTTPException, AniListUnavailable, RateLimitExceeded):
+        raise
     except Exception as e:
         logger.error(f"Error in sort endpoint: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -89,64 +204,94 @@ async def get_anime_by_sort(
             detail=f"Failed to get anime by sort: {str(e)}"
         )
 
+@router.get("/trending/stream")
+async def stream_trending(
+    genres: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=50),
+) -> Any:
+    """
+    Server-sent events following the trending ranking.
+
+    Sends a `snapshot` event with the full list, then a `changes` event
+    (`added`, `removed`, `moved`, `updated`) whenever the ranking changes.
+    Every client asking for the same genres and limit shares one AniList
+    refresh. A client that falls too far behind gets `evicted` and the
+    stream ends.
+    """
+    genre_list = [genre.strip() for genre in genres.split(',')] if genres else None
+    if genre_list:
+        # Each distinct genre set is its own AniList poller, so only accept real genres
+        known = set(catalog_store.genres or await anilist_service.get_genres())
+        unknown = [genre for genre in genre_list if genre not in known]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown genres: {', '.join(unknown)}")
+    feed, subscriber = trending_streams.subscribe(genre_list, limit)
+    snapshot = feed.snapshot or b""
+
+    async def events():
+        try:
+            async for message in subscriber.stream(settings.SSE_KEEPALIVE_SECONDS, snapshot):
+                yield message
+        finally:
+            trending_streams.unsubscribe(feed, subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @router.get("/popular", response_model=List[AnimeBase])
 async def get_popular_anime(
     genre: Optional[str] = None,
     limit: int = 20,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_read_user)
 ) -> Any:
     """
     Get popular anime, optionally filtered by genre.
     """
     genre_list = [genre] if genre else None
     results = await anilist_service.get_popular_anime(genres=genre_list, limit=limit)
-    return results
+    return anime_list_response(results)
 
 @router.get("/recommendations", response_model=List[AnimeBase])
 async def get_recommendations(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_read_user)
 ) -> Any:
     """
     Get anime recommendations based on user preferences and watch history.
     """
-    # Get user's favorite genres
-    genre_names = [genre.name for genre in current_user.favorite_genres]
-    
-    # Get user's watched anime
-    watched_anime_ids = [anime.anime_id for anime in current_user.watched_anime]
-    
-    # If user has watched anime, get recommendations based on last watched
-    if watched_anime_ids:
-        last_watched_id = watched_anime_ids[-1]
-        recommendations = await anilist_service.get_recommendations(last_watched_id)
-        if recommendations:
-            # Filter out already watched anime
-            recommendations = [
-                anime for anime in recommendations 
-                if anime.id not in watched_anime_ids
-            ]
-            return recommendations[:10]
-    
-    # If user has favorite genres, get popular anime from those genres
-    if genre_names:
-        # Just use the first genre for now
-        popular_anime = await anilist_service.get_popular_anime(genre=genre_names[0])
-        return popular_anime[:10]
-    
-    # Fallback to general popular anime
-    popular_anime = await anilist_service.get_popular_anime()
-    return popular_anime[:10]
+    profile = UserProfile(
+        favorite_genres=[genre.name for genre in current_user.favorite_genres],
+        history=[(anime.anime_id, anime.status, anime.rating) for anime in current_user.watched_anime],
+    )
+    return anime_list_response(await recommend(profile, 10))
 
 @router.get("/genres", response_model=List[str])
-async def get_genres() -> Any:
+async def get_genres(request: Request) -> Any:
     """
     Get list of available anime genres.
     """
-    return await anilist_service.get_genres()
+    genres = await anilist_service.get_genres()
+    return cached_response(request, orjson.dumps(genres), settings.GENRE_CACHE_TTL)
+
+@router.get("/genres/facets", response_model=Dict[str, int])
+def get_genre_facets(
+    genres: Optional[str] = None,
+    match: str = "any",
+    exclude_genres: Optional[str] = None,
+) -> Any:
+    """
+    Count matching titles per genre in the local catalog.
+    """
+    if not genre_index.available:
+        raise HTTPException(status_code=503, detail="Local catalog is not loaded")
+    if match not in ("any", "all"):
+        raise HTTPException(status_code=400, detail=f"Invalid genre match mode: {match}")
+    genre_list = genres.split(',') if genres else None
+    exclude_list = exclude_genres.split(',') if exclude_genres else None
+    return genre_index.facets(genre_list, match, exclude_list)
 
 @router.get("/{anime_id}", response_model=AnimeBase)
 async def get_anime_by_id(
+    request: Request,
     anime_id: int,
 ) -> Any:
     """
@@ -159,7 +304,9 @@ async def get_anime_by_id(
                 status_code=404,
                 detail=f"Anime with ID {anime_id} not found"
             )
-        return anime
+        return cached_response(request, render_anime(anime), settings.ANIME_CACHE_TTL)
+    except (HTTPException, AniListUnavailable, RateLimitExceeded):
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -1,10 +1,12 @@
 from fastapi import APIRouter
 
-from app.api import auth, anime, user
+from app.api import auth, anime, community, reviews, user
 
 # Create a public router for unauthenticated endpoints
 public_router = APIRouter()
 public_router.include_router(anime.router, prefix="/anime", tags=["anime"])
+public_router.include_router(reviews.router, prefix="/reviews", tags=["reviews"])
+public_router.include_router(community.router, prefix="/community", tags=["community"])
 
 # Create a protected router for authenticated endpoints
 api_router = APIRouter()
@@ -11,6 +11,7 @@ from app.db.session import get_db
 from app.models.user import User
 from app.schemas.token import Token
 from app.schemas.user import UserCreate, User as UserSchema, LoginCredentials
+from app.services.user_versions import user_versions
 
 router = APIRouter()
 
@@ -46,6 +47,9 @@ def register_user(
         hashed_password=hashed_password
     )
     db.add(user)
+    db.flush()
+    # Reads right after signup must not go to a replica that lacks the user
+    user_versions.touch(db, user.id)
     db.commit()
     db.refresh(user)
     return user
@@ -0,0 +1,45 @@
+from typing import Any, List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.auth.deps import get_public_read_db
+from app.core.config import settings
+from app.models.aggregates import AnimeCommunityStats
+from app.schemas.anime import CommunityStats
+from app.services.catalog import catalog_store
+from app.services.community import LEADERBOARDS, leaderboard
+
+router = APIRouter()
+
+def _with_anime(stats: AnimeCommunityStats) -> CommunityStats:
+    entry = CommunityStats.model_validate(stats, from_attributes=True)
+    entry.anime = catalog_store.get(stats.anime_id)
+    return entry
+
+@router.get("/leaderboard", response_model=List[CommunityStats])
+def get_leaderboard(
+    by: str = "members",
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_public_read_db),
+) -> Any:
+    """
+    Anime ranked by our users' lists: `members`, `favorites`, `watching`,
+    `completed` or mean `rating` (among titles rated `COMMUNITY_MIN_RATINGS` times).
+    """
+    if by not in LEADERBOARDS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(LEADERBOARDS)}")
+    return [_with_anime(stats) for stats in leaderboard(db, by, limit, settings.COMMUNITY_MIN_RATINGS)]
+
+@router.get("/stats/{anime_id}", response_model=CommunityStats)
+def get_community_stats(
+    anime_id: int,
+    db: Session = Depends(get_public_read_db),
+) -> Any:
+    """
+    How many of our users have an anime on their lists, by status, and how they rate it.
+    """
+    stats = db.get(AnimeCommunityStats, anime_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No community stats for anime {anime_id}")
+    return _with_anime(stats)
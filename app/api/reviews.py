@@ -0,0 +1,42 @@
+from typing import Any, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.auth.deps import get_active_user_id, get_public_read_db, get_read_db
+from app.schemas.user import ReviewSearchPage, ReviewStats
+from app.services.reviews import review_stats, search_reviews
+
+router = APIRouter()
+
+@router.get("/search", response_model=ReviewSearchPage)
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    anime_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    user_id: int = Depends(get_active_user_id),
+) -> Any:
+    """
+    Full-text search over the titles and content of your reviews, best matches first.
+
+    `q` takes web search syntax: quoted phrases, `or` and `-excluded` words.
+    Pass the returned `next_cursor` as `cursor` for the next page. Snippets
+    are HTML-escaped, with the matching terms in `<b></b>`.
+    """
+    try:
+        results, next_cursor = search_reviews(db, q, user_id, anime_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": results, "next_cursor": next_cursor}
+
+@router.get("/stats/{anime_id}", response_model=ReviewStats)
+def get_review_stats(
+    anime_id: int,
+    db: Session = Depends(get_public_read_db),
+) -> Any:
+    """
+    Review count and mean rating of an anime.
+    """
+    return review_stats(db, anime_id)
@@ -1,13 +1,30 @@
-from typing import Any, List, Optional
+from typing import Any, Iterator, List, Optional
+import json
+import os
+import shutil
+import tempfile
+import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, Body, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
-from app.auth.deps import get_current_user
+from app.auth.deps import get_active_user_id, get_current_read_user, get_current_user, get_read_db
+from app.core.config import settings
+from app.core.responses import user_data_response
 from app.db.session import get_db
+from app.models.job import Job
 from app.models.user import User, WatchedAnime as WatchedAnimeModel, Genre, Review
-from app.schemas.anime import GenrePreference, WatchedAnime, WatchedAnimeCreate
+from app.schemas.anime import (
+    GenrePreference,
+    WatchedAnime,
+    WatchedAnimeCreate,
+    WatchedAnimeBatch,
+    WatchedAnimeBatchResult
+)
 from app.schemas.user import (
     User as UserSchema,
     UserUpdate,
@@ -15,13 +32,28 @@ from app.schemas.user import (
     ReviewCreate,
     ReviewResponse
 )
+from app.services.airing import airing_tracker
 from app.services.anilist import anilist_service
+from app.services.broadcast import SSE_HEADERS
+from app.services.exporter import EXPORT_KINDS, FORMATS as EXPORT_FORMATS, iter_user_rows, to_csv, to_ndjson
+from app.services.importer import FORMATS, SCORE_SCALES, ImportJob, import_jobs, run_import
+from app.services.jobs import enqueue
+from app.services.reviews import record_review
+from app.services.user_versions import user_versions
+from app.services.watched import find_existing_anime, upsert_watched_anime
 
 router = APIRouter()
 
+_watched_list = TypeAdapter(List[WatchedAnime])
+_genre_names = TypeAdapter(List[str])
+_stats = TypeAdapter(UserStats)
+
+def _watched_json(rows) -> bytes:
+    return _watched_list.dump_json(_watched_list.validate_python(rows, from_attributes=True))
+
 @router.get("/me", response_model=UserSchema)
 def get_current_user_info(
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_read_user),
 ) -> Any:
     """
     Get current user info.
@@ -30,13 +62,18 @@ def get_current_user_info(
 
 @router.get("/preferences", response_model=List[str])
 def get_user_preferences(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    user_id: int = Depends(get_active_user_id),
 ) -> Any:
     """
     Get user's favorite genres.
     """
-    return [genre.name for genre in current_user.favorite_genres]
+    def build() -> bytes:
+        names = db.query(Genre.name).join(Genre.users).filter(User.id == user_id).all()
+        return _genre_names.dump_json([name for name, in names])
+
+    return user_data_response(request, user_id, "preferences", build)
 
 @router.post("/preferences")
 def update_user_preferences(
@@ -49,6 +86,7 @@ def update_user_preferences(
     """
     # Clear current preferences
     current_user.favorite_genres = []
+    user_versions.touch(db, current_user.id)
     db.commit()
     
     # Add new preferences
@@ -64,18 +102,23 @@ def update_user_preferences(
         # Add to user's favorites
         current_user.favorite_genres.append(genre)
     
+    user_versions.touch(db, current_user.id)
     db.commit()
     return {"status": "success", "message": "Preferences updated successfully"}
 
 @router.get("/watched", response_model=List[WatchedAnime])
 def get_watched_anime(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    user_id: int = Depends(get_active_user_id),
 ) -> Any:
     """
     Get user's watched anime list.
     """
-    return current_user.watched_anime
+    def build() -> bytes:
+        return _watched_json(db.query(WatchedAnimeModel).filter(WatchedAnimeModel.user_id == user_id).all())
+
+    return user_data_response(request, user_id, "watched", build)
 
 @router.post("/watched", response_model=WatchedAnime)
 async def add_watched_anime(
@@ -101,6 +144,7 @@ async def add_watched_anime(
         # Update existing record
         for key, value in anime.dict().items():
             setattr(existing, key, value)
+        user_versions.touch(db, current_user.id)
         db.commit()
         db.refresh(existing)
         return existing
@@ -111,35 +155,241 @@ async def add_watched_anime(
         **anime.dict()
     )
     db.add(watched_anime)
+    user_versions.touch(db, current_user.id)
     db.commit()
     db.refresh(watched_anime)
     return watched_anime
 
-@router.get("/watchlist", response_model=List[WatchedAnime])
-def get_watchlist(
+@router.post("/watched/batch", response_model=List[WatchedAnimeBatchResult])
+async def add_watched_anime_batch(
+    batch: WatchedAnimeBatch,
+    stream: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> Any:
+    """
+    Add or update many anime in user's watched list at once.
+
+    IDs are validated with bulk lookups and rows are written with one upsert
+    per chunk. Large batches (or `stream=true`) stream NDJSON: one line per
+    item plus a progress line after each committed chunk.
+    """
+    # Later entries for the same anime win
+    items = list({item.anime_id: item for item in batch.items}.values())
+    existing = await find_existing_anime(item.anime_id for item in items)
+    rows = [item.dict() for item in items if item.anime_id in existing]
+    not_found = [
+        {"anime_id": item.anime_id, "id": None, "result": "not_found"}
+        for item in items if item.anime_id not in existing
+    ]
+    user_id = current_user.id
+    chunk_size = settings.WATCHED_BATCH_CHUNK_SIZE
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+
+    if stream or len(items) > settings.WATCHED_BATCH_STREAM_THRESHOLD:
+        def progress() -> Iterator[str]:
+            for result in not_found:
+                yield json.dumps(result) + "\n"
+            processed = len(not_found)
+            for chunk in chunks:
+                results = upsert_watched_anime(db, user_id, chunk)
+                user_versions.touch(db, user_id)
+                db.commit()
+                processed += len(chunk)
+                for result in results:
+                    yield json.dumps(result) + "\n"
+                yield json.dumps({"progress": {"processed": processed, "total": len(items)}}) + "\n"
+
+        return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+    def write_all() -> List[dict]:
+        results = []
+        for chunk in chunks:
+            results.extend(upsert_watched_anime(db, user_id, chunk))
+        user_versions.touch(db, user_id)
+        db.commit()
+        return results
+
+    return await run_in_threadpool(write_all) + not_found
+
+@router.post("/import", status_code=202)
+async def import_watched_list(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    source: str = Form("auto"),
+    score_format: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> Any:
+    """
+    Import a MyAnimeList XML or AniList JSON export (optionally gzipped).
+
+    The import runs in the background, on a worker when `IMPORT_USE_JOB_QUEUE`
+    is set; poll `GET /user/import/{job_id}` for progress. Without the queue,
+    progress is kept by the web process that took the upload, so polls need
+    sticky routing to it.
+    """
+    if source not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(FORMATS)}")
+    if score_format is not None and score_format not in SCORE_SCALES:
+        raise HTTPException(status_code=400, detail=f"score_format must be one of {', '.join(SCORE_SCALES)}")
+
+    # The upload is closed once the response is sent, so spool it to our own file
+    def spool():
+        if settings.IMPORT_USE_JOB_QUEUE:
+            # Workers read it from the shared spool directory
+            os.makedirs(settings.IMPORT_SPOOL_DIR, exist_ok=True)
+            spooled = open(os.path.join(settings.IMPORT_SPOOL_DIR, f"{uuid.uuid4().hex}.upload"), "w+b")
+        else:
+            spooled = tempfile.TemporaryFile()
+        shutil.copyfileobj(file.file, spooled, 1024 * 1024)
+        spooled.seek(0)
+        return spooled
+
+    spooled = await run_in_threadpool(spool)
+    spooled.seek(0, 2)
+    if spooled.tell() > settings.IMPORT_MAX_UPLOAD_BYTES:
+        spooled.close()
+        if settings.IMPORT_USE_JOB_QUEUE:
+            os.remove(spooled.name)
+        raise HTTPException(status_code=413, detail="Export file is too large")
+    spooled.seek(0)
+
+    job = ImportJob(current_user.id, source)
+    if settings.IMPORT_USE_JOB_QUEUE:
+        spooled.close()
+        job.id = str(enqueue(db, "import_list", {
+            "user_id": current_user.id,
+            "path": spooled.name,
+            "source": source,
+            "score_format": score_format,
+            "batch_size": settings.IMPORT_BATCH_SIZE,
+        }))
+        db.commit()
+        return job.as_dict()
+    import_jobs.set(job.id, job)
+    background_tasks.add_task(
+        run_import, job, spooled, source, settings.IMPORT_BATCH_SIZE, score_format
+    )
+    return job.as_dict()
+
+@router.get("/import/{job_id}")
+def get_import_status(
+    job_id: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
+) -> Any:
+    """
+    Get progress of a list import.
+    """
+    if job_id.isdigit():
+        return _queued_import_status(db, int(job_id), current_user.id)
+    job = import_jobs.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.as_dict()
+
+def _queued_import_status(db: Session, job_id: int, user_id: int) -> dict:
+    """Progress of an import run on the job queue, in the same shape as in-process ones."""
+    row = db.query(Job).filter(Job.id == job_id, Job.kind == "import_list").first()
+    if row is None or row.payload.get("user_id") != user_id:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    job = ImportJob(user_id, row.payload.get("source", "auto"))
+    job.id = str(row.id)
+    status = dict(job.as_dict(), **(row.result or row.progress or {}))
+    if row.status == "queued":
+        # Waiting for a worker, or for a retry after a failed attempt
+        status["status"] = "pending"
+    elif row.status == "failed":
+        status.update(status="failed", error=row.last_error)
+    return status
+
+@router.get("/export")
+def export_user_data(
+    format: str = "ndjson",
+    include: str = "watched,reviews",
+    metadata: bool = False,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_read_user),
+) -> Any:
+    """
+    Stream the user's watched list and reviews as NDJSON or CSV.
+
+    `include` is a comma-separated subset of `watched,reviews`; `metadata=true`
+    adds genres, score and popularity from the local catalog.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    kinds = [kind.strip() for kind in include.split(",") if kind.strip()]
+    if not kinds or any(kind not in EXPORT_KINDS for kind in kinds):
+        raise HTTPException(status_code=400, detail=f"include must be a subset of {', '.join(EXPORT_KINDS)}")
+
+    partitions = iter_user_rows(db, current_user.id, kinds, with_metadata=metadata)
+    body = to_ndjson(partitions) if format == "ndjson" else to_csv(partitions, with_metadata=metadata)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="anime-export.{format}"'},
+    )
+
+@router.get("/airing/stream")
+async def stream_airing(
+    user_id: int = Depends(get_active_user_id),
+) -> Any:
+    """
+    Server-sent events for new episodes of the anime on the user's watching list.
+
+    Starts with an `upcoming` event listing episodes already scheduled, then
+    sends `scheduled` when an episode is added to the schedule and `episode`
+    when it airs. A client that falls too far behind gets `evicted` and the
+    stream ends.
+    """
+    if not airing_tracker.running:
+        raise HTTPException(status_code=503, detail="Airing notifications are disabled")
+    subscriber, upcoming = await airing_tracker.subscribe(user_id)
+
+    async def events():
+        try:
+            async for message in subscriber.stream(settings.SSE_KEEPALIVE_SECONDS, upcoming):
+                yield message
+        finally:
+            airing_tracker.unsubscribe(user_id, subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/watchlist", response_model=List[WatchedAnime])
+def get_watchlist(
+    request: Request,
+    db: Session = Depends(get_read_db),
+    user_id: int = Depends(get_active_user_id),
 ) -> Any:
     """
     Get user's watchlist (anime marked as plan to watch).
     """
-    return db.query(WatchedAnimeModel).filter(
-        WatchedAnimeModel.user_id == current_user.id,
-        WatchedAnimeModel.status == 'plan_to_watch'
-    ).all()
+    def build() -> bytes:
+        return _watched_json(db.query(WatchedAnimeModel).filter(
+            WatchedAnimeModel.user_id == user_id,
+            WatchedAnimeModel.status == 'plan_to_watch'
+        ).all())
+
+    return user_data_response(request, user_id, "watchlist", build)
 
 @router.get("/favorites", response_model=List[WatchedAnime])
 def get_favorites(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    user_id: int = Depends(get_active_user_id),
 ) -> Any:
     """
     Get user's favorite anime.
     """
-    return db.query(WatchedAnimeModel).filter(
-        WatchedAnimeModel.user_id == current_user.id,
-        WatchedAnimeModel.rating >= 8
-    ).all()
+    def build() -> bytes:
+        return _watched_json(db.query(WatchedAnimeModel).filter(
+            WatchedAnimeModel.user_id == user_id,
+            WatchedAnimeModel.rating >= 8
+        ).all())
+
+    return user_data_response(request, user_id, "favorites", build)
 
 @router.post("/favorites/{anime_id}")
 async def toggle_favorite(
@@ -159,20 +409,21 @@ async def toggle_favorite(
         raise HTTPException(status_code=404, detail="Anime not found in user's list")
     
     anime.rating = 10 if anime.rating < 8 else None
+    user_versions.touch(db, current_user.id)
     db.commit()
     db.refresh(anime)
     return anime
 
 @router.get("/reviews", response_model=List[ReviewResponse])
 def get_user_reviews(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    user_id: int = Depends(get_active_user_id),
 ) -> Any:
     """
     Get user's anime reviews.
     """
     return db.query(Review).filter(
-        Review.user_id == current_user.id
+        Review.user_id == user_id
     ).all()
 
 @router.post("/reviews", response_model=ReviewResponse)
@@ -201,8 +452,11 @@ async def add_review(
     
     if existing:
         # Update existing review
+        old_rating = existing.rating
         for key, value in review.dict().items():
             setattr(existing, key, value)
+        record_review(db, existing.anime_id, old_rating, existing.rating, created=False)
+        user_versions.touch(db, current_user.id)
         db.commit()
         db.refresh(existing)
         return existing
@@ -213,29 +467,35 @@ async def add_review(
         **review.dict()
     )
     db.add(new_review)
+    record_review(db, new_review.anime_id, None, new_review.rating, created=True)
+    user_versions.touch(db, current_user.id)
     db.commit()
     db.refresh(new_review)
     return new_review
 
 @router.get("/stats", response_model=UserStats)
 def get_user_stats(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    db: Session = Depends(get_read_db),
+    user_id: int = Depends(get_active_user_id),
 ) -> Any:
     """
     Get user's anime watching statistics.
     """
+    return user_data_response(request, user_id, "stats", lambda: _stats.dump_json(_stats.validate_python(_user_stats(db, user_id))))
+
+def _user_stats(db: Session, user_id: int) -> dict:
     total_watched = db.query(func.count(WatchedAnimeModel.id)).filter(
-        WatchedAnimeModel.user_id == current_user.id,
+        WatchedAnimeModel.user_id == user_id,
         WatchedAnimeModel.status == 'completed'
     ).scalar()
     
     total_episodes = db.query(func.sum(WatchedAnimeModel.episodes_watched)).filter(
-        WatchedAnimeModel.user_id == current_user.id
+        WatchedAnimeModel.user_id == user_id
     ).scalar() or 0
     
     avg_rating = db.query(func.avg(WatchedAnimeModel.rating)).filter(
-        WatchedAnimeModel.user_id == current_user.id,
+        WatchedAnimeModel.user_id == user_id,
         WatchedAnimeModel.rating.isnot(None)
     ).scalar() or 0
     
@@ -247,7 +507,7 @@ def get_user_stats(
         WatchedAnimeModel,
         WatchedAnimeModel.anime_id.in_(
             db.query(WatchedAnimeModel.anime_id).filter(
-                WatchedAnimeModel.user_id == current_user.id
+                WatchedAnimeModel.user_id == user_id
             )
         )
     ).group_by(Genre.name).all()
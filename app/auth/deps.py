@@ -4,15 +4,17 @@ from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.db.session import get_db
+from app.db.session import get_db, read_session
 from app.models.user import User
 from app.schemas.token import TokenPayload
+from app.services.user_versions import user_versions
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> User:
+def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    """
+    The user ID from a valid access token, without loading the user.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -27,10 +29,80 @@ def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.id == token_data.sub).first()
+    return token_data.sub
+
+def get_active_user_id(user_id: int = Depends(get_current_user_id)) -> int:
+    """
+    The current user's ID, checking the user still exists and is active.
+
+    The check is cached per data version, so polling a cached read endpoint
+    doesn't load the user each time.
+    """
+    key = (user_id, user_versions.get(user_id))
+    entry = user_versions.active.get_entry(key)
+    if entry is not None and entry[1]:
+        active = entry[0]
+    else:
+        db = read_session(key[1] / 1000)
+        try:
+            # None for a deleted user
+            active = db.query(User.is_active).filter(User.id == user_id).scalar()
+        finally:
+            db.close()
+        user_versions.active.set(key, active)
+    if active is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return user_id
+
+def get_read_db(user_id: int = Depends(get_current_user_id)):
+    """
+    Session for a user's read-only endpoint: a read replica that already has
+    the user's own writes, or the primary.
+    """
+    db = read_session(user_versions.get(user_id) / 1000)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_public_read_db():
+    """
+    Session for a read-only endpoint that serves no user's own data: any
+    usable read replica, or the primary.
+    """
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _load_user(db: Session, user_id: int) -> User:
+    user = db.query(User).filter(User.id == user_id).first()
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return user
+
+def get_current_user(
+    db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)
+) -> User:
+    return _load_user(db, user_id)
+
+def get_current_read_user(
+    db: Session = Depends(get_read_db), user_id: int = Depends(get_current_user_id)
+) -> User:
+    """
+    The current user loaded through ``get_read_db``; for endpoints that don't write.
+    """
+    return _load_user(db, user_id)
@@ -0,0 +1,208 @@
+"""Command line entry points for maintenance tasks.
+
+Run with ``python -m app.cli <command>``.
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from app.core.config import settings
+
+
+async def _sync_catalog(args: argparse.Namespace) -> None:
+    from app.services.anilist import anilist_service
+    from app.services.catalog import sync_catalog
+
+    try:
+        count = await sync_catalog(anilist_service, args.path, per_page=args.per_page, max_pages=args.max_pages)
+        print(f"Synced {count} titles to {args.path}")
+    finally:
+        await anilist_service.close()
+
+
+async def _sync_rec_graph(args: argparse.Namespace) -> None:
+    from app.services.anilist import anilist_service
+    from app.services.rec_graph import sync_rec_graph
+
+    try:
+        nodes, edges = await sync_rec_graph(anilist_service, args.path, per_page=args.per_page, max_pages=args.max_pages)
+        print(f"Synced {edges} recommendation edges between {nodes} titles to {args.path}")
+    finally:
+        await anilist_service.close()
+
+
+async def _import_list(args: argparse.Namespace) -> None:
+    from app.services.anilist import anilist_service
+    from app.services.importer import ImportJob, run_import
+
+    job = ImportJob(args.user_id, args.source)
+    try:
+        await run_import(job, open(args.file, "rb"), args.source, args.batch_size, args.score_format)
+    finally:
+        await anilist_service.close()
+    print(f"Import {job.status}: {job.processed} processed, {job.imported} imported, {job.skipped} skipped")
+    if job.error:
+        raise SystemExit(job.error)
+
+
+async def _worker(args: argparse.Namespace) -> None:
+    import signal
+
+    import app.models  # noqa: F401  (registers the tables)
+    from app.db.session import Base, engine
+    from app.services.anilist import anilist_service
+    from app.services.jobs import JobWorker
+    from app.services.watched import ensure_watched_unique
+
+    # Workers may come up before the web app has created the tables
+    Base.metadata.create_all(bind=engine)
+    # Imports upsert on the constraint
+    ensure_watched_unique(engine)
+    worker = JobWorker(
+        concurrency=args.concurrency,
+        kinds=args.kind,
+        poll_interval=args.poll_interval,
+        visibility_timeout=settings.JOB_VISIBILITY_TIMEOUT,
+    )
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        # Finish the jobs in hand, then exit
+        loop.add_signal_handler(signum, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await anilist_service.close()
+    print(f"Worker stopped after {worker.processed} jobs")
+
+
+async def _enqueue(args: argparse.Namespace) -> None:
+    from app.db.session import SessionLocal
+    from app.services.jobs import enqueue
+
+    db = SessionLocal()
+    try:
+        job_id = enqueue(
+            db, args.kind, json.loads(args.payload), priority=args.priority, dedup_key=args.dedup_key, delay=args.delay
+        )
+        db.commit()
+    finally:
+        db.close()
+    print(f"Queued job {job_id}")
+
+
+async def _rebuild_review_stats(args: argparse.Namespace) -> None:
+    import app.models  # noqa: F401  (registers the tables)
+    from app.db.session import Base, SessionLocal, engine
+    from app.services.reviews import ensure_search_column, rebuild_review_stats
+
+    Base.metadata.create_all(bind=engine)
+    ensure_search_column(engine)
+    db = SessionLocal()
+    try:
+        count = rebuild_review_stats(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Rebuilt review stats for {count} anime")
+
+
+async def _refresh_community_stats(args: argparse.Namespace) -> None:
+    import app.models  # noqa: F401  (registers the tables)
+    from app.db.session import Base, SessionLocal, engine
+    from app.services.community import ensure_activity_index, refresh_community_stats
+
+    Base.metadata.create_all(bind=engine)
+    ensure_activity_index(engine)
+    db = SessionLocal()
+    try:
+        count = refresh_community_stats(db, full=args.full, overlap=settings.COMMUNITY_STATS_OVERLAP)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Refreshed community stats for {count} anime")
+
+
+async def _dedupe_watched(args: argparse.Namespace) -> None:
+    from app.db.session import engine
+    from app.services.watched import dedupe_watched_anime
+
+    duplicates = dedupe_watched_anime(engine, apply=args.apply)
+    for row in duplicates:
+        print(
+            f"user {row['user_id']} anime {row['anime_id']}: row {row['id']} "
+            f"(status {row['status']}, rating {row['rating']}, updated {row['updated_at']}) "
+            f"duplicates row {row['kept_id']}"
+        )
+    if args.apply:
+        print(f"Deleted {len(duplicates)} duplicate rows and added the unique constraint")
+    else:
+        print(f"{len(duplicates)} duplicate rows would be deleted; rerun with --apply to delete them")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug logging")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync = subparsers.add_parser("sync-catalog", help="Harvest the AniList catalog into the local store")
+    sync.add_argument("--path", default=settings.CATALOG_PATH)
+    sync.add_argument("--per-page", type=int, default=50)
+    sync.add_argument("--max-pages", type=int, default=None)
+    sync.set_defaults(handler=_sync_catalog)
+
+    graph = subparsers.add_parser("sync-rec-graph", help="Harvest AniList recommendation edges into the local graph")
+    graph.add_argument("--path", default=settings.REC_GRAPH_PATH)
+    graph.add_argument("--per-page", type=int, default=50)
+    graph.add_argument("--max-pages", type=int, default=None)
+    graph.set_defaults(handler=_sync_rec_graph)
+
+    importer = subparsers.add_parser("import-list", help="Import a MyAnimeList or AniList export for a user")
+    importer.add_argument("file")
+    importer.add_argument("--user-id", type=int, required=True)
+    importer.add_argument("--source", choices=["auto", "mal", "anilist"], default="auto")
+    importer.add_argument("--score-format", default=None, help="AniList score format, e.g. POINT_100")
+    importer.add_argument("--batch-size", type=int, default=settings.IMPORT_BATCH_SIZE)
+    importer.set_defaults(handler=_import_list)
+
+    worker = subparsers.add_parser("worker", help="Run background jobs from the job queue")
+    worker.add_argument("--concurrency", type=int, default=4, help="Jobs run at once by this process")
+    worker.add_argument("--kind", action="append", default=None, help="Only run jobs of this kind (repeatable)")
+    worker.add_argument("--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL)
+    worker.set_defaults(handler=_worker)
+
+    enqueuer = subparsers.add_parser("enqueue", help="Queue a background job, e.g. sync_catalog")
+    enqueuer.add_argument("kind")
+    enqueuer.add_argument("--payload", default="{}", help="JSON object passed to the handler")
+    enqueuer.add_argument("--priority", type=int, default=0)
+    enqueuer.add_argument("--dedup-key", default=None, help="Skip if a queued or running job has this key")
+    enqueuer.add_argument("--delay", type=float, default=0, help="Seconds before the job may run")
+    enqueuer.set_defaults(handler=_enqueue)
+
+    reviews = subparsers.add_parser(
+        "rebuild-review-stats", help="Recompute per-anime review stats, e.g. after upgrading or a bulk load"
+    )
+    reviews.set_defaults(handler=_rebuild_review_stats)
+
+    community = subparsers.add_parser(
+        "refresh-community-stats", help="Recount community stats for anime whose lists changed since the last refresh"
+    )
+    community.add_argument("--full", action="store_true", help="Recount every anime")
+    community.set_defaults(handler=_refresh_community_stats)
+
+    dedupe = subparsers.add_parser(
+        "dedupe-watched",
+        help="List duplicate watched_anime rows that block its unique constraint; --apply deletes them",
+    )
+    dedupe.add_argument(
+        "--apply", action="store_true", help="Delete all but the most recently updated row of each and add the constraint"
+    )
+    dedupe.set_defaults(handler=_dedupe_watched)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,12 @@ class Settings(BaseSettings):
     
     DATABASE_URL: Optional[str] = None
     SQLALCHEMY_DATABASE_URI: Optional[PostgresDsn] = None
+    # Comma-separated read replica URLs for read-only endpoints. A replica serves a user's reads
+    # once it has replayed their last write, and is skipped while it lags more than
+    # READ_REPLICA_MAX_LAG seconds or fails the health check run every READ_REPLICA_CHECK_INTERVAL
+    DATABASE_REPLICA_URLS: Optional[str] = None
+    READ_REPLICA_CHECK_INTERVAL: float = 1.0
+    READ_REPLICA_MAX_LAG: float = 10.0
 
     @model_validator(mode='after') 
     def assemble_db_connection(self) -> 'Settings':
@@ -37,6 +43,130 @@ class Settings(BaseSettings):
     # AniList API
     ANILIST_API_URL: str = "https://graphql.anilist.co"
 
+    # Cache TTLs (seconds) for AniList data
+    ANIME_CACHE_TTL: int = 60 * 60
+    LIST_CACHE_TTL: int = 60 * 10
+    GENRE_CACHE_TTL: int = 60 * 60 * 24
+    # How long past its TTL cached data may still be served while AniList is refreshed or down
+    ANILIST_STALE_TTL: int = 60 * 60 * 24
+
+    # Bulk watched-list writes: rows per INSERT statement, and batch size above which progress is streamed
+    WATCHED_BATCH_CHUNK_SIZE: int = 500
+    WATCHED_BATCH_STREAM_THRESHOLD: int = 2000
+    # List imports: entries parsed and written per transaction, and the upload size cap
+    IMPORT_BATCH_SIZE: int = 500
+    IMPORT_MAX_UPLOAD_BYTES: int = 50 * 1024 * 1024
+    # Run imports on the job queue instead of in the web process; uploads are saved to
+    # IMPORT_SPOOL_DIR, which must be shared with the workers
+    IMPORT_USE_JOB_QUEUE: bool = False
+    IMPORT_SPOOL_DIR: str = "data/imports"
+    # How long a finished in-process import stays pollable. In-process progress is kept per
+    # web process, so without the job queue polling needs sticky routing
+    IMPORT_JOB_TTL: int = 60 * 60
+
+    # AniList resilience; AniList allows 90 requests per minute
+    ANILIST_RATE_LIMIT: int = 90
+    ANILIST_TIMEOUT: float = 10.0
+    ANILIST_BREAKER_FAILURE_RATE: float = 0.5
+    ANILIST_BREAKER_MIN_CALLS: int = 10
+    ANILIST_BREAKER_WINDOW: int = 60
+    ANILIST_BREAKER_OPEN_SECONDS: int = 30
+    # Queries issued within this window are sent as one aliased GraphQL document
+    ANILIST_BATCH_WINDOW_MS: float = 5.0
+    ANILIST_BATCH_MAX_COMPLEXITY: int = 250
+
+    # Public anime responses at least this large are gzip/brotli compressed
+    COMPRESSION_MIN_SIZE: int = 1024
+
+    # Directory holding the memory-mapped local catalog (see app.services.catalog)
+    CATALOG_PATH: str = "data/catalog"
+    # Directory holding the memory-mapped AniList recommendation graph (see app.services.rec_graph).
+    # Recommendations walk it with personalized PageRank, restarting at the user's titles with
+    # probability REC_GRAPH_RESTART per step, for at most REC_GRAPH_ITERATIONS steps
+    REC_GRAPH_PATH: str = "data/rec_graph"
+    REC_GRAPH_RESTART: float = 0.3
+    REC_GRAPH_ITERATIONS: int = 30
+    # Recommendation re-ranking (see app.services.ranking): weight of each scorer, the MMR
+    # trade-off between relevance (1.0) and genre diversity (0.0), and the years after which
+    # a title's freshness halves
+    RANK_WEIGHTS: Dict[str, float] = {
+        "retrieval": 0.3,
+        "genre_affinity": 0.3,
+        "score": 0.2,
+        "popularity": 0.1,
+        "freshness": 0.1,
+        "community": 0.1,
+    }
+    RANK_MMR_LAMBDA: float = 0.7
+    RANK_FRESHNESS_HALF_LIFE_YEARS: float = 3.0
+    # Community stats (see app.services.community): the refresh job and the in-memory copy
+    # recommendations read run every COMMUNITY_STATS_INTERVAL seconds (0 disables both), and each
+    # delta refresh rereads COMMUNITY_STATS_OVERLAP seconds of list changes for late commits.
+    # Ratings count towards the rating leaderboard and ranking after COMMUNITY_MIN_RATINGS of them
+    COMMUNITY_STATS_INTERVAL: int = 60 * 5
+    COMMUNITY_STATS_OVERLAP: int = 60 * 5
+    COMMUNITY_MIN_RATINGS: int = 5
+    # Local search results needed before /anime/search skips AniList
+    SEARCH_MIN_LOCAL_RESULTS: int = 5
+
+    # Inbound rate limits (requests/second and burst), per user ID or, when anonymous, per IP.
+    # Requests that miss the cache and query AniList also spend from the *_UPSTREAM_* budgets,
+    # and all anonymous clients together may use at most RATE_LIMIT_ANON_UPSTREAM_SHARE of ANILIST_RATE_LIMIT
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USER_RPS: float = 10.0
+    RATE_LIMIT_USER_BURST: float = 40.0
+    RATE_LIMIT_IP_RPS: float = 5.0
+    RATE_LIMIT_IP_BURST: float = 20.0
+    RATE_LIMIT_USER_UPSTREAM_RPS: float = 0.5
+    RATE_LIMIT_USER_UPSTREAM_BURST: float = 10.0
+    RATE_LIMIT_IP_UPSTREAM_RPS: float = 0.1
+    RATE_LIMIT_IP_UPSTREAM_BURST: float = 5.0
+    RATE_LIMIT_ANON_UPSTREAM_SHARE: float = 0.5
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    # Key anonymous clients by the first X-Forwarded-For address (only behind a trusted proxy)
+    RATE_LIMIT_TRUST_FORWARDED: bool = False
+
+    # Request profiling: requests carrying X-Profile-Token equal to PROFILE_TOKEN, plus a
+    # random PROFILE_SAMPLE_RATE fraction, are sampled and saved as folded stacks
+    PROFILE_TOKEN: Optional[str] = None
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL_MS: float = 1.0
+    PROFILE_DIR: str = "data/profiles"
+    # Log the event loop's stack when it is blocked for longer than this; 0 disables
+    LOOP_LAG_THRESHOLD_MS: float = 100.0
+    # Airing tracker: poll AniList's schedule for every title users are watching this often
+    # (0 disables), looking AIRING_HORIZON seconds ahead
+    AIRING_POLL_INTERVAL: int = 60 * 5
+    AIRING_HORIZON: int = 60 * 60 * 24
+    # Server-sent event streams: events buffered per client before it is dropped as too slow
+    SSE_CLIENT_BUFFER: int = 100
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    # Seconds between AniList refreshes of each /anime/trending/stream feed, and how many
+    # distinct feeds (genres and limit) may be live at once
+    TRENDING_STREAM_INTERVAL: int = 30
+    TRENDING_STREAM_MAX_FEEDS: int = 20
+    # Cache warming: every WARM_INTERVAL seconds, refresh the WARM_TOP_K most requested AniList
+    # keys that expire within WARM_LEAD seconds, but only while more than WARM_RESERVE of
+    # ANILIST_RATE_LIMIT is unused (0 disables). Request counts halve every WARM_HALF_LIFE seconds
+    WARM_TOP_K: int = 50
+    WARM_INTERVAL: int = 15
+    WARM_LEAD: int = 60
+    WARM_RESERVE: float = 0.5
+    WARM_HALF_LIFE: int = 60 * 10
+    WARM_MAX_KEYS: int = 10000
+    # Users' most common favorite genres to precompute for each AniList-only sort at startup
+    WARM_PRECOMPUTE_GENRES: int = 5
+    # Background job queue (``python -m app.cli worker``): failed attempts are retried up to
+    # JOB_MAX_ATTEMPTS times, backing off exponentially from JOB_RETRY_BASE_DELAY to
+    # JOB_RETRY_MAX_DELAY seconds. A running job whose worker stops renewing its lock for
+    # JOB_VISIBILITY_TIMEOUT seconds is handed to another worker
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_VISIBILITY_TIMEOUT: int = 60 * 5
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_DELAY: float = 10.0
+    JOB_RETRY_MAX_DELAY: float = 60 * 60
+    JOB_RETENTION_DAYS: int = 7
+
     class Config:
         # Allow environment variables to override settings
         env_file = ".env"
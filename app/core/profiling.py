@@ -0,0 +1,200 @@
+"""On-demand request profiling and event-loop stall detection.
+
+``ProfilingMiddleware`` samples the event loop thread's stack while a
+selected request is in flight, and writes the samples as collapsed stacks
+(the ``flamegraph.pl``/speedscope "folded" format) to ``PROFILE_DIR``. A
+request is selected by an ``X-Profile-Token`` header matching
+``PROFILE_TOKEN``, or at random at ``PROFILE_SAMPLE_RATE``.
+
+``LoopLagMonitor`` keeps a heartbeat coroutine on the loop and a watchdog
+thread; when the heartbeat is late by more than ``LOOP_LAG_THRESHOLD_MS``
+it logs the loop thread's current stack and the route of the task that is
+running. Unselected requests only pay for a dict insert and delete.
+"""
+from collections import Counter
+from typing import Any, Dict, Optional
+import asyncio
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Request scope of the task currently serving it, for tagging stalls with a route
+_task_scopes: Dict[asyncio.Task, Dict[str, Any]] = {}
+
+
+def route_of(scope: Optional[Dict[str, Any]]) -> str:
+    """``METHOD /path (endpoint)`` for a request scope, once routing has filled it in."""
+    if scope is None:
+        return "<no request>"
+    endpoint = scope.get("endpoint")
+    name = f" ({endpoint.__module__}.{endpoint.__qualname__})" if endpoint is not None else ""
+    return f"{scope.get('method', '')} {scope.get('path', '')}{name}"
+
+
+def _frame_key(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread and counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_key(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles selected requests and tracks which task serves which route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _selected(self, scope: Dict[str, Any]) -> bool:
+        if settings.PROFILE_TOKEN:
+            for name, value in scope.get("headers", ()):
+                if name == b"x-profile-token":
+                    # Constant time, so the token can't be guessed from response timings
+                    return hmac.compare_digest(value, settings.PROFILE_TOKEN.encode())
+        return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        _task_scopes[task] = scope
+        try:
+            if not self._selected(scope):
+                await self.app(scope, receive, send)
+                return
+            await self._profile(scope, receive, send)
+        finally:
+            _task_scopes.pop(task, None)
+
+    async def _profile(self, scope, receive, send):
+        profile_id = uuid.uuid4().hex
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            path = self._save(profile_id, scope, sampler)
+            logger.info(
+                f"Profiled {route_of(scope)} in {sampler.duration * 1000:.1f} ms "
+                f"({sum(sampler.samples.values())} samples) -> {path}"
+            )
+
+    def _save(self, profile_id: str, scope: Dict[str, Any], sampler: StackSampler) -> Optional[str]:
+        # The sampler sees the whole loop thread, so concurrent requests show up too
+        try:
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(settings.PROFILE_DIR, f"{profile_id}.folded")
+            with open(path, "w") as f:
+                f.write(f"# {route_of(scope)} {sampler.duration * 1000:.1f}ms\n")
+                f.write(sampler.folded())
+            return path
+        except OSError as e:
+            logger.error(f"Could not save profile {profile_id}: {str(e)}")
+            return None
+
+
+class LoopLagMonitor:
+    """Logs the loop's stack whenever a callback blocks it for longer than ``threshold`` seconds."""
+
+    def __init__(self, threshold: float = 0.1, interval: Optional[float] = None):
+        self.threshold = threshold
+        self.interval = interval or threshold / 2
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat = self._loop.create_task(self._run_heartbeat())
+        self._watchdog = threading.Thread(target=self._run_watchdog, name="loop-lag-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _run_watchdog(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            lag = time.monotonic() - beat - self.interval
+            # One report per stall, taken while the loop is still blocked
+            if lag < self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unavailable>\n"
+            task = asyncio.current_task(self._loop)
+            logger.warning(
+                f"Event loop blocked for {lag * 1000:.0f}+ ms in {route_of(_task_scopes.get(task))}:\n{stack}"
+            )
+
+
+loop_lag_monitor = LoopLagMonitor(settings.LOOP_LAG_THRESHOLD_MS / 1000)
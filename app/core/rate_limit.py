@@ -0,0 +1,175 @@
+"""Inbound admission control: token buckets per user (from the JWT) or per client IP.
+
+Every request spends a token from its key's request bucket. Requests that
+would have to query AniList (a cache miss) also spend from a separate
+upstream bucket, checked by ``AniListService`` through ``admit_upstream``,
+so cache hits stay cheap while misses are budgeted. Anonymous clients
+additionally share one upstream bucket sized to a fraction of our AniList
+quota, so scrapers rotating IPs can't use up the budget that logged-in
+users depend on. Exhausted budgets answer 429 with ``Retry-After``.
+"""
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+import math
+import time
+
+from jose import JWTError, jwt
+
+from app.core.config import settings
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float, cost: float = 1.0) -> float:
+        """Spend ``cost`` tokens; return 0 on success or the seconds until they'd be available."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / rate if rate > 0 else math.inf
+
+
+class KeyedLimiter:
+    """Token buckets by key, least recently used first, dropping idle keys.
+
+    A bucket that has been idle long enough to refill completely is
+    indistinguishable from a new one, so it can be evicted for free.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_after = burst / rate if rate > 0 else math.inf
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(self.rate, self.burst, now)
+
+    def _evict(self, now: float) -> None:
+        while self._buckets:
+            key, oldest = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - oldest.updated < self.idle_after:
+                break
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """Request and upstream budgets for users, anonymous IPs and all anonymous traffic."""
+
+    def __init__(self):
+        max_keys = settings.RATE_LIMIT_MAX_KEYS
+        self.requests = {
+            "user": KeyedLimiter(settings.RATE_LIMIT_USER_RPS, settings.RATE_LIMIT_USER_BURST, max_keys),
+            "ip": KeyedLimiter(settings.RATE_LIMIT_IP_RPS, settings.RATE_LIMIT_IP_BURST, max_keys),
+        }
+        self.upstream = {
+            "user": KeyedLimiter(settings.RATE_LIMIT_USER_UPSTREAM_RPS, settings.RATE_LIMIT_USER_UPSTREAM_BURST, max_keys),
+            "ip": KeyedLimiter(settings.RATE_LIMIT_IP_UPSTREAM_RPS, settings.RATE_LIMIT_IP_UPSTREAM_BURST, max_keys),
+        }
+        anonymous_rate = settings.ANILIST_RATE_LIMIT / 60 * settings.RATE_LIMIT_ANON_UPSTREAM_SHARE
+        self.anonymous_upstream = KeyedLimiter(anonymous_rate, max(1.0, anonymous_rate * 10), 1)
+        # Verified bearer token -> (user ID, expiry), so each token is only decoded once
+        self._subjects: Dict[str, Tuple[str, float]] = {}
+
+    def identify(self, headers: Dict[bytes, bytes], client: Optional[Tuple[str, int]]) -> Tuple[str, str]:
+        """Return (kind, key): the user ID from a valid bearer token, else the client IP."""
+        authorization = headers.get(b"authorization", b"")
+        if authorization[:7].lower() == b"bearer ":
+            token = authorization[7:].decode("latin-1")
+            subject, expires = self._subjects.get(token, ("", 0.0))
+            if expires <= time.time():
+                try:
+                    claims = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+                    subject, expires = str(claims.get("sub") or ""), float(claims.get("exp") or 0)
+                except JWTError:
+                    subject, expires = "", time.time() + 60
+                if len(self._subjects) >= 10000:
+                    self._subjects.clear()
+                self._subjects[token] = (subject, expires)
+            if subject:
+                return "user", subject
+        if settings.RATE_LIMIT_TRUST_FORWARDED and b"x-forwarded-for" in headers:
+            return "ip", headers[b"x-forwarded-for"].split(b",")[0].strip().decode("latin-1")
+        return "ip", client[0] if client else "unknown"
+
+    def admit_request(self, kind: str, key: str) -> float:
+        return self.requests[kind].take(key)
+
+    def admit_upstream(self, kind: str, key: str) -> float:
+        wait = self.upstream[kind].take(key)
+        if wait == 0 and kind == "ip":
+            wait = self.anonymous_upstream.take("*")
+        return wait
+
+
+admission = AdmissionController()
+
+# (kind, key) of the client the current request is admitted for; unset outside requests
+current_client: ContextVar[Optional[Tuple[str, str]]] = ContextVar("current_client", default=None)
+
+
+def admit_upstream() -> None:
+    """Charge the current client's upstream budget, raising RateLimitExceeded when it's spent."""
+    client = current_client.get()
+    if client is None or not settings.RATE_LIMIT_ENABLED:
+        return
+    wait = admission.admit_upstream(*client)
+    if wait:
+        raise RateLimitExceeded("Too many requests that need fresh AniList data", wait)
+
+
+class RateLimitMiddleware:
+    """ASGI middleware enforcing the request budget and tagging the request for upstream checks."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # CORS preflights are answered before they get here; don't spend budget on any that aren't
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        client = admission.identify(dict(scope.get("headers", ())), scope.get("client"))
+        wait = admission.admit_request(*client)
+        if wait:
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Too many requests"}'})
+            return
+
+        token = current_client.set(client)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client.reset(token)
@@ -0,0 +1,165 @@
+from typing import Any, Callable, Iterable, Optional
+import gzip
+import hashlib
+
+import orjson
+from fastapi import Request, Response
+
+from app.core.config import settings
+from app.schemas.anime import AnimeBase
+from app.services.anilist import served_stale
+from app.services.cache import TTLCache
+from app.services.user_versions import user_versions
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+STALE_HEADERS = {"X-Data-Freshness": "stale", "Warning": '110 - "Response is Stale"'}
+
+# Compressed bodies by (ETag, encoding); the ETag is a content hash, so entries never go stale
+compressed_bodies = TTLCache(max_size=2000, default_ttl=60 * 60)
+
+
+class RawJSONResponse(Response):
+    """JSON response that passes pre-serialized bytes through untouched.
+
+    Routes that return one of these bypass FastAPI's response_model
+    validation, so only use it for content that was already validated
+    (e.g. AnimeBase instances built by AniListService._parse_anime).
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content)
+
+
+_to_json = AnimeBase.__pydantic_serializer__.to_json
+
+
+def render_anime(anime: AnimeBase) -> bytes:
+    """Serialize an anime once and keep the bytes on the (cached) instance."""
+    # Go through __pydantic_private__ directly: BaseModel.__getattr__ for
+    # private attributes costs more than the whole join in render_anime_list.
+    private = anime.__pydantic_private__
+    data = private["_json"]
+    if data is None:
+        data = _to_json(anime)
+        private["_json"] = data
+    return data
+
+
+def render_anime_list(anime_list: Iterable[AnimeBase]) -> bytes:
+    """Join the per-anime JSON fragments into a JSON array."""
+    return b"[" + b",".join(render_anime(anime) for anime in anime_list) + b"]"
+
+
+def freshness_headers(headers: Optional[dict] = None) -> Optional[dict]:
+    """Mark the response as stale if any AniList data in it came from an expired cache entry."""
+    if not served_stale.get():
+        return headers
+    return {**STALE_HEADERS, **(headers or {})}
+
+
+def anime_response(anime: AnimeBase, status_code: int = 200, headers: Optional[dict] = None) -> RawJSONResponse:
+    return RawJSONResponse(render_anime(anime), status_code=status_code, headers=freshness_headers(headers))
+
+
+def anime_list_response(anime_list: Iterable[AnimeBase], status_code: int = 200, headers: Optional[dict] = None) -> RawJSONResponse:
+    return RawJSONResponse(render_anime_list(anime_list), status_code=status_code, headers=freshness_headers(headers))
+
+
+def content_etag(body: bytes) -> str:
+    # Weak, since the same ETag is shared by the gzip, brotli and identity encodings
+    return 'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:]
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str, etag: str) -> bytes:
+    key = (etag, encoding)
+    data = compressed_bodies.get(key)
+    if data is None:
+        if encoding == "br":
+            data = brotli.compress(body, quality=5)
+        else:
+            data = gzip.compress(body, compresslevel=6, mtime=0)
+        compressed_bodies.set(key, data)
+    return data
+
+
+def cached_response(request: Request, body: bytes, max_age: int, headers: Optional[dict] = None) -> Response:
+    """JSON response with a content-hash ETag, Cache-Control and compression.
+
+    ``If-None-Match`` hits answer 304 without a body. ``max_age`` is the
+    TTL of the data behind the response; stale data is sent with
+    ``max-age=0`` so clients revalidate once we have refreshed it.
+    """
+    etag = content_etag(body)
+    max_age = 0 if served_stale.get() else max_age
+    headers = {
+        **(freshness_headers(headers) or {}),
+        "ETag": etag,
+        "Cache-Control": (
+            f"public, max-age={max_age}, stale-while-revalidate={settings.ANILIST_STALE_TTL}, "
+            f"stale-if-error={settings.ANILIST_STALE_TTL}"
+        ),
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if len(body) >= settings.COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding:
+            body = compress(body, encoding, etag)
+            headers["Content-Encoding"] = encoding
+    return RawJSONResponse(body, headers=headers)
+
+
+def user_data_response(request: Request, user_id: int, endpoint: str, build: Callable[[], bytes]) -> Response:
+    """Private JSON response for one of a user's lists, cached by the user's data version.
+
+    ``build`` queries and serializes the data; it only runs when nothing
+    is cached for the current version, and a matching ``If-None-Match``
+    answers 304 before even that lookup.
+    """
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    etag = user_versions.etag(user_id, endpoint, user_versions.get(user_id))
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    etag, body = user_versions.snapshot(user_id, endpoint, build)
+    return RawJSONResponse(body, headers={**headers, "ETag": etag})
@@ -0,0 +1,135 @@
+"""Routing of read-only sessions to Postgres read replicas.
+
+A checker thread samples the primary's WAL position every
+``READ_REPLICA_CHECK_INTERVAL`` seconds and compares each replica's replay
+position against the recent samples: a replica that has replayed past the
+position sampled at time ``t`` holds every transaction committed before
+``t``. That time is the replica's ``synced_at``.
+
+``engine_for(written_at)`` picks round-robin among the replicas that
+passed their last health check, lag at most ``READ_REPLICA_MAX_LAG``
+seconds and are synced past ``written_at`` (plus a small margin), so a
+user who just wrote reads from the primary until a replica has caught up
+with their write. With no usable replica, reads go to the primary.
+"""
+from collections import deque
+from itertools import count
+from typing import Deque, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+logger = logging.getLogger(__name__)
+
+# Writers take their version timestamp just before committing
+# (see app.services.user_versions), and hosts' clocks differ slightly
+WRITE_MARGIN = 1.0
+
+
+def parse_lsn(lsn: str) -> int:
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_engine(url, pool_pre_ping=True)
+        self.healthy = False
+        self.synced_at = 0.0  # wall-clock time up to which it holds every commit
+        self.reads = 0
+
+    def replay_lsn(self) -> Optional[int]:
+        """Replayed WAL position, or None for a server that isn't replaying (not a standby, or not Postgres)."""
+        with self.engine.connect() as connection:
+            if self.engine.dialect.name != "postgresql":
+                connection.execute(text("SELECT 1"))
+                return None
+            lsn = connection.execute(text("SELECT pg_last_wal_replay_lsn()")).scalar()
+            return parse_lsn(lsn) if lsn else None
+
+
+class ReplicaRouter:
+    def __init__(self, primary, urls: List[str], check_interval: float = 1.0, max_lag: float = 10.0):
+        self.primary = primary
+        self.replicas = [Replica(url) for url in urls]
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.primary_reads = 0
+        # (time, primary WAL position) samples covering the allowed lag
+        self._samples: Deque[Tuple[float, int]] = deque(maxlen=int(max_lag / check_interval) + 2)
+        self._next = count()
+        self._checker: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def engine_for(self, written_at: float = 0.0):
+        """The next replica holding every commit before ``written_at`` (epoch seconds), or the primary."""
+        now = time.time()
+        not_before = max(written_at + WRITE_MARGIN, now - self.max_lag)
+        usable = [replica for replica in self.replicas if replica.healthy and replica.synced_at >= not_before]
+        if usable:
+            replica = usable[next(self._next) % len(usable)]
+            replica.reads += 1
+            return replica.engine
+        self.primary_reads += 1
+        return self.primary
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "primary_reads": self.primary_reads,
+            "replicas": [
+                {
+                    "url": replica.engine.url.render_as_string(hide_password=True),
+                    "healthy": replica.healthy,
+                    "lag": now - replica.synced_at if replica.synced_at else None,
+                    "reads": replica.reads,
+                }
+                for replica in self.replicas
+            ],
+        }
+
+    def start(self) -> None:
+        if not self.replicas or self._checker is not None:
+            return
+        self._stop.clear()
+        self._checker = threading.Thread(target=self._run, name="replica-checker", daemon=True)
+        self._checker.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._checker = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.check_interval)
+
+    def check(self) -> None:
+        """Sample the primary's WAL position and update each replica's health and sync time."""
+        sampled_at = time.time()
+        if self.primary.dialect.name == "postgresql":
+            try:
+                with self.primary.connect() as connection:
+                    lsn = connection.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+                self._samples.append((sampled_at, parse_lsn(lsn)))
+            except Exception as e:
+                logger.warning(f"Sampling the primary's WAL position failed: {str(e)}")
+        for replica in self.replicas:
+            try:
+                replayed = replica.replay_lsn()
+            except Exception as e:
+                if replica.healthy:
+                    logger.warning(f"Read replica {replica.engine.url.host} failed its health check: {str(e)}")
+                replica.healthy = False
+                continue
+            if replayed is None:
+                replica.synced_at = sampled_at
+            else:
+                synced = [at for at, lsn in self._samples if lsn <= replayed]
+                if synced:
+                    replica.synced_at = max(replica.synced_at, max(synced))
+            if not replica.healthy:
+                logger.info(f"Read replica {replica.engine.url.host} is healthy")
+            replica.healthy = True
@@ -1,12 +1,21 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
+from app.db.replicas import ReplicaRouter
 
 engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-only sessions go to replicas when DATABASE_REPLICA_URLS is set
+replica_router = ReplicaRouter(
+    engine,
+    [url.strip() for url in (settings.DATABASE_REPLICA_URLS or "").split(",") if url.strip()],
+    check_interval=settings.READ_REPLICA_CHECK_INTERVAL,
+    max_lag=settings.READ_REPLICA_MAX_LAG,
+)
+
 Base = declarative_base()
 
 # Dependency to get DB session
@@ -16,3 +25,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def read_session(written_at: float = 0.0) -> Session:
+    """A session for reads only, on a replica that has every commit before ``written_at`` if one is usable."""
+    return SessionLocal(bind=replica_router.engine_for(written_at))
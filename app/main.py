@@ -1,6 +1,8 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import math
 import time
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
@@ -8,9 +10,21 @@ from sqlalchemy.exc import OperationalError
 from app.api import api_router
 from app.api.api import public_router
 from app.core.config import settings
-from app.db.session import engine, Base, SessionLocal
+from app.core.profiling import ProfilingMiddleware, loop_lag_monitor
+from app.core.rate_limit import RateLimitExceeded, RateLimitMiddleware
+from app.db.session import engine, Base, SessionLocal, replica_router
 from app.auth.deps import get_current_user
-from app.services.anilist import anilist_service
+from app.services.airing import airing_tracker
+from app.services.anilist import AniListUnavailable, anilist_service
+from app.services.catalog import catalog_store
+from app.services.community import community_snapshot, ensure_activity_index
+from app.services.rec_graph import rec_graph
+from app.services.reviews import ensure_review_stats, ensure_search_column
+from app.services.search_index import search_index
+from app.services.trending import trending_streams
+from app.services.warmer import cache_warmer
+from app.services.watched import ensure_watched_unique
+from app.services.user_versions import user_versions
 
 def wait_for_db():
     """Wait for database to be ready."""
@@ -37,6 +51,10 @@ wait_for_db()
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+ensure_search_column(engine)
+ensure_review_stats(engine)
+ensure_activity_index(engine)
+ensure_watched_unique(engine)
 
 app = FastAPI(
     title="Anime Recommendation System",
@@ -44,6 +62,9 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# Added before CORS, so CORS wraps it and its 429s carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 # Set up CORS
 app.add_middleware(
     CORSMiddleware,
@@ -53,6 +74,28 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Outermost, so profiles and stall reports cover the whole request
+app.add_middleware(ProfilingMiddleware)
+
+@app.exception_handler(AniListUnavailable)
+async def anilist_unavailable_handler(request: Request, exc: AniListUnavailable):
+    """Report upstream outages as 503 instead of empty or not-found results."""
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after else None
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"AniList is currently unavailable: {exc}"},
+        headers=headers,
+    )
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """The client's budget for cache misses is spent; cached data is still served."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
 # Include API routers
 app.include_router(public_router, prefix=settings.API_V1_STR)  # Public endpoints first
 app.include_router(api_router, prefix=settings.API_V1_STR)     # Protected endpoints
@@ -69,6 +112,16 @@ async def root():
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/health/cache")
+async def cache_stats():
+    """AniList cache lookups and hit ratio, with and without warming."""
+    return cache_warmer.stats()
+
+@app.get("/health/db")
+async def db_stats():
+    """Read routing: reads served by the primary and each replica's health and lag."""
+    return replica_router.stats()
+
 @app.get("/protected-test")
 async def protected_test(current_user = Depends(get_current_user)):
     return {
@@ -77,9 +130,34 @@ async def protected_test(current_user = Depends(get_current_user)):
         "username": current_user.username
     }
 
+@app.on_event("startup")
+async def startup_event():
+    """Map the local catalog and recommendation graph, if synced, build the search index and start background watchers."""
+    if catalog_store.load(settings.CATALOG_PATH):
+        search_index.ensure_current()
+    rec_graph.load(settings.REC_GRAPH_PATH)
+    # Follow other workers' writes so cached user lists are never served past them
+    user_versions.start_listener(engine)
+    replica_router.start()
+    if settings.COMMUNITY_STATS_INTERVAL > 0:
+        community_snapshot.start(settings.COMMUNITY_STATS_INTERVAL)
+    if settings.AIRING_POLL_INTERVAL > 0:
+        airing_tracker.start()
+    if settings.WARM_TOP_K > 0:
+        cache_warmer.start()
+    if settings.LOOP_LAG_THRESHOLD_MS > 0:
+        loop_lag_monitor.start()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up resources on application shutdown."""
+    await loop_lag_monitor.stop()
+    await airing_tracker.stop()
+    await trending_streams.close()
+    await cache_warmer.stop()
+    user_versions.stop_listener()
+    replica_router.stop()
+    community_snapshot.stop()
     await anilist_service.close()
 
 if __name__ == "__main__":
@@ -1 +1,3 @@
 from app.models.user import User, Genre, WatchedAnime
+from app.models.job import Job
+from app.models.aggregates import AnimeCommunityStats, AnimeReviewStats
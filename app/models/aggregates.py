@@ -0,0 +1,44 @@
+from sqlalchemy import BigInteger, Column, Computed, DateTime, Float, Index, Integer
+from datetime import datetime
+
+from app.db.session import Base
+
+class AnimeReviewStats(Base):
+    """Per-anime review count and rating sum, kept in step with ``reviews`` by its writers."""
+    __tablename__ = "anime_review_stats"
+
+    anime_id = Column(Integer, primary_key=True, autoincrement=False)  # AniList ID
+    review_count = Column(BigInteger, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0.0)  # over reviews with a rating
+    rated_count = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def mean_rating(self):
+        return self.rating_sum / self.rated_count if self.rated_count else None
+
+class AnimeCommunityStats(Base):
+    """Per-anime totals over our users' watched lists, refreshed by the ``refresh_community_stats`` job."""
+    __tablename__ = "anime_community_stats"
+
+    anime_id = Column(Integer, primary_key=True, autoincrement=False)  # AniList ID
+    members = Column(BigInteger, nullable=False, default=0)  # users with the title on their list
+    watching = Column(BigInteger, nullable=False, default=0)
+    completed = Column(BigInteger, nullable=False, default=0)
+    on_hold = Column(BigInteger, nullable=False, default=0)
+    dropped = Column(BigInteger, nullable=False, default=0)
+    plan_to_watch = Column(BigInteger, nullable=False, default=0)
+    favorites = Column(BigInteger, nullable=False, default=0)  # rated 8 or more, as in /user/favorites
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    rated_count = Column(BigInteger, nullable=False, default=0)
+    mean_rating = Column(Float, Computed("rating_sum / NULLIF(rated_count, 0)", persisted=True))
+    # Latest watched_anime.updated_at counted; the next delta refresh starts from here
+    last_activity_at = Column(DateTime, nullable=True, index=True)
+    refreshed_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Leaderboards read the top of one of these, ties broken by anime ID
+Index("ix_anime_community_stats_members", AnimeCommunityStats.members.desc(), AnimeCommunityStats.anime_id)
+Index("ix_anime_community_stats_favorites", AnimeCommunityStats.favorites.desc(), AnimeCommunityStats.anime_id)
+Index("ix_anime_community_stats_watching", AnimeCommunityStats.watching.desc(), AnimeCommunityStats.anime_id)
+Index("ix_anime_community_stats_completed", AnimeCommunityStats.completed.desc(), AnimeCommunityStats.anime_id)
+Index("ix_anime_community_stats_mean_rating", AnimeCommunityStats.mean_rating.desc(), AnimeCommunityStats.anime_id)
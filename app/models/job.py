@@ -0,0 +1,39 @@
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, JSON, String, Text, text
+from datetime import datetime
+
+from app.db.session import Base
+
+class Job(Base):
+    """A unit of background work, claimed by workers with SELECT ... FOR UPDATE SKIP LOCKED."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # At most one queued or running job per dedup key
+        Index(
+            "uq_jobs_dedup_key_active", "dedup_key", unique=True,
+            postgresql_where=text("status IN ('queued', 'running') AND dedup_key IS NOT NULL"),
+        ),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed
+    priority = Column(Integer, nullable=False, default=0)  # higher runs first
+    dedup_key = Column(String(255), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # not before; pushed back by retries
+    locked_by = Column(String(255), nullable=True)
+    locked_until = Column(DateTime, nullable=True)  # visibility timeout of a running job
+    progress = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+# Claim order; finished jobs drop out of the partial index
+Index(
+    "ix_jobs_claim", Job.priority.desc(), Job.run_at,
+    postgresql_where=text("status IN ('queued', 'running')"),
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Table, ForeignKey, Text, Float, DateTime
+from sqlalchemy import Boolean, Column, Integer, String, Table, ForeignKey, Text, Float, DateTime, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -48,6 +48,10 @@ class Genre(Base):
 
 class WatchedAnime(Base):
     __tablename__ = "watched_anime"
+    __table_args__ = (
+        # Target of the bulk upsert's ON CONFLICT clause
+        UniqueConstraint("user_id", "anime_id", name="uq_watched_anime_user_anime"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -58,10 +62,12 @@ class WatchedAnime(Base):
     rating = Column(Integer, nullable=True)  # User rating (1-10)
     notes = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexed for community stats' delta refreshes (see app.services.community)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class Review(Base):
     __tablename__ = "reviews"
+    # Postgres also has a generated search_vector column (see app.services.reviews.ensure_search_column)
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -1,3 +1,3 @@
 from app.schemas.user import User, UserCreate, UserUpdate, UserInDB
 from app.schemas.token import Token, TokenPayload
-from app.schemas.anime import AnimeBase, AnimeSearch, GenrePreference, WatchedAnime, WatchedAnimeCreate
+from app.schemas.anime import AnimeBase, AnimeSearch, AnimeSuggestion, GenrePreference, WatchedAnime, WatchedAnimeCreate, WatchedAnimeBatch, WatchedAnimeBatchResult
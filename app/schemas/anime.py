@@ -1,5 +1,5 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PrivateAttr
 
 class AnimeBase(BaseModel):
     id: int
@@ -14,7 +14,15 @@ class AnimeBase(BaseModel):
     endDate: Optional[Dict[str, Optional[int]]] = None
     nextAiringEpisode: Optional[Dict[str, Any]] = None
     isAdult: Optional[bool] = None
-    
+
+    # Serialized JSON, filled lazily by app.core.responses.render_anime
+    _json: Optional[bytes] = PrivateAttr(default=None)
+
+class AnimeSuggestion(BaseModel):
+    id: int
+    title: str
+    coverImage: Optional[str] = None
+
 class AnimeSearch(BaseModel):
     query: str
     genres: Optional[List[str]] = None
@@ -34,3 +42,27 @@ class WatchedAnime(WatchedAnimeCreate):
     
     class Config:
         orm_mode = True
+
+class WatchedAnimeBatch(BaseModel):
+    items: List[WatchedAnimeCreate] = Field(..., min_length=1, max_length=10000)
+
+class WatchedAnimeBatchResult(BaseModel):
+    anime_id: int
+    result: str  # created, updated, not_found
+    id: Optional[int] = None
+
+class CommunityStats(BaseModel):
+    anime_id: int
+    members: int
+    watching: int
+    completed: int
+    on_hold: int
+    dropped: int
+    plan_to_watch: int
+    favorites: int
+    rated_count: int
+    mean_rating: Optional[float] = None
+    anime: Optional[AnimeBase] = None  # from the local catalog, when it has the title
+
+    class Config:
+        orm_mode = True
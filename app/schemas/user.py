@@ -56,3 +56,22 @@ class ReviewResponse(ReviewBase):
 
     class Config:
         orm_mode = True
+
+class ReviewSearchResult(BaseModel):
+    id: int
+    user_id: int
+    anime_id: int
+    title: str
+    rating: Optional[float] = None
+    created_at: datetime
+    rank: float
+    snippet: str  # matching fragments of the content, HTML-escaped, terms wrapped in <b></b>
+
+class ReviewSearchPage(BaseModel):
+    results: List[ReviewSearchResult]
+    next_cursor: Optional[str] = None  # pass as `cursor` for the next page; None on the last one
+
+class ReviewStats(BaseModel):
+    anime_id: int
+    review_count: int
+    mean_rating: Optional[float] = None
@@ -0,0 +1,213 @@
+"""Airing schedule tracker: one AniList poller shared by every subscriber.
+
+Every ``AIRING_POLL_INTERVAL`` seconds the tracker fetches the episodes
+airing within ``AIRING_HORIZON`` for the union of titles subscribed users
+are watching, 50 titles per query, and queues them in a heap ordered by
+``airingAt``. Titles the local catalog lists as finished or cancelled are
+skipped. Newly queued episodes are announced as ``scheduled`` events, and
+so are episodes AniList has moved to a new time: the new time is queued
+and the old heap entry is skipped when it comes up (as are entries for
+episodes that dropped out of the schedule). A dispatcher sleeps until the
+earliest one airs, then sends an ``episode`` event to each subscriber with
+that title on their watching list. Upstream cost grows with the number of
+distinct titles, not with users or open connections.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import logging
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.user import WatchedAnime
+from app.services.anilist import AniListUnavailable, anilist_service
+from app.services.broadcast import Subscriber, format_event
+from app.services.catalog import STATUSES, catalog_store
+from app.services.user_versions import user_versions
+
+logger = logging.getLogger(__name__)
+
+# Catalog status codes (1 + index into STATUSES) of titles that won't air again
+_ENDED = {1 + STATUSES.index("FINISHED"), 1 + STATUSES.index("CANCELLED")}
+
+
+def _may_air(anime_id: int) -> bool:
+    row = catalog_store.row_of(anime_id)
+    return row is None or int(catalog_store.columns["status"][row]) not in _ENDED
+
+
+def _watching_titles(user_id: int) -> Set[int]:
+    db = SessionLocal()
+    try:
+        rows = db.query(WatchedAnime.anime_id).filter(
+            WatchedAnime.user_id == user_id,
+            WatchedAnime.status == "watching"
+        )
+        return {anime_id for anime_id, in rows}
+    finally:
+        db.close()
+
+
+class AiringTracker:
+    def __init__(self, poll_interval: int = 300, horizon: int = 60 * 60 * 24, max_buffer: int = 100):
+        self.poll_interval = poll_interval
+        self.horizon = horizon
+        self.max_buffer = max_buffer
+        self.polls = 0
+        self._heap: List[Tuple[int, int, int]] = []  # (airingAt, anime ID, episode)
+        # (anime ID, episode) -> current airingAt; heap entries at any other time are stale
+        self._queued: Dict[Tuple[int, int], int] = {}
+        self._titles: Dict[int, str] = {}
+        self._tracked: Set[int] = set()  # titles covered by the last poll
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        # Subscribed user -> (data version the titles were loaded at, titles they're watching)
+        self._watching: Dict[int, Tuple[int, Set[int]]] = {}
+        self._fans: Dict[int, Set[int]] = defaultdict(set)  # anime ID -> subscribed user IDs
+        self._tasks: List[asyncio.Task] = []
+        self._poll_now: Optional[asyncio.Event] = None
+        self._heap_changed: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        self._poll_now = asyncio.Event()
+        self._heap_changed = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._poll_loop()), asyncio.ensure_future(self._dispatch_loop())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def subscribe(self, user_id: int) -> Tuple[Subscriber, bytes]:
+        """Register a subscriber; returns it and an ``upcoming`` event for its titles."""
+        if user_id not in self._watching:
+            version = user_versions.get(user_id)
+            titles = await run_in_threadpool(_watching_titles, user_id)
+            if user_id not in self._watching:
+                self._set_watching(user_id, version, titles)
+        subscriber = Subscriber(self.max_buffer)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        titles = self._watching[user_id][1]
+        if self.polls == 0 or any(t not in self._tracked and _may_air(t) for t in titles):
+            self._poll_now.set()
+        return subscriber, format_event("upcoming", self.upcoming(titles))
+
+    def unsubscribe(self, user_id: int, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[user_id]
+            self._set_watching(user_id, 0, set())
+            del self._watching[user_id]
+
+    def upcoming(self, titles: Set[int]) -> List[dict]:
+        return [
+            self._event(airing_at, anime_id, episode)
+            for airing_at, anime_id, episode in sorted(self._heap)
+            if anime_id in titles and self._queued.get((anime_id, episode)) == airing_at
+        ]
+
+    def _event(self, airing_at: int, anime_id: int, episode: int) -> dict:
+        return {
+            "anime_id": anime_id,
+            "title": self._titles.get(anime_id, "Unknown"),
+            "episode": episode,
+            "airing_at": airing_at,
+        }
+
+    def _set_watching(self, user_id: int, version: int, titles: Set[int]) -> None:
+        _, previous = self._watching.get(user_id, (0, set()))
+        for anime_id in previous - titles:
+            self._fans[anime_id].discard(user_id)
+            if not self._fans[anime_id]:
+                del self._fans[anime_id]
+        for anime_id in titles - previous:
+            self._fans[anime_id].add(user_id)
+        self._watching[user_id] = (version, titles)
+
+    async def poll(self) -> None:
+        """Fetch the schedule for every watched title and queue episodes that are new or rescheduled."""
+        # Pick up watching-list changes since the titles were loaded
+        for user_id, (version, _) in list(self._watching.items()):
+            current = user_versions.get(user_id)
+            if current != version:
+                titles = await run_in_threadpool(_watching_titles, user_id)
+                if user_id in self._watching:
+                    self._set_watching(user_id, current, titles)
+        titles = {anime_id for anime_id in self._fans if _may_air(anime_id)}
+
+        now = int(time.time())
+        schedule = await anilist_service.get_airing_schedule(sorted(titles), now, now + self.horizon) if titles else []
+        # Queued episodes of polled titles that AniList no longer lists, e.g. delayed past the horizon
+        dropped = {key for key in self._queued if key[0] in titles}
+        for item in schedule:
+            key = (item["mediaId"], item["episode"])
+            dropped.discard(key)
+            self._titles[item["mediaId"]] = item["title"]
+            if self._queued.get(key) != item["airingAt"]:
+                self._queued[key] = item["airingAt"]
+                heapq.heappush(self._heap, (item["airingAt"], item["mediaId"], item["episode"]))
+                self._announce("scheduled", item["airingAt"], item["mediaId"], item["episode"])
+        for key in dropped:
+            del self._queued[key]
+        self._tracked = titles
+        self.polls += 1
+        self._heap_changed.set()
+        logger.info(f"Airing schedule: {len(self._queued)} episodes queued for {len(titles)} titles")
+
+    async def _poll_loop(self) -> None:
+        while True:
+            self._poll_now.clear()
+            # Nobody to notify, so don't spend AniList quota
+            if self._subscribers:
+                try:
+                    await self.poll()
+                except AniListUnavailable as e:
+                    logger.warning(f"Airing schedule poll failed: {e}")
+                except Exception:
+                    logger.exception("Airing schedule poll failed")
+            try:
+                await asyncio.wait_for(self._poll_now.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            self._heap_changed.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                airing_at, anime_id, episode = heapq.heappop(self._heap)
+                if self._queued.get((anime_id, episode)) != airing_at:
+                    # Rescheduled; the entry at the new time is still in the heap
+                    continue
+                del self._queued[(anime_id, episode)]
+                self._announce("episode", airing_at, anime_id, episode)
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._heap_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _announce(self, event: str, airing_at: int, anime_id: int, episode: int) -> None:
+        user_ids = self._fans.get(anime_id)
+        if not user_ids:
+            return
+        # Encoded once, however many subscribers get it
+        message = format_event(event, self._event(airing_at, anime_id, episode), f"{event}-{anime_id}-{episode}")
+        for user_id in list(user_ids):
+            for subscriber in list(self._subscribers.get(user_id, ())):
+                if not subscriber.send(message):
+                    self.unsubscribe(user_id, subscriber)
+
+
+airing_tracker = AiringTracker(settings.AIRING_POLL_INTERVAL, settings.AIRING_HORIZON, settings.SSE_CLIENT_BUFFER)
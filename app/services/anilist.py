@@ -1,14 +1,17 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import json
 import logging
 import aiohttp
 import asyncio
-from gql import Client, gql
-from gql.transport.aiohttp import AIOHTTPTransport
+from contextvars import ContextVar
 from datetime import datetime, timedelta
 
 from app.core.config import settings
+from app.core.rate_limit import admit_upstream
 from app.schemas.anime import AnimeBase
+from app.services.batcher import QueryBatcher
+from app.services.cache import TTLCache
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
 
 logger = logging.getLogger(__name__)
 
@@ -35,11 +38,49 @@ class RateLimiter:
             
             self.requests.append(now)
 
+    def remaining(self) -> int:
+        """Requests that can still be made in the current window without waiting."""
+        now = datetime.now()
+        window = timedelta(seconds=self.time_window)
+        return self.max_requests - sum(1 for req_time in self.requests if now - req_time < window)
+
+class AniListUnavailable(Exception):
+    """AniList failed, timed out, throttled us or is behind an open circuit, and nothing usable was cached."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Set when the current request was answered from a stale cache entry
+served_stale: ContextVar[bool] = ContextVar("served_stale", default=False)
+
+def _is_not_found(errors: List[Dict[str, Any]]) -> bool:
+    """AniList answers unknown IDs with a 404 GraphQL error, which is not an outage."""
+    return bool(errors) and all(
+        isinstance(err, dict) and err.get("status") == 404 for err in errors
+    )
+
 class AniListService:
     def __init__(self):
         self.url = settings.ANILIST_API_URL
-        self.rate_limiter = RateLimiter()
+        self.rate_limiter = RateLimiter(max_requests=settings.ANILIST_RATE_LIMIT)
+        self.cache = TTLCache()
+        self.breaker = CircuitBreaker(
+            "anilist",
+            failure_rate_threshold=settings.ANILIST_BREAKER_FAILURE_RATE,
+            minimum_calls=settings.ANILIST_BREAKER_MIN_CALLS,
+            window=settings.ANILIST_BREAKER_WINDOW,
+            open_duration=settings.ANILIST_BREAKER_OPEN_SECONDS,
+        )
+        self.batcher = QueryBatcher(
+            self._post,
+            window=settings.ANILIST_BATCH_WINDOW_MS / 1000,
+            max_complexity=settings.ANILIST_BATCH_MAX_COMPLEXITY,
+        )
+        self._inflight: Dict[tuple, asyncio.Future] = {}
         self._session = None
+        # Set by CacheWarmer, which tracks which keys are requested and how they were served
+        self.warmer = None
         
     async def _get_session(self) -> aiohttp.ClientSession:
         """Get or create an aiohttp session."""
@@ -47,25 +88,129 @@ class AniListService:
             self._session = aiohttp.ClientSession()
         return self._session
         
-    async def _execute_query(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute a GraphQL query using a new client for each request."""
-        transport = AIOHTTPTransport(url=self.url)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
+    async def _execute_query(self, query: str, variables: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Execute a GraphQL query, batched with any others issued at the same time.
+
+        Raises AniListUnavailable for every upstream failure; a 404 GraphQL
+        error is returned as its (empty) data instead.
+        """
+        logger.debug(f"Executing GraphQL query with variables: {variables}")
+        data, errors = await asyncio.wait_for(
+            self.batcher.submit(query, variables), timeout or settings.ANILIST_TIMEOUT
+        )
+        if errors and not _is_not_found(errors):
+            logger.error(f"AniList returned an error: {errors}")
+            raise AniListUnavailable(f"AniList returned an error: {errors[0].get('message')}")
+        return data
+
+    async def _post(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """POST one GraphQL document through the circuit breaker and rate limiter.
+
+        Returns the raw payload (``data``/``errors``). Transport failures,
+        timeouts, throttling and 5xx responses raise AniListUnavailable and
+        count against the circuit.
+        """
+        if self.breaker.state == CircuitBreaker.OPEN:
+            raise AniListUnavailable(
+                f"Circuit '{self.breaker.name}' is open", retry_after=self.breaker.retry_after
+            )
+        await self.rate_limiter.acquire()
+        # Reserve the call only now, so a request cancelled while waiting holds no probe
+        try:
+            self.breaker.allow()
+        except CircuitOpenError as e:
+            raise AniListUnavailable(str(e), retry_after=e.retry_after) from e
+
+        try:
+            session = await self._get_session()
+            async with session.post(
+                self.url,
+                json={"query": query, "variables": variables},
+                timeout=aiohttp.ClientTimeout(total=settings.ANILIST_TIMEOUT),
+            ) as response:
+                if response.status == 429:
+                    retry_after = float(response.headers.get("Retry-After", 60))
+                    raise AniListUnavailable("AniList rate limit exceeded", retry_after=retry_after)
+                if response.status >= 500:
+                    raise AniListUnavailable(f"AniList responded with HTTP {response.status}")
+                payload = await response.json(content_type=None)
+        except AniListUnavailable:
+            self.breaker.record_failure()
+            raise
+        except asyncio.TimeoutError as e:
+            self.breaker.record_failure()
+            logger.error(f"AniList query timed out with variables: {variables}")
+            raise AniListUnavailable("AniList request timed out") from e
+        except (aiohttp.ClientError, ValueError) as e:
+            self.breaker.record_failure()
+            logger.error(f"Error executing GraphQL query: {str(e)}")
+            raise AniListUnavailable(f"AniList request failed: {e}") from e
+        except BaseException:
+            # Cancelled, or failed in a way that says nothing about AniList
+            self.breaker.release()
+            raise
+
+        if not isinstance(payload, dict) or ("data" not in payload and "errors" not in payload):
+            self.breaker.record_failure()
+            raise AniListUnavailable("AniList returned an unexpected response")
+        self.breaker.record_success()
+        logger.debug(f"GraphQL response: {json.dumps(payload, indent=2)}")
+        return payload
+
+    async def _fetch(self, cache_key: tuple, ttl: int, query: str, variables: Dict[str, Any], parse, refresh: bool = False) -> Any:
+        """Return the cached value for cache_key, or run the query and cache its parsed result.
+
+        Expired entries are served stale while a background task refreshes
+        them, so an outage or throttling never blocks a request that has
+        something cached. Stale answers set served_stale for the request.
+        ``refresh`` skips the cache lookup (the result is still cached).
+        """
+        entry = None if refresh else self.cache.get_entry(cache_key)
+        if self.warmer is not None and not refresh:
+            self.warmer.record(cache_key, ttl, query, variables, parse, entry)
+        if entry is not None:
+            value, fresh = entry
+            if not fresh:
+                served_stale.set(True)
+                if cache_key not in self._inflight and self.breaker.state != CircuitBreaker.OPEN:
+                    asyncio.ensure_future(self._revalidate(cache_key, ttl, query, variables, parse))
+            return value
+        if cache_key not in self._inflight:
+            # Only the request that triggers the upstream query pays for it
+            admit_upstream()
+        return await self._load(cache_key, ttl, query, variables, parse)
+
+    async def _revalidate(self, cache_key: tuple, ttl: int, query: str, variables: Dict[str, Any], parse) -> None:
+        try:
+            await self._load(cache_key, ttl, query, variables, parse)
+        except AniListUnavailable as e:
+            logger.warning(f"Background refresh of {cache_key} failed: {e}")
+
+    async def _load(self, cache_key: tuple, ttl: int, query: str, variables: Dict[str, Any], parse) -> Any:
+        """Run the query once for all concurrent callers of the same cache_key."""
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
         try:
-            logger.debug(f"Executing GraphQL query with variables: {variables}")
-            result = await client.execute_async(gql(query), variable_values=variables)
-            logger.debug(f"GraphQL response: {json.dumps(result, indent=2)}")
-            return result
-        except Exception as e:
-            logger.error(f"Error executing GraphQL query: {str(e)}", exc_info=True)
+            result = await self._execute_query(query, variables)
+            value = parse(result)
+            if value:
+                self.cache.set(cache_key, value, ttl, stale_ttl=settings.ANILIST_STALE_TTL)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Only waiters (if any) should see the error; don't warn about an unretrieved one
+            future.exception()
             raise
         finally:
-            await client.close_async()
+            del self._inflight[cache_key]
         
     async def search_anime(self, query: str, genres: Optional[List[str]] = None, sort: Optional[str] = None) -> List[AnimeBase]:
         """Search for anime by title and optionally filter by genres."""
-        await self.rate_limiter.acquire()
-        
         search_query = """
         query ($search: String, $genres: [String], $sort: [MediaSort]) {
             Page(page: 1, perPage: 20) {
@@ -107,18 +252,18 @@ class AniListService:
         
         try:
             print(f"Searching for anime with query: {query}, genres: {genres}, sort: {sort}")
-            result = await self._execute_query(search_query, variables)
-            anime_list = self._parse_anime_results(result)
+            cache_key = ("search", query, tuple(genres) if genres else None, sort)
+            anime_list = await self._fetch(
+                cache_key, settings.LIST_CACHE_TTL, search_query, variables, self._parse_anime_results
+            )
             print(f"Found {len(anime_list)} results")
             return anime_list
-        except Exception as e:
+        except AniListUnavailable as e:
             print(f"Error searching anime: {str(e)}")
-            return []
+            raise
             
     async def get_popular_anime(self, genres: Optional[List[str]] = None, limit: int = 10) -> List[AnimeBase]:
         """Get popular anime, optionally filtered by genres."""
-        await self.rate_limiter.acquire()
-        
         popular_query = """
         query ($genres: [String], $perPage: Int) {
             Page(page: 1, perPage: $perPage) {
@@ -150,20 +295,20 @@ class AniListService:
         
         try:
             logger.info(f"Fetching popular anime with genres: {genres}")
-            result = await self._execute_query(popular_query, variables)
-            anime_list = self._parse_anime_results(result)
+            cache_key = ("popular", tuple(genres) if genres else None, limit)
+            anime_list = await self._fetch(
+                cache_key, settings.LIST_CACHE_TTL, popular_query, variables, self._parse_anime_results
+            )
             logger.info(f"Found {len(anime_list)} popular anime results")
             if genres:
                 logger.info(f"Genres in results: {[anime.genres for anime in anime_list]}")
             return anime_list
-        except Exception as e:
-            logger.error(f"Error fetching popular anime: {str(e)}", exc_info=True)
-            return []
+        except AniListUnavailable as e:
+            logger.error(f"Error fetching popular anime: {str(e)}")
+            raise
     
     async def get_anime_by_id(self, anime_id: int) -> Optional[AnimeBase]:
         """Get anime details by ID."""
-        await self.rate_limiter.acquire()
-        
         query = """
         query ($id: Int) {
             Media(id: $id, type: ANIME) {
@@ -205,19 +350,175 @@ class AniListService:
         variables = {"id": anime_id}
         
         try:
-            result = await self._execute_query(query, variables)
-            anime_data = result.get("Media", {})
-            if not anime_data:
-                return None
-            return self._parse_anime(anime_data)
-        except Exception as e:
+            return await self._fetch(
+                ("anime", anime_id), settings.ANIME_CACHE_TTL, query, variables, self._parse_media
+            )
+        except AniListUnavailable as e:
             print(f"Error fetching anime by ID: {e}")
-            return None
+            raise
     
+    async def get_anime_by_ids(self, anime_ids: List[int]) -> Dict[int, AnimeBase]:
+        """Get anime details for many IDs, 50 per query; unknown IDs are left out."""
+        query = """
+        query ($ids: [Int], $perPage: Int) {
+            Page(page: 1, perPage: $perPage) {
+                media(id_in: $ids, type: ANIME) {
+                    id
+                    title {
+                        english
+                        romaji
+                    }
+                    genres
+                    description
+                    averageScore
+                    episodes
+                    status
+                    coverImage {
+                        large
+                        medium
+                        color
+                    }
+                    startDate {
+                        year
+                        month
+                        day
+                    }
+                    endDate {
+                        year
+                        month
+                        day
+                    }
+                    nextAiringEpisode {
+                        airingAt
+                        timeUntilAiring
+                        episode
+                    }
+                    isAdult
+                }
+            }
+        }
+        """
+
+        found: Dict[int, AnimeBase] = {}
+        missing = []
+        for anime_id in dict.fromkeys(anime_ids):
+            cached = self.cache.get(("anime", anime_id))
+            if cached is not None:
+                found[anime_id] = cached
+            else:
+                missing.append(anime_id)
+
+        chunks = [missing[i:i + 50] for i in range(0, len(missing), 50)]
+        try:
+            # Issued together so the batcher can pack several chunks per request
+            results = await asyncio.gather(*[
+                self._execute_query(query, {"ids": chunk, "perPage": len(chunk)})
+                for chunk in chunks
+            ])
+        except AniListUnavailable as e:
+            logger.error(f"Error fetching anime by IDs: {str(e)}")
+            raise
+        for result in results:
+            for anime in self._parse_anime_results(result):
+                # Same fields as get_anime_by_id, so share its cache entries
+                self.cache.set(("anime", anime.id), anime, settings.ANIME_CACHE_TTL, stale_ttl=settings.ANILIST_STALE_TTL)
+                found[anime.id] = anime
+        return found
+
+    async def get_ids_by_mal_ids(self, mal_ids: List[int]) -> Dict[int, Tuple[int, str]]:
+        """Map MyAnimeList IDs to (AniList ID, title), 50 per query; unknown IDs are left out."""
+        query = """
+        query ($malIds: [Int], $perPage: Int) {
+            Page(page: 1, perPage: $perPage) {
+                media(idMal_in: $malIds, type: ANIME) {
+                    id
+                    idMal
+                    title {
+                        english
+                        romaji
+                    }
+                }
+            }
+        }
+        """
+
+        mal_ids = list(dict.fromkeys(mal_ids))
+        chunks = [mal_ids[i:i + 50] for i in range(0, len(mal_ids), 50)]
+        try:
+            results = await asyncio.gather(*[
+                self._execute_query(query, {"malIds": chunk, "perPage": len(chunk)})
+                for chunk in chunks
+            ])
+        except AniListUnavailable as e:
+            logger.error(f"Error mapping MyAnimeList IDs: {str(e)}")
+            raise
+        mapping = {}
+        for result in results:
+            for media in result.get("Page", {}).get("media", []):
+                title = media.get("title") or {}
+                mapping[media["idMal"]] = (media["id"], title.get("english") or title.get("romaji") or "Unknown")
+        return mapping
+
+    async def get_airing_schedule(self, media_ids: List[int], airing_after: int, airing_before: int) -> List[Dict[str, Any]]:
+        """Episodes of the given titles airing between two Unix times, 50 titles per query.
+
+        Each item has ``mediaId``, ``episode``, ``airingAt`` and ``title``.
+        Not cached: the airing tracker polls this on its own schedule.
+        """
+        query = """
+        query ($mediaIds: [Int], $after: Int, $before: Int, $page: Int) {
+            Page(page: $page, perPage: 50) {
+                pageInfo {
+                    hasNextPage
+                }
+                airingSchedules(mediaId_in: $mediaIds, airingAt_greater: $after, airingAt_lesser: $before, sort: TIME) {
+                    mediaId
+                    episode
+                    airingAt
+                    media {
+                        title {
+                            english
+                            romaji
+                        }
+                    }
+                }
+            }
+        }
+        """
+
+        async def fetch_chunk(chunk: List[int]) -> List[Dict[str, Any]]:
+            schedules, page = [], 1
+            while True:
+                result = await self._execute_query(
+                    query, {"mediaIds": chunk, "after": airing_after, "before": airing_before, "page": page}
+                )
+                page_data = result.get("Page") or {}
+                schedules.extend(page_data.get("airingSchedules") or [])
+                if not (page_data.get("pageInfo") or {}).get("hasNextPage"):
+                    return schedules
+                page += 1
+
+        media_ids = list(dict.fromkeys(media_ids))
+        chunks = [media_ids[i:i + 50] for i in range(0, len(media_ids), 50)]
+        try:
+            results = await asyncio.gather(*[fetch_chunk(chunk) for chunk in chunks])
+        except AniListUnavailable as e:
+            logger.error(f"Error fetching airing schedule: {str(e)}")
+            raise
+        schedule = []
+        for schedules in results:
+            for item in schedules:
+                title = (item.get("media") or {}).get("title") or {}
+                schedule.append({
+                    "mediaId": item["mediaId"],
+                    "episode": item["episode"],
+                    "airingAt": item["airingAt"],
+                    "title": title.get("english") or title.get("romaji") or "Unknown",
+                })
+        return schedule
+
     async def get_recommendations(self, anime_id: int, limit: int = 5) -> List[AnimeBase]:
         """Get anime recommendations based on a specific anime."""
-        await self.rate_limiter.acquire()
-        
         query = """
         query ($id: Int, $perPage: Int) {
             Media(id: $id, type: ANIME) {
@@ -252,22 +553,16 @@ class AniListService:
         }
         
         try:
-            result = await self._execute_query(query, variables)
-            recommendations = result.get("Media", {}).get("recommendations", {}).get("nodes", [])
-            
-            return [
-                self._parse_anime(rec["mediaRecommendation"]) 
-                for rec in recommendations 
-                if "mediaRecommendation" in rec
-            ]
-        except Exception as e:
+            return await self._fetch(
+                ("recommendations", anime_id, limit), settings.LIST_CACHE_TTL,
+                query, variables, self._parse_recommendations
+            )
+        except AniListUnavailable as e:
             print(f"Error fetching recommendations: {e}")
-            return []
+            raise
     
     async def get_genres(self) -> List[str]:
         """Get list of available genres."""
-        await self.rate_limiter.acquire()
-        
         query = """
         query {
             GenreCollection
@@ -275,12 +570,107 @@ class AniListService:
         """
         
         try:
-            result = await self._execute_query(query, {})
-            return result.get("GenreCollection", [])
-        except Exception as e:
+            return await self._fetch(
+                ("genres",), settings.GENRE_CACHE_TTL, query, {},
+                lambda result: result.get("GenreCollection", [])
+            )
+        except AniListUnavailable as e:
             print(f"Error fetching genres: {e}")
-            return []
-    
+            raise
+
+    async def get_catalog_page(self, page: int, per_page: int = 50) -> Tuple[List[Dict[str, Any]], bool]:
+        """Get one page of raw Media data for the local catalog, ordered by ID.
+
+        Returns the media dicts and whether another page exists. Errors are
+        raised rather than swallowed so a sync job can retry or abort.
+        """
+        query = """
+        query ($page: Int, $perPage: Int) {
+            Page(page: $page, perPage: $perPage) {
+                pageInfo {
+                    hasNextPage
+                }
+                media(type: ANIME, sort: ID) {
+                    id
+                    title {
+                        english
+                        romaji
+                        native
+                    }
+                    synonyms
+                    genres
+                    description
+                    averageScore
+                    popularity
+                    episodes
+                    status
+                    coverImage {
+                        large
+                        medium
+                        color
+                    }
+                    startDate {
+                        year
+                        month
+                        day
+                    }
+                    endDate {
+                        year
+                        month
+                        day
+                    }
+                    isAdult
+                }
+            }
+        }
+        """
+
+        result = await self._execute_query(query, {"page": page, "perPage": per_page})
+        page_data = result.get("Page", {})
+        has_next = page_data.get("pageInfo", {}).get("hasNextPage", False)
+        return page_data.get("media", []), has_next
+
+    async def get_recommendation_edges_page(
+        self, page: int, per_page: int = 50, per_title: int = 25
+    ) -> Tuple[List[Tuple[int, int, int]], bool]:
+        """Get one page of recommendation edges, ordered by source ID.
+
+        Returns ``(source ID, recommended ID, rating)`` triples for up to
+        ``per_title`` top-rated recommendations per title, and whether
+        another page exists. Errors are raised like ``get_catalog_page``.
+        """
+        query = """
+        query ($page: Int, $perPage: Int, $perTitle: Int) {
+            Page(page: $page, perPage: $perPage) {
+                pageInfo {
+                    hasNextPage
+                }
+                media(type: ANIME, sort: ID) {
+                    id
+                    recommendations(sort: [RATING_DESC], perPage: $perTitle) {
+                        nodes {
+                            rating
+                            mediaRecommendation {
+                                id
+                            }
+                        }
+                    }
+                }
+            }
+        }
+        """
+
+        result = await self._execute_query(query, {"page": page, "perPage": per_page, "perTitle": per_title})
+        page_data = result.get("Page", {})
+        has_next = page_data.get("pageInfo", {}).get("hasNextPage", False)
+        edges = []
+        for media in page_data.get("media", []):
+            for node in (media.get("recommendations") or {}).get("nodes") or []:
+                target = node.get("mediaRecommendation")
+                if target:
+                    edges.append((media["id"], target["id"], node.get("rating") or 0))
+        return edges, has_next
+
     def _parse_anime(self, anime_data: Dict[str, Any]) -> AnimeBase:
         """Parse anime data from AniList API response."""
         title = anime_data.get("title", {})
@@ -320,16 +710,30 @@ class AniListService:
         """Parse anime results from AniList API response."""
         media_list = result.get("Page", {}).get("media", [])
         return [self._parse_anime(anime) for anime in media_list]
+
+    def _parse_media(self, result: Dict[str, Any]) -> Optional[AnimeBase]:
+        """Parse a single Media result from AniList API response."""
+        anime_data = result.get("Media", {})
+        if not anime_data:
+            return None
+        return self._parse_anime(anime_data)
+
+    def _parse_recommendations(self, result: Dict[str, Any]) -> List[AnimeBase]:
+        """Parse recommendation nodes from AniList API response."""
+        recommendations = result.get("Media", {}).get("recommendations", {}).get("nodes", [])
+        return [
+            self._parse_anime(rec["mediaRecommendation"])
+            for rec in recommendations
+            if rec.get("mediaRecommendation")
+        ]
     
     async def close(self):
         """Close the aiohttp session."""
         if self._session and not self._session.closed:
             await self._session.close()
 
-    async def get_trending_anime(self, genres: Optional[List[str]] = None, limit: int = 20) -> List[AnimeBase]:
-        """Get trending anime, optionally filtered by genres."""
-        await self.rate_limiter.acquire()
-        
+    async def get_trending_anime(self, genres: Optional[List[str]] = None, limit: int = 20, refresh: bool = False) -> List[AnimeBase]:
+        """Get trending anime, optionally filtered by genres; ``refresh`` bypasses the cache."""
         query = """
         query ($genres: [String], $perPage: Int) {
             Page(page: 1, perPage: $perPage) {
@@ -361,20 +765,20 @@ class AniListService:
         
         try:
             logger.info(f"Fetching trending anime with genres: {genres}")
-            result = await self._execute_query(query, variables)
-            anime_list = self._parse_anime_results(result)
+            cache_key = ("trending", tuple(genres) if genres else None, limit)
+            anime_list = await self._fetch(
+                cache_key, settings.LIST_CACHE_TTL, query, variables, self._parse_anime_results, refresh
+            )
             logger.info(f"Found {len(anime_list)} trending anime results")
             if genres:
                 logger.info(f"Genres in results: {[anime.genres for anime in anime_list]}")
             return anime_list
-        except Exception as e:
-            logger.error(f"Error fetching trending anime: {str(e)}", exc_info=True)
-            return []
+        except AniListUnavailable as e:
+            logger.error(f"Error fetching trending anime: {str(e)}")
+            raise
 
     async def get_top_rated_anime(self, genres: Optional[List[str]] = None, limit: int = 20) -> List[AnimeBase]:
         """Get top rated anime, optionally filtered by genres."""
-        await self.rate_limiter.acquire()
-        
         query = """
         query ($genres: [String], $perPage: Int) {
             Page(page: 1, perPage: $perPage) {
@@ -406,20 +810,20 @@ class AniListService:
         
         try:
             logger.info(f"Fetching top rated anime with genres: {genres}")
-            result = await self._execute_query(query, variables)
-            anime_list = self._parse_anime_results(result)
+            cache_key = ("top_rated", tuple(genres) if genres else None, limit)
+            anime_list = await self._fetch(
+                cache_key, settings.LIST_CACHE_TTL, query, variables, self._parse_anime_results
+            )
             logger.info(f"Found {len(anime_list)} top rated anime results")
             if genres:
                 logger.info(f"Genres in results: {[anime.genres for anime in anime_list]}")
             return anime_list
-        except Exception as e:
-            logger.error(f"Error fetching top rated anime: {str(e)}", exc_info=True)
-            return []
+        except AniListUnavailable as e:
+            logger.error(f"Error fetching top rated anime: {str(e)}")
+            raise
 
     async def get_newest_anime(self, genres: Optional[List[str]] = None, limit: int = 20) -> List[AnimeBase]:
         """Get newest anime, optionally filtered by genres."""
-        await self.rate_limiter.acquire()
-        
         query = """
         query ($genres: [String], $perPage: Int) {
             Page(page: 1, perPage: $perPage) {
@@ -451,15 +855,17 @@ class AniListService:
         
         try:
             logger.info(f"Fetching newest anime with genres: {genres}")
-            result = await self._execute_query(query, variables)
-            anime_list = self._parse_anime_results(result)
+            cache_key = ("newest", tuple(genres) if genres else None, limit)
+            anime_list = await self._fetch(
+                cache_key, settings.LIST_CACHE_TTL, query, variables, self._parse_anime_results
+            )
             logger.info(f"Found {len(anime_list)} newest anime results")
             if genres:
                 logger.info(f"Genres in results: {[anime.genres for anime in anime_list]}")
             return anime_list
-        except Exception as e:
-            logger.error(f"Error fetching newest anime: {str(e)}", exc_info=True)
-            return []
+        except AniListUnavailable as e:
+            logger.error(f"Error fetching newest anime: {str(e)}")
+            raise
 
 # Create a singleton instance
 anilist_service = AniListService()
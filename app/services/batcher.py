@@ -0,0 +1,203 @@
+"""DataLoader-style micro-batching of GraphQL queries.
+
+Queries submitted within a short window are merged into one document:
+each query's variables are renamed with a ``q<n>_`` prefix and its root
+fields are aliased the same way, so ``Media(id: $id)`` from the third query
+becomes ``q2_Media: Media(id: $q2_id)``. The combined response is split
+back per query by alias prefix, errors included (via their ``path``).
+An error without a path can't be attributed to a query: a 404 is passed to
+all of them, anything else (e.g. one query failing validation) makes the
+batch's queries be sent again one by one, so one bad query can't fail the
+others.
+"""
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import copy
+import logging
+import re
+
+from graphql import Visitor, parse, print_ast, visit
+from graphql.language import ast
+
+logger = logging.getLogger(__name__)
+
+# (data, errors) for one query, as if it had been sent on its own
+QueryResult = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+_PER_PAGE_RE = re.compile(r"perPage:\s*(\d+)")
+
+
+def estimate_complexity(query: str, variables: Dict[str, Any]) -> int:
+    """Rough cost of a query: one per query plus the page sizes it asks for."""
+    cost = 1 + sum(int(value) for value in _PER_PAGE_RE.findall(query))
+    for name, value in variables.items():
+        if name.lower().endswith("perpage") and isinstance(value, int):
+            cost += value
+    return cost
+
+
+class _PrefixVariables(Visitor):
+    def __init__(self, prefix: str):
+        super().__init__()
+        self.prefix = prefix
+
+    def enter_variable(self, node, *args):
+        return ast.VariableNode(name=ast.NameNode(value=self.prefix + node.name.value))
+
+
+@lru_cache(maxsize=256)
+def _prefixed_operation(query: str, prefix: str) -> Tuple[tuple, tuple]:
+    """Variable definitions and aliased root fields of ``query`` under ``prefix``."""
+    document = visit(parse(query), _PrefixVariables(prefix))
+    operation = next(
+        definition for definition in document.definitions
+        if isinstance(definition, ast.OperationDefinitionNode)
+    )
+    fields = []
+    for selection in operation.selection_set.selections:
+        field = copy.copy(selection)
+        field.alias = ast.NameNode(value=prefix + (selection.alias or selection.name).value)
+        fields.append(field)
+    return tuple(operation.variable_definitions or ()), tuple(fields)
+
+
+def merge_queries(queries: List[Tuple[str, Dict[str, Any]]]) -> Tuple[str, Dict[str, Any]]:
+    """Combine (query, variables) pairs into one aliased document and variable map."""
+    variable_definitions, selections, variables = [], [], {}
+    for index, (query, query_variables) in enumerate(queries):
+        prefix = f"q{index}_"
+        definitions, fields = _prefixed_operation(query, prefix)
+        variable_definitions.extend(definitions)
+        selections.extend(fields)
+        # Undeclared variables are dropped, as a GraphQL server would ignore them
+        declared = {definition.variable.name.value for definition in definitions}
+        for name, value in query_variables.items():
+            if prefix + name in declared:
+                variables[prefix + name] = value
+    operation = ast.OperationDefinitionNode(
+        operation=ast.OperationType.QUERY,
+        variable_definitions=tuple(variable_definitions),
+        directives=(),
+        selection_set=ast.SelectionSetNode(selections=tuple(selections)),
+    )
+    return print_ast(ast.DocumentNode(definitions=(operation,))), variables
+
+
+def _query_index(error: Dict[str, Any]) -> Optional[int]:
+    """Index of the merged query an error belongs to, or None if its path doesn't say."""
+    path = error.get("path") or []
+    if path and isinstance(path[0], str) and path[0].startswith("q"):
+        return int(path[0][1:].partition("_")[0])
+    return None
+
+
+def _needs_unbatching(payload: Dict[str, Any]) -> bool:
+    """Whether a merged response has an error, other than a 404, that no query can be blamed for."""
+    return any(
+        _query_index(error) is None and error.get("status") != 404
+        for error in payload.get("errors") or []
+    )
+
+
+def split_response(payload: Dict[str, Any], count: int) -> List[QueryResult]:
+    """Split a merged response back into one (data, errors) pair per query."""
+    results: List[QueryResult] = [({}, []) for _ in range(count)]
+    for key, value in (payload.get("data") or {}).items():
+        index, _, name = key[1:].partition("_")
+        results[int(index)][0][name] = value
+    for error in payload.get("errors") or []:
+        index = _query_index(error)
+        if index is not None:
+            results[index][1].append(error)
+        else:
+            # Document-level errors concern every query in the batch
+            for _, errors in results:
+                errors.append(error)
+    return results
+
+
+class QueryBatcher:
+    """Collects queries for ``window`` seconds and sends them as one document.
+
+    ``send`` posts a document with its variables and returns the raw GraphQL
+    payload (``data``/``errors``). A batch is flushed early once adding the
+    next query would exceed ``max_complexity``.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        window: float = 0.005,
+        max_complexity: int = 250,
+    ):
+        self.send = send
+        self.window = window
+        self.max_complexity = max_complexity
+        self._pending: List[Tuple[str, Dict[str, Any], asyncio.Future]] = []
+        self._pending_complexity = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to tasks
+        self._dispatches: Set[asyncio.Task] = set()
+        self.batches_sent = 0
+        self.queries_sent = 0
+
+    async def submit(self, query: str, variables: Dict[str, Any]) -> QueryResult:
+        cost = estimate_complexity(query, variables)
+        if self._pending and self._pending_complexity + cost > self.max_complexity:
+            self._flush()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((query, variables, future))
+        self._pending_complexity += cost
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_complexity = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _send_one(self, query: str, variables: Dict[str, Any]) -> QueryResult:
+        payload = await self.send(query, variables)
+        return payload.get("data") or {}, payload.get("errors") or []
+
+    async def _dispatch(self, batch: List[Tuple[str, Dict[str, Any], asyncio.Future]]) -> None:
+        self.batches_sent += 1
+        self.queries_sent += len(batch)
+        try:
+            if len(batch) == 1:
+                query, variables, _ = batch[0]
+                results = [await self._send_one(query, variables)]
+            else:
+                document, variables = merge_queries([(query, variables) for query, variables, _ in batch])
+                logger.debug(f"Sending batch of {len(batch)} queries")
+                payload = await self.send(document, variables)
+                if _needs_unbatching(payload):
+                    logger.info(f"Batch of {len(batch)} queries failed as a whole, sending them one by one")
+                    self.batches_sent += len(batch)
+                    results = await asyncio.gather(
+                        *(self._send_one(query, variables) for query, variables, _ in batch),
+                        return_exceptions=True,
+                    )
+                else:
+                    results = split_response(payload, len(batch))
+        except BaseException as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,59 @@
+"""Server-sent event fan-out with bounded per-client buffers.
+
+Producers encode an event once with ``format_event`` and hand the bytes to
+every ``Subscriber``. Each subscriber buffers at most ``max_buffer``
+events; a client that falls that far behind is evicted rather than
+allowed to grow memory or hold up the producer, and its stream ends with
+an ``evicted`` event so it can reconnect and resynchronise.
+"""
+from typing import Any, AsyncIterator, Optional
+import asyncio
+
+import orjson
+
+KEEPALIVE = b": keepalive\n\n"
+# Keep proxies from caching or buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def format_event(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    """One SSE message with a JSON ``data`` line."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\n".encode() + b"data: " + orjson.dumps(data) + b"\n\n"
+
+
+EVICTED = format_event("evicted", {"reason": "client too slow"})
+
+
+class Subscriber:
+    __slots__ = ("queue", "evicted")
+
+    def __init__(self, max_buffer: int):
+        self.queue: asyncio.Queue = asyncio.Queue(max_buffer + 1)  # one slot is kept for the eviction notice
+        self.evicted = False
+
+    def send(self, message: bytes) -> bool:
+        """Buffer a message; return False once the subscriber has been evicted."""
+        if self.evicted:
+            return False
+        if self.queue.qsize() >= self.queue.maxsize - 1:
+            self.evicted = True
+            self.queue.put_nowait(EVICTED)
+            return False
+        self.queue.put_nowait(message)
+        return True
+
+    async def stream(self, keepalive: float, first: bytes = b"") -> AsyncIterator[bytes]:
+        """Yield buffered messages, with keepalive comments while idle, until evicted."""
+        if first:
+            yield first
+        while True:
+            try:
+                message = await asyncio.wait_for(self.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield KEEPALIVE
+                continue
+            yield message
+            if message is EVICTED:
+                return
+
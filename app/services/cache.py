@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+import threading
+import time
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after a per-entry TTL.
+
+    Entries may also carry a stale window: once the TTL has passed they are
+    no longer returned by ``get`` but stay available through ``get_entry``
+    until the stale window ends, for stale-while-revalidate serving.
+
+    Safe to share between threads, e.g. the threadpool sync routes run in.
+    """
+
+    def __init__(self, max_size: int = 10000, default_ttl: int = 300):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        """Return (value, is_fresh), or None if missing or past its stale window."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, fresh_until, stale_until = entry
+            now = time.monotonic()
+            if stale_until <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return value, fresh_until > now
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if it is missing or expired."""
+        entry = self.get_entry(key)
+        if entry is None or not entry[1]:
+            return None
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[int] = None, stale_ttl: int = 0) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        ttl = self.default_ttl if ttl is None else ttl
+        fresh_until = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, fresh_until, fresh_until + stale_ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def expires_in(self, key: Hashable) -> Optional[float]:
+        """Seconds until the entry stops being fresh (negative once stale), or None if it's gone."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[2] <= now:
+            return None
+        return entry[1] - now
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,309 @@
+"""Compact, memory-mapped store for the locally known AniList catalog.
+
+Numeric fields live in one numpy column each, genres are a uint64 bitmask
+over an interned genre table, and strings are packed into per-field byte
+blobs with offset arrays. Every column is saved as its own ``.npy`` file
+and opened with ``mmap_mode="r"``, so all workers on a host share the same
+page-cache pages instead of each holding its own copy of the catalog.
+``AnimeBase`` objects are only materialized when a row is actually read.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from app.schemas.anime import AnimeBase
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("FINISHED", "RELEASING", "NOT_YET_RELEASED", "CANCELLED", "HIATUS")
+
+NUMERIC_COLUMNS = {
+    "id": np.int32,
+    "average_score": np.int16,   # -1 when unknown
+    "popularity": np.int32,
+    "episodes": np.int16,        # -1 when unknown
+    "status": np.uint8,          # 1 + index into STATUSES, 0 when unknown
+    "start_date": np.int32,      # YYYYMMDD, unknown parts are 0
+    "end_date": np.int32,
+    "is_adult": np.bool_,
+    "genre_mask": np.uint64,
+}
+
+STRING_COLUMNS = (
+    "title_english",
+    "title_romaji",
+    "title_native",
+    "synonyms",                  # joined with SYNONYM_SEPARATOR
+    "description",
+    "cover_large",
+    "cover_medium",
+    "cover_color",
+)
+
+# Sort keys that can be answered from catalog columns (trending needs AniList)
+SORT_COLUMNS = {
+    "popularity": "popularity",
+    "score": "average_score",
+    "start_date": "start_date",
+}
+
+SYNONYM_SEPARATOR = "\x1f"
+MAX_GENRES = 64
+
+
+def pack_date(date: Optional[Dict[str, Optional[int]]]) -> int:
+    if not date:
+        return 0
+    return (date.get("year") or 0) * 10000 + (date.get("month") or 0) * 100 + (date.get("day") or 0)
+
+
+def unpack_date(value: int) -> Optional[Dict[str, Optional[int]]]:
+    if not value:
+        return None
+    year, month, day = value // 10000, value // 100 % 100, value % 100
+    return {"year": year or None, "month": month or None, "day": day or None}
+
+
+class CatalogBuilder:
+    """Accumulates raw AniList ``Media`` dicts column by column."""
+
+    def __init__(self, genres: Iterable[str] = ()):
+        self.genres: List[str] = []
+        self._genre_bits: Dict[str, int] = {}
+        for genre in genres:
+            self._intern_genre(genre)
+        self._numeric: Dict[str, list] = {name: [] for name in NUMERIC_COLUMNS}
+        self._strings: Dict[str, List[str]] = {name: [] for name in STRING_COLUMNS}
+        self._seen = set()
+
+    def _intern_genre(self, genre: str) -> int:
+        bit = self._genre_bits.get(genre)
+        if bit is None:
+            if len(self.genres) >= MAX_GENRES:
+                raise ValueError(f"Catalog supports at most {MAX_GENRES} genres")
+            bit = len(self.genres)
+            self.genres.append(sys.intern(genre))
+            self._genre_bits[genre] = bit
+        return bit
+
+    def add(self, media: Dict[str, Any]) -> None:
+        anime_id = media.get("id")
+        if anime_id is None or anime_id in self._seen:
+            return
+        self._seen.add(anime_id)
+
+        mask = 0
+        for genre in media.get("genres") or []:
+            mask |= 1 << self._intern_genre(genre)
+        status = media.get("status")
+        score = media.get("averageScore")
+        episodes = media.get("episodes")
+
+        numeric = self._numeric
+        numeric["id"].append(anime_id)
+        numeric["average_score"].append(-1 if score is None else score)
+        numeric["popularity"].append(media.get("popularity") or 0)
+        numeric["episodes"].append(-1 if episodes is None else episodes)
+        numeric["status"].append(STATUSES.index(status) + 1 if status in STATUSES else 0)
+        numeric["start_date"].append(pack_date(media.get("startDate")))
+        numeric["end_date"].append(pack_date(media.get("endDate")))
+        numeric["is_adult"].append(bool(media.get("isAdult")))
+        numeric["genre_mask"].append(mask)
+
+        title = media.get("title") or {}
+        cover = media.get("coverImage") or {}
+        strings = self._strings
+        strings["title_english"].append(title.get("english") or "")
+        strings["title_romaji"].append(title.get("romaji") or "")
+        strings["title_native"].append(title.get("native") or "")
+        strings["synonyms"].append(SYNONYM_SEPARATOR.join(media.get("synonyms") or []))
+        strings["description"].append(media.get("description") or "")
+        strings["cover_large"].append(cover.get("large") or "")
+        strings["cover_medium"].append(cover.get("medium") or "")
+        strings["cover_color"].append(cover.get("color") or "")
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def save(self, path: str) -> None:
+        """Write the catalog to ``path``, atomically replacing any previous one."""
+        ids = np.asarray(self._numeric["id"], dtype=NUMERIC_COLUMNS["id"])
+        order = np.argsort(ids, kind="stable")
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        for name, dtype in NUMERIC_COLUMNS.items():
+            column = np.asarray(self._numeric[name], dtype=dtype)[order]
+            np.save(os.path.join(tmp_path, f"{name}.npy"), column)
+
+        for name in STRING_COLUMNS:
+            values = self._strings[name]
+            encoded = [values[i].encode("utf-8") for i in order]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+            np.save(os.path.join(tmp_path, f"{name}.offsets.npy"), offsets)
+            np.save(os.path.join(tmp_path, f"{name}.data.npy"), blob)
+
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"count": len(ids), "genres": self.genres, "built_at": time.time()}, f)
+
+        # Workers that still map the old files keep their pages until they reload
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        logger.info(f"Saved catalog with {len(ids)} titles to {path}")
+
+
+class CatalogStore:
+    """Read side of the catalog: memory-mapped columns plus lazy AnimeBase views."""
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.genres: List[str] = []
+        self.genre_bits: Dict[str, int] = {}
+        self.columns: Dict[str, np.ndarray] = {}
+        self._string_offsets: Dict[str, np.ndarray] = {}
+        self._string_data: Dict[str, np.ndarray] = {}
+        self._views = TTLCache(max_size=2048)
+        self.version = 0
+
+    def load(self, path: str) -> bool:
+        """Map the catalog at ``path``; returns False if none has been built yet."""
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            logger.info(f"No catalog found at {path}")
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in NUMERIC_COLUMNS
+        }
+        self._string_offsets = {
+            name: np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r")
+            for name in STRING_COLUMNS
+        }
+        self._string_data = {
+            name: np.load(os.path.join(path, f"{name}.data.npy"), mmap_mode="r")
+            for name in STRING_COLUMNS
+        }
+        self.genres = [sys.intern(genre) for genre in meta["genres"]]
+        self.genre_bits = {genre: bit for bit, genre in enumerate(self.genres)}
+        self.path = path
+        self._views.clear()
+        self.version += 1
+        logger.info(f"Loaded catalog with {meta['count']} titles from {path}")
+        return True
+
+    def __len__(self) -> int:
+        ids = self.columns.get("id")
+        return 0 if ids is None else len(ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.columns["id"]
+
+    def row_of(self, anime_id: int) -> Optional[int]:
+        ids = self.columns.get("id")
+        if ids is None or not len(ids):
+            return None
+        row = int(np.searchsorted(ids, anime_id))
+        if row < len(ids) and ids[row] == anime_id:
+            return row
+        return None
+
+    def string(self, name: str, row: int) -> str:
+        offsets = self._string_offsets[name]
+        return self._string_data[name][offsets[row]:offsets[row + 1]].tobytes().decode("utf-8")
+
+    def synonyms(self, row: int) -> List[str]:
+        value = self.string("synonyms", row)
+        return value.split(SYNONYM_SEPARATOR) if value else []
+
+    def genres_of(self, row: int) -> List[str]:
+        mask = int(self.columns["genre_mask"][row])
+        return [genre for bit, genre in enumerate(self.genres) if mask >> bit & 1]
+
+    def genre_mask(self, genres: Iterable[str]) -> int:
+        """Bitmask for the known genres in ``genres``; unknown names are ignored."""
+        mask = 0
+        for genre in genres:
+            bit = self.genre_bits.get(genre)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def get(self, anime_id: int) -> Optional[AnimeBase]:
+        row = self.row_of(anime_id)
+        return None if row is None else self.view(row)
+
+    def view(self, row: int) -> AnimeBase:
+        """Materialize the AnimeBase for a row, reusing recently built views."""
+        cached = self._views.get(row)
+        if cached is not None:
+            return cached
+
+        columns = self.columns
+        score = int(columns["average_score"][row])
+        episodes = int(columns["episodes"][row])
+        status = int(columns["status"][row])
+        cover_large = self.string("cover_large", row)
+        cover_medium = self.string("cover_medium", row)
+        cover_color = self.string("cover_color", row)
+        # Catalog data was validated when it was harvested, so skip re-validation
+        anime = AnimeBase.model_construct(
+            id=int(columns["id"][row]),
+            title=self.string("title_english", row) or self.string("title_romaji", row) or "Unknown",
+            genres=self.genres_of(row),
+            description=self.string("description", row) or None,
+            averageScore=None if score < 0 else float(score),
+            coverImage={
+                "large": cover_large or None,
+                "medium": cover_medium or None,
+                "color": cover_color or "#000000",
+            } if cover_large or cover_medium else None,
+            episodes=None if episodes < 0 else episodes,
+            status=STATUSES[status - 1] if status else None,
+            startDate=unpack_date(int(columns["start_date"][row])),
+            endDate=unpack_date(int(columns["end_date"][row])),
+            nextAiringEpisode=None,
+            isAdult=bool(columns["is_adult"][row]),
+        )
+        self._views.set(row, anime)
+        return anime
+
+
+# Create a singleton instance
+catalog_store = CatalogStore()
+
+
+async def sync_catalog(service, path: str, per_page: int = 50, max_pages: Optional[int] = None) -> int:
+    """Harvest the AniList catalog page by page and save it to ``path``.
+
+    ``service`` is an AniListService; every page goes through its rate limiter.
+    """
+    builder = CatalogBuilder(await service.get_genres())
+    page = 1
+    while True:
+        media, has_next = await service.get_catalog_page(page, per_page)
+        for item in media:
+            builder.add(item)
+        logger.info(f"Catalog sync: page {page}, {len(builder)} titles")
+        if not has_next or (max_pages and page >= max_pages):
+            break
+        page += 1
+    builder.save(path)
+    return len(builder)
@@ -0,0 +1,107 @@
+from collections import deque
+from typing import Deque, Tuple
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker with half-open probing.
+
+    Outcomes are kept for a rolling ``window`` of seconds. Once at least
+    ``minimum_calls`` outcomes are recorded and the failure rate reaches
+    ``failure_rate_threshold``, the circuit opens and calls fail fast for
+    ``open_duration`` seconds. After that up to ``half_open_max_calls``
+    probes are let through: a success closes the circuit, a failure opens
+    it again. A call that ends with neither must ``release`` its probe.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        minimum_calls: int = 10,
+        window: float = 60,
+        open_duration: float = 30,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.window = window
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_duration:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        if self._state == self.CLOSED:
+            return 0.0
+        return max(0.0, self.open_duration - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> None:
+        """Reserve a call, raising CircuitOpenError if the circuit rejects it."""
+        state = self.state
+        if state == self.OPEN:
+            raise CircuitOpenError(self.name, self.retry_after)
+        if state == self.HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                raise CircuitOpenError(self.name, self.retry_after)
+            self._probes += 1
+
+    def release(self) -> None:
+        """Give back a call reserved by ``allow`` that ended with no outcome, e.g. cancelled."""
+        if self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_success(self) -> None:
+        if self._state == self.HALF_OPEN:
+            logger.info(f"Circuit '{self.name}' closed after successful probe")
+            self._state = self.CLOSED
+            self._outcomes.clear()
+        self._record(True)
+
+    def record_failure(self) -> None:
+        if self._state == self.HALF_OPEN:
+            self._open()
+            return
+        self._record(False)
+        if self._state == self.CLOSED and len(self._outcomes) >= self.minimum_calls:
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if failures / len(self._outcomes) >= self.failure_rate_threshold:
+                self._open()
+
+    def _record(self, ok: bool) -> None:
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self) -> None:
+        logger.warning(f"Circuit '{self.name}' opened for {self.open_duration}s")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
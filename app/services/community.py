@@ -0,0 +1,211 @@
+"""Aggregates of what our own users watch and rate.
+
+``anime_community_stats`` holds one row per anime on anyone's list:
+- members, and the count for each list status;
+- favorites (rated 8 or more, as in ``/user/favorites``);
+- the rating sum and count, from which Postgres derives the mean.
+
+Many paths write ``watched_anime``: single adds, batch upserts, imports
+and favorite toggles. So rather than having each of them keep the table
+in step, the periodic ``refresh_community_stats`` job recounts only the
+anime whose rows changed since the last refresh: rows updated after the
+newest ``last_activity_at`` already counted, minus
+``COMMUNITY_STATS_OVERLAP`` seconds for transactions that committed late.
+Recounting an anime is idempotent, so the overlap costs a little work and
+nothing else. An empty table, or ``full=True``, recounts everything.
+
+Leaderboards read the top of an index on the ranked column, so their cost
+doesn't grow with the number of users or titles. ``CommunitySnapshot``
+keeps the columns the ranker and recommender need in memory. It is
+reloaded every ``COMMUNITY_STATS_INTERVAL`` seconds, like the data behind
+it.
+"""
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import logging
+import threading
+
+import numpy as np
+from sqlalchemy import delete, func, literal, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models.aggregates import AnimeCommunityStats
+from app.models.user import WatchedAnime
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("watching", "completed", "on_hold", "dropped", "plan_to_watch")
+FAVORITE_RATING = 8
+
+LEADERBOARDS = {
+    "members": AnimeCommunityStats.members,
+    "favorites": AnimeCommunityStats.favorites,
+    "watching": AnimeCommunityStats.watching,
+    "completed": AnimeCommunityStats.completed,
+    "rating": AnimeCommunityStats.mean_rating,
+}
+
+
+# Columns filled by a refresh, in the order _counts selects them
+COUNTED = [
+    "anime_id", "members", *STATUSES, "favorites", "rating_sum", "rated_count", "last_activity_at", "refreshed_at",
+]
+
+
+def _counts(now: datetime):
+    """Per-anime totals over ``watched_anime``."""
+    return select(
+        WatchedAnime.anime_id,
+        func.count(),
+        *[func.count().filter(WatchedAnime.status == status) for status in STATUSES],
+        func.count().filter(WatchedAnime.rating >= FAVORITE_RATING),
+        func.coalesce(func.sum(WatchedAnime.rating), 0.0),
+        func.count(WatchedAnime.rating),
+        func.max(WatchedAnime.updated_at),
+        literal(now),
+    ).where(WatchedAnime.anime_id.isnot(None)).group_by(WatchedAnime.anime_id)
+
+
+def refresh_community_stats(db: Session, full: bool = False, overlap: float = 300) -> int:
+    """Recount the anime changed since the last refresh, or all of them; returns how many. The caller commits."""
+    since = None if full else db.query(func.max(AnimeCommunityStats.last_activity_at)).scalar()
+    counts = _counts(datetime.utcnow())
+    if since is None:
+        # Also drops anime that are no longer on any list
+        db.execute(delete(AnimeCommunityStats))
+    else:
+        changed = select(WatchedAnime.anime_id).where(WatchedAnime.updated_at >= since - timedelta(seconds=overlap))
+        counts = counts.where(WatchedAnime.anime_id.in_(changed))
+    statement = insert(AnimeCommunityStats).from_select(COUNTED, counts)
+    statement = statement.on_conflict_do_update(
+        index_elements=[AnimeCommunityStats.anime_id],
+        set_={column: statement.excluded[column] for column in COUNTED[1:]},
+    )
+    count = db.execute(statement).rowcount
+    logger.info(f"Refreshed community stats for {count} anime" + (" (full)" if since is None else f" changed since {since}"))
+    return count
+
+
+def leaderboard(db: Session, by: str, limit: int = 20, min_ratings: int = 1) -> List[AnimeCommunityStats]:
+    """The top ``limit`` anime by a ``LEADERBOARDS`` column; by rating, only those rated ``min_ratings`` times."""
+    query = db.query(AnimeCommunityStats)
+    if by == "rating":
+        # Leaves out unrated titles, whose mean is NULL
+        query = query.filter(AnimeCommunityStats.rated_count >= max(min_ratings, 1))
+    return query.order_by(LEADERBOARDS[by].desc(), AnimeCommunityStats.anime_id).limit(limit).all()
+
+
+def ensure_activity_index(engine) -> None:
+    """Index ``watched_anime.updated_at``, which delta refreshes filter on, in databases created before it."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        exists = connection.execute(text(
+            "SELECT 1 FROM pg_indexes WHERE tablename = 'watched_anime' AND indexname = 'ix_watched_anime_updated_at'"
+        )).first()
+        if not exists:
+            connection.execute(text("CREATE INDEX ix_watched_anime_updated_at ON watched_anime (updated_at)"))
+
+
+class _Columns(NamedTuple):
+    ids: np.ndarray  # sorted
+    members: np.ndarray
+    rating_sum: np.ndarray
+    rated_count: np.ndarray
+
+
+class CommunitySnapshot:
+    """In-memory copy of the community stats the recommendation code reads."""
+
+    def __init__(self):
+        self.replace((), (), (), ())
+        self.loaded_at: Optional[datetime] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self.columns.ids)
+
+    def load(self, db: Session) -> int:
+        rows = db.execute(
+            select(
+                AnimeCommunityStats.anime_id,
+                AnimeCommunityStats.members,
+                AnimeCommunityStats.rating_sum,
+                AnimeCommunityStats.rated_count,
+            ).order_by(AnimeCommunityStats.anime_id)
+        ).all()
+        self.replace(*(list(zip(*rows)) or [()] * 4))
+        return len(rows)
+
+    def replace(self, ids: Sequence[int], members: Sequence[int], rating_sum: Sequence[float], rated_count: Sequence[int]) -> None:
+        """Swap in new columns, with ``ids`` sorted."""
+        # One attribute, so readers never see columns from two different loads
+        self.columns = _Columns(
+            np.asarray(ids, dtype=np.int64),
+            np.asarray(members, dtype=np.int64),
+            np.asarray(rating_sum, dtype=np.float64),
+            np.asarray(rated_count, dtype=np.int64),
+        )
+        self.loaded_at = datetime.utcnow()
+
+    def appeal(self, anime_ids: np.ndarray, min_ratings: int) -> np.ndarray:
+        """How much our users like each title: log members times the rating, 0 for titles on nobody's list.
+
+        The rating is a Bayesian average, shrunk towards the site-wide mean by
+        ``min_ratings`` pseudo-ratings, so a title rated once or twice can't top
+        well-established ones.
+        """
+        columns = self.columns
+        appeal = np.zeros(len(anime_ids), dtype=np.float32)
+        if not len(columns.ids):
+            return appeal
+        rows = np.minimum(np.searchsorted(columns.ids, anime_ids), len(columns.ids) - 1)
+        known = columns.ids[rows] == anime_ids
+        rows = rows[known]
+        total_ratings = columns.rated_count.sum()
+        site_mean = columns.rating_sum.sum() / total_ratings if total_ratings else 5.5
+        prior = max(min_ratings, 1)
+        rating = (columns.rating_sum[rows] + prior * site_mean) / (columns.rated_count[rows] + prior)
+        appeal[known] = np.log1p(columns.members[rows]) * rating / 10.0
+        return appeal
+
+    def most_listed(self, limit: int) -> List[Tuple[int, int]]:
+        """The ``limit`` titles on the most lists, as (anime ID, members), most first."""
+        columns = self.columns
+        if len(columns.ids) > limit:
+            rows = np.argpartition(-columns.members, limit - 1)[:limit]
+        else:
+            rows = np.arange(len(columns.ids))
+        rows = rows[np.argsort(-columns.members[rows], kind="stable")]
+        return [(int(columns.ids[row]), int(columns.members[row])) for row in rows]
+
+    def start(self, interval: float) -> None:
+        """Reload from a read session every ``interval`` seconds, starting now."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="community-stats", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run(self, interval: float) -> None:
+        from app.db.session import read_session
+
+        while not self._stop.is_set():
+            db = read_session()
+            try:
+                self.load(db)
+            except Exception as e:
+                logger.warning(f"Loading community stats failed: {str(e)}")
+            finally:
+                db.close()
+            self._stop.wait(interval)
+
+
+# Create a singleton instance
+community_snapshot = CommunitySnapshot()
@@ -0,0 +1,123 @@
+"""Inverted genre index over the local catalog.
+
+Each genre has a packed bitset with one bit per catalog row, so AND/OR/NOT
+genre queries are a handful of vectorized byte operations. Rows are
+pre-sorted once per sort key, and a query walks that ordering keeping only
+the selected rows, which gives exactly ``limit`` results without any
+post-filtering.
+"""
+from typing import Dict, Iterable, List, Optional
+import logging
+
+import numpy as np
+
+from app.schemas.anime import AnimeBase
+from app.services.catalog import SORT_COLUMNS, CatalogStore, catalog_store
+
+logger = logging.getLogger(__name__)
+
+# Set-bit count for every byte value, used for facet counts
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+class GenreIndex:
+    def __init__(self, store: CatalogStore):
+        self.store = store
+        self._version = None
+        self._size = 0
+        self._bitsets: Dict[str, np.ndarray] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.uint8)
+        self._orders: Dict[str, np.ndarray] = {}
+
+    def _ensure_current(self) -> None:
+        """Rebuild when the catalog has been (re)loaded since the last build."""
+        if self._version == self.store.version:
+            return
+        masks = self.store.columns.get("genre_mask")
+        if masks is None:
+            self._bitsets, self._orders, self._size = {}, {}, 0
+            self._matrix = np.zeros((0, 0), dtype=np.uint8)
+        else:
+            self._size = len(masks)
+            # One packed row per genre, in genre-table (bit) order
+            self._matrix = np.stack([
+                np.packbits((masks >> np.uint64(bit)) & np.uint64(1) == 1)
+                for bit in range(len(self.store.genres))
+            ]) if self.store.genres else np.zeros((0, (self._size + 7) // 8), dtype=np.uint8)
+            self._bitsets = dict(zip(self.store.genres, self._matrix))
+            # Descending, ties broken by catalog (ID) order
+            self._orders = {
+                sort_type: np.argsort(-np.asarray(self.store.columns[column], dtype=np.int64), kind="stable")
+                for sort_type, column in SORT_COLUMNS.items()
+            }
+            logger.info(f"Built genre index over {self._size} titles, {len(self._bitsets)} genres")
+        self._version = self.store.version
+
+    @property
+    def available(self) -> bool:
+        self._ensure_current()
+        return self._size > 0
+
+    def supports(self, sort_type: str) -> bool:
+        return sort_type in SORT_COLUMNS and self.available
+
+    def select(
+        self,
+        genres: Optional[Iterable[str]] = None,
+        match: str = "any",
+        exclude: Optional[Iterable[str]] = None,
+    ) -> np.ndarray:
+        """Packed bitset of rows matching the genre query.
+
+        ``match="any"`` ORs the requested genres (AniList's ``genre_in``),
+        ``match="all"`` ANDs them; rows with any excluded genre are removed.
+        Unknown genres match nothing.
+        """
+        self._ensure_current()
+        empty = np.zeros((self._size + 7) // 8, dtype=np.uint8)
+        genres = list(genres or [])
+        if not genres:
+            # Clear the padding bits past the last row
+            selected = np.packbits(np.ones(self._size, dtype=bool))
+        elif match == "all":
+            selected = ~empty
+            for genre in genres:
+                selected &= self._bitsets.get(genre, empty)
+        else:
+            selected = empty.copy()
+            for genre in genres:
+                selected |= self._bitsets.get(genre, empty)
+        for genre in exclude or []:
+            bitset = self._bitsets.get(genre)
+            if bitset is not None:
+                selected &= ~bitset
+        return selected
+
+    def query(
+        self,
+        sort_type: str,
+        genres: Optional[Iterable[str]] = None,
+        match: str = "any",
+        exclude: Optional[Iterable[str]] = None,
+        limit: int = 20,
+    ) -> List[AnimeBase]:
+        """Top ``limit`` matching titles by ``sort_type``."""
+        selected = np.unpackbits(self.select(genres, match, exclude), count=self._size).view(bool)
+        order = self._orders[sort_type]
+        rows = order[selected[order]][:limit]
+        return [self.store.view(int(row)) for row in rows]
+
+    def facets(
+        self,
+        genres: Optional[Iterable[str]] = None,
+        match: str = "any",
+        exclude: Optional[Iterable[str]] = None,
+    ) -> Dict[str, int]:
+        """Number of matching titles carrying each genre."""
+        selected = self.select(genres, match, exclude)
+        counts = _POPCOUNT[self._matrix & selected].sum(axis=1)
+        return dict(zip(self._bitsets, counts.tolist()))
+
+
+# Create a singleton instance
+genre_index = GenreIndex(catalog_store)
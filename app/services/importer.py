@@ -0,0 +1,325 @@
+"""Streaming import of MyAnimeList XML and AniList JSON list exports.
+
+Exports are read incrementally (``iterparse`` for XML, a chunked
+``raw_decode`` scanner for the AniList ``entries`` arrays), optionally
+through gzip, and written to ``watched_anime`` in fixed-size batches, each
+in its own transaction. Only one batch is held in memory at a time.
+
+Imports run in the web process unless ``IMPORT_USE_JOB_QUEUE`` is set.
+Their progress then lives in ``import_jobs``, which is per process, so
+polling needs sticky routing to the worker that took the upload; queued
+imports keep theirs in the jobs table instead. Finished jobs stay
+pollable for ``IMPORT_JOB_TTL`` seconds.
+"""
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, TextIO
+import gzip
+import io
+import json
+import logging
+import re
+import time
+import uuid
+import xml.etree.ElementTree as ElementTree
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.anilist import anilist_service
+from app.services.cache import TTLCache
+from app.services.catalog import catalog_store
+from app.services.user_versions import user_versions
+from app.services.watched import upsert_watched_anime
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("auto", "mal", "anilist")
+
+MAL_STATUSES = {
+    "watching": "watching",
+    "completed": "completed",
+    "on-hold": "on_hold",
+    "dropped": "dropped",
+    "plan to watch": "plan_to_watch",
+    # Numeric codes used by some MAL exports
+    "1": "watching",
+    "2": "completed",
+    "3": "on_hold",
+    "4": "dropped",
+    "6": "plan_to_watch",
+}
+
+ANILIST_STATUSES = {
+    "CURRENT": "watching",
+    "REPEATING": "watching",
+    "COMPLETED": "completed",
+    "PAUSED": "on_hold",
+    "DROPPED": "dropped",
+    "PLANNING": "plan_to_watch",
+}
+
+# AniList score formats and the factor that brings them onto our 1-10 scale
+SCORE_SCALES = {
+    "POINT_100": 0.1,
+    "POINT_10_DECIMAL": 1.0,
+    "POINT_10": 1.0,
+    "POINT_5": 2.0,
+    "POINT_3": 10 / 3,
+}
+
+_ENTRIES_RE = re.compile(r'"entries"\s*:\s*\[')
+_CHUNK_SIZE = 64 * 1024
+
+
+class ImportJob:
+    """Progress of one import, polled through GET /user/import/{job_id}."""
+
+    def __init__(self, user_id: int, source: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.source = source
+        self.status = "pending"  # pending, running, completed, failed
+        self.processed = 0
+        self.imported = 0
+        self.skipped = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "processed": self.processed,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "error": self.error,
+        }
+
+
+# In-process registry of recent import jobs; a job's entry expires IMPORT_JOB_TTL after it finishes
+import_jobs = TTLCache(max_size=10000, default_ttl=60 * 60 * 24)
+
+
+def open_export(fileobj: BinaryIO) -> BinaryIO:
+    """Transparently decompress gzip input."""
+    if fileobj.read(2) == b"\x1f\x8b":
+        fileobj.seek(0)
+        return gzip.GzipFile(fileobj=fileobj)
+    fileobj.seek(0)
+    return fileobj
+
+
+def detect_format(stream: BinaryIO) -> str:
+    """Peek at the first non-blank byte: ``<`` is MAL XML, ``{``/``[`` AniList JSON."""
+    head = stream.peek(64) if hasattr(stream, "peek") else b""
+    stripped = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if stripped.startswith(b"<"):
+        return "mal"
+    if stripped[:1] in (b"{", b"["):
+        return "anilist"
+    raise ValueError("Unrecognized export format")
+
+
+def normalize_score(score: Any, scale: float = 1.0) -> Optional[int]:
+    """Convert a score to our 1-10 integer rating; 0 or missing means unrated."""
+    try:
+        value = float(score) * scale
+    except (TypeError, ValueError):
+        return None
+    if value <= 0:
+        return None
+    return max(1, min(10, round(value)))
+
+
+def iter_mal_entries(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Yield entries from a MyAnimeList XML export, keyed by MAL ID."""
+    context = ElementTree.iterparse(stream, events=("start", "end"))
+    _, root = next(context)
+    for event, element in context:
+        if event != "end" or element.tag != "anime":
+            continue
+        mal_id = element.findtext("series_animedb_id")
+        if mal_id and mal_id.strip().isdigit():
+            status = (element.findtext("my_status") or "").strip().lower()
+            yield {
+                "mal_id": int(mal_id),
+                "title": (element.findtext("series_title") or "").strip(),
+                "status": MAL_STATUSES.get(status),
+                "episodes_watched": int(element.findtext("my_watched_episodes") or 0),
+                "rating": normalize_score(element.findtext("my_score")),
+                "notes": (element.findtext("my_comments") or "").strip() or None,
+            }
+        # Drop parsed elements so memory stays flat
+        element.clear()
+        root.clear()
+
+
+def iter_json_array_items(stream: TextIO, key_pattern: re.Pattern = _ENTRIES_RE) -> Iterator[Any]:
+    """Yield the items of every JSON array opened by ``key_pattern``, reading in chunks.
+
+    A document whose top level is an array yields that array's items instead.
+    Only the current item and one read chunk are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, in_array, eof = "", 0, False, False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, eof
+        chunk = stream.read(_CHUNK_SIZE)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    read_more()
+    if buffer.lstrip("﻿ \t\r\n").startswith("["):
+        position = buffer.index("[") + 1
+        in_array = True
+
+    while True:
+        if not in_array:
+            match = key_pattern.search(buffer, position)
+            if match:
+                position, in_array = match.end(), True
+                continue
+            # Keep a tail in case the key straddles two chunks
+            position = max(position, len(buffer) - 64)
+            if not read_more():
+                return
+            continue
+
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position >= len(buffer):
+            if not read_more():
+                raise ValueError("Export ended inside a list")
+            continue
+        if buffer[position] == "]":
+            position += 1
+            in_array = False
+            continue
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof or not read_more():
+                raise ValueError("Export contains an invalid or truncated entry")
+            continue
+        yield item
+
+
+def iter_anilist_entries(stream: BinaryIO, score_format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield entries from an AniList ``MediaListCollection`` JSON export."""
+    scale = SCORE_SCALES.get(score_format or "", 1.0)
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    for item in iter_json_array_items(text):
+        if not isinstance(item, dict):
+            continue
+        media = item.get("media") or {}
+        anime_id = item.get("mediaId") or media.get("id")
+        if not anime_id:
+            continue
+        title = media.get("title") or {}
+        score = item.get("score")
+        # Without a known format, anything above 10 must be on the 100-point scale
+        item_scale = 0.1 if score_format is None and isinstance(score, (int, float)) and score > 10 else scale
+        yield {
+            "anime_id": int(anime_id),
+            "title": title.get("english") or title.get("romaji") or title.get("userPreferred") or "",
+            "status": ANILIST_STATUSES.get(item.get("status")),
+            "episodes_watched": int(item.get("progress") or 0),
+            "rating": normalize_score(score, item_scale),
+            "notes": item.get("notes") or None,
+        }
+
+
+def iter_batches(entries: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _resolve_batch(batch: List[Dict[str, Any]], source: str) -> List[Dict[str, Any]]:
+    """Turn parsed entries into WatchedAnime rows, mapping MAL IDs to AniList IDs."""
+    if source == "mal":
+        mapping = await anilist_service.get_ids_by_mal_ids([entry["mal_id"] for entry in batch])
+        resolved = []
+        for entry in batch:
+            match = mapping.get(entry.pop("mal_id"))
+            if match:
+                anime_id, title = match
+                resolved.append({**entry, "anime_id": anime_id, "title": entry["title"] or title})
+        batch = resolved
+
+    rows: Dict[int, Dict[str, Any]] = {}
+    for entry in batch:
+        if not entry["title"]:
+            row = catalog_store.row_of(entry["anime_id"])
+            if row is not None:
+                entry["title"] = catalog_store.view(row).title
+        entry["title"] = (entry["title"] or "Unknown")[:255]
+        # Later duplicates win, and one upsert can't touch the same row twice
+        rows[entry["anime_id"]] = entry
+    return list(rows.values())
+
+
+def _write_batch(user_id: int, rows: List[Dict[str, Any]]) -> int:
+    db = SessionLocal()
+    try:
+        results = upsert_watched_anime(db, user_id, rows)
+        user_versions.touch(db, user_id)
+        db.commit()
+        return len(results)
+    finally:
+        db.close()
+
+
+async def run_import(
+    job: ImportJob,
+    fileobj: BinaryIO,
+    source: str = "auto",
+    batch_size: int = 500,
+    score_format: Optional[str] = None,
+) -> ImportJob:
+    """Parse an export and upsert it into the job user's watched list, batch by batch."""
+    job.status = "running"
+    try:
+        stream = open_export(fileobj)
+        if not hasattr(stream, "peek"):
+            stream = io.BufferedReader(stream)
+        if source == "auto":
+            source = detect_format(stream)
+        job.source = source
+        entries = iter_mal_entries(stream) if source == "mal" else iter_anilist_entries(stream, score_format)
+        batches = iter_batches(entries, batch_size)
+
+        while True:
+            # Parsing reads the file, so keep it off the event loop
+            batch = await run_in_threadpool(next, batches, None)
+            if batch is None:
+                break
+            job.processed += len(batch)
+            rows = await _resolve_batch(batch, source)
+            if rows:
+                job.imported += await run_in_threadpool(_write_batch, job.user_id, rows)
+            job.skipped = job.processed - job.imported
+            logger.info(f"Import {job.id}: {job.processed} processed, {job.imported} imported")
+        job.status = "completed"
+    except Exception as e:
+        logger.error(f"Import {job.id} failed: {str(e)}", exc_info=True)
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = time.time()
+        fileobj.close()
+        if import_jobs.get(job.id) is job:
+            import_jobs.set(job.id, job, ttl=settings.IMPORT_JOB_TTL)
+    return job
@@ -0,0 +1,413 @@
+"""Durable background jobs on Postgres.
+
+``enqueue`` adds a row to ``jobs``; worker processes (``python -m app.cli
+worker``) claim due rows with ``UPDATE ... WHERE id IN (SELECT ... FOR
+UPDATE SKIP LOCKED)``, so concurrent workers never wait on or double-claim
+a job and throughput grows with the number of workers.
+
+- Priorities: higher ``priority`` runs first, then earlier ``run_at``.
+- Deduplication: while a job with a ``dedup_key`` is queued or running,
+  enqueueing the same key returns the existing job instead.
+- Retries: a failed attempt is requeued with exponential backoff and
+  jitter until ``max_attempts``, then left ``failed`` with its error.
+- Visibility timeout: a running job is locked until ``locked_until``,
+  which its worker extends while it runs. If the worker dies, another
+  worker claims the job once the lock lapses.
+- Schedules: kinds registered with ``every`` are queued by the workers
+  themselves, due ``every`` seconds later, under a dedup key, so
+  however many workers run there is at most one pending run.
+
+Handlers are registered with ``@job_handler(kind)`` and receive a
+``JobContext`` and the JSON payload.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+
+
+@dataclass
+class JobKind:
+    name: str
+    func: Callable[["JobContext", Dict[str, Any]], Awaitable[Any]]
+    max_attempts: int
+    timeout: float  # seconds one attempt may run
+    every: Optional[float] = None  # seconds between scheduled runs; None only runs when enqueued
+
+
+JOB_KINDS: Dict[str, JobKind] = {}
+
+
+def job_handler(kind: str, max_attempts: Optional[int] = None, timeout: float = 60 * 60, every: Optional[float] = None):
+    """Register an async function ``(context, payload) -> result`` as the handler for ``kind``."""
+    def register(func):
+        JOB_KINDS[kind] = JobKind(kind, func, max_attempts or settings.JOB_MAX_ATTEMPTS, timeout, every)
+        return func
+    return register
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[Dict[str, Any]] = None,
+    priority: int = 0,
+    dedup_key: Optional[str] = None,
+    delay: float = 0,
+    max_attempts: Optional[int] = None,
+) -> int:
+    """Queue a job and return its ID; the caller commits.
+
+    With a ``dedup_key`` that a queued or running job already has, nothing
+    is inserted and that job's ID is returned.
+    """
+    if max_attempts is None:
+        max_attempts = JOB_KINDS[kind].max_attempts if kind in JOB_KINDS else settings.JOB_MAX_ATTEMPTS
+    now = datetime.utcnow()
+    statement = insert(Job).values(
+        kind=kind,
+        payload=payload or {},
+        status="queued",
+        priority=priority,
+        dedup_key=dedup_key,
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=now + timedelta(seconds=delay),
+        created_at=now,
+        updated_at=now,
+    ).on_conflict_do_nothing(
+        index_elements=[Job.dedup_key],
+        index_where=text("status IN ('queued', 'running') AND dedup_key IS NOT NULL"),
+    ).returning(Job.id)
+    while True:
+        job_id = db.execute(statement).scalar()
+        if job_id is not None or dedup_key is None:
+            return job_id
+        job_id = db.query(Job.id).filter(Job.dedup_key == dedup_key, Job.status.in_(ACTIVE)).scalar()
+        # Otherwise the duplicate finished in between and the insert can go ahead
+        if job_id is not None:
+            return job_id
+
+
+def claim(db: Session, worker_id: str, limit: int, visibility_timeout: float, kinds: Optional[Iterable[str]] = None) -> List[Any]:
+    """Lock up to ``limit`` due jobs for ``worker_id``; the caller commits."""
+    now = datetime.utcnow()
+    due = select(Job.id).where(or_(
+        and_(Job.status == "queued", Job.run_at <= now),
+        and_(Job.status == "running", Job.locked_until < now),
+    ))
+    if kinds:
+        due = due.where(Job.kind.in_(list(kinds)))
+    due = due.order_by(Job.priority.desc(), Job.run_at).limit(limit).with_for_update(skip_locked=True)
+    statement = update(Job).where(Job.id.in_(due.scalar_subquery())).values(
+        status="running",
+        attempts=Job.attempts + 1,
+        locked_by=worker_id,
+        locked_until=now + timedelta(seconds=visibility_timeout),
+        updated_at=now,
+    ).returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+    return list(db.execute(statement, execution_options={"synchronize_session": False}))
+
+
+def _update_own(db: Session, job_id: int, worker_id: str, **values) -> bool:
+    """Update a job only while ``worker_id`` still holds it (its lock may have lapsed to another worker)."""
+    statement = update(Job).where(
+        Job.id == job_id, Job.locked_by == worker_id, Job.status == "running"
+    ).values(updated_at=datetime.utcnow(), **values)
+    return db.execute(statement, execution_options={"synchronize_session": False}).rowcount > 0
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the retry after ``attempt``."""
+    delay = min(settings.JOB_RETRY_MAX_DELAY, settings.JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def complete(db: Session, job_id: int, worker_id: str, result: Any = None) -> bool:
+    now = datetime.utcnow()
+    return _update_own(db, job_id, worker_id, status="succeeded", result=result, locked_until=None, finished_at=now)
+
+
+def fail(db: Session, job_id: int, worker_id: str, error: str, attempts: int, max_attempts: int, retry: bool = True) -> bool:
+    """Requeue the job with backoff, or mark it failed once it is out of attempts."""
+    now = datetime.utcnow()
+    if retry and attempts < max_attempts:
+        return _update_own(
+            db, job_id, worker_id, status="queued", last_error=error, locked_by=None, locked_until=None,
+            run_at=now + timedelta(seconds=retry_delay(attempts)),
+        )
+    return _update_own(db, job_id, worker_id, status="failed", last_error=error, locked_until=None, finished_at=now)
+
+
+def extend_locks(db: Session, job_ids: List[int], worker_id: str, visibility_timeout: float) -> int:
+    now = datetime.utcnow()
+    statement = update(Job).where(
+        Job.id.in_(job_ids), Job.locked_by == worker_id, Job.status == "running"
+    ).values(locked_until=now + timedelta(seconds=visibility_timeout))
+    return db.execute(statement, execution_options={"synchronize_session": False}).rowcount
+
+
+def prune(db: Session, older_than: timedelta) -> int:
+    """Delete finished jobs older than ``older_than``."""
+    statement = Job.__table__.delete().where(
+        Job.status.in_(("succeeded", "failed")), Job.finished_at < datetime.utcnow() - older_than
+    )
+    return db.execute(statement).rowcount
+
+
+def schedule(db: Session, kinds: Iterable[JobKind]) -> None:
+    """Queue the next run of each periodic kind unless one is already queued or running."""
+    for kind in kinds:
+        enqueue(db, kind.name, dedup_key=f"schedule:{kind.name}", delay=kind.every)
+
+
+def _in_session(func, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        result = func(db, *args, **kwargs)
+        db.commit()
+        return result
+    finally:
+        db.close()
+
+
+class JobContext:
+    """What a handler knows about the attempt it is running."""
+
+    def __init__(self, job_id: int, attempt: int, max_attempts: int, worker_id: str):
+        self.job_id = job_id
+        self.attempt = attempt
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id
+
+    @property
+    def final_attempt(self) -> bool:
+        return self.attempt >= self.max_attempts
+
+    async def report(self, progress: Dict[str, Any]) -> None:
+        """Store progress for pollers to read from the job row."""
+        await run_in_threadpool(_in_session, _update_own, self.job_id, self.worker_id, progress=progress)
+
+
+class JobWorker:
+    """Runs up to ``concurrency`` jobs at a time in this process until stopped."""
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        kinds: Optional[List[str]] = None,
+        poll_interval: float = 1.0,
+        visibility_timeout: float = 300,
+    ):
+        self.concurrency = concurrency
+        self.kinds = kinds
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.running: Dict[int, asyncio.Task] = {}
+        self.processed = 0
+        self._stopping = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._scheduled: Dict[str, float] = {}  # kind -> when this worker last queued its next run
+
+    def stop(self) -> None:
+        """Stop claiming jobs; ``run`` returns once the running ones finish."""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        heartbeat = asyncio.ensure_future(self._heartbeat())
+        logger.info(f"Worker {self.worker_id} started with concurrency {self.concurrency}")
+        last_prune = 0.0
+        try:
+            while not self._stopping:
+                self._wakeup.clear()
+                free = self.concurrency - len(self.running)
+                claimed = []
+                if free > 0:
+                    try:
+                        claimed = await run_in_threadpool(
+                            _in_session, claim, self.worker_id, free, self.visibility_timeout, self.kinds
+                        )
+                    except Exception:
+                        logger.exception("Claiming jobs failed")
+                for job in claimed:
+                    self.running[job.id] = asyncio.ensure_future(self._execute(job))
+                if time.monotonic() - last_prune > 60 * 60:
+                    last_prune = time.monotonic()
+                    await self._prune()
+                await self._schedule()
+                # A full batch means more may be waiting; otherwise wait for a slot or the next poll
+                if free > 0 and len(claimed) == free:
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if self.running:
+                logger.info(f"Worker {self.worker_id} waiting for {len(self.running)} running jobs")
+                await asyncio.gather(*self.running.values(), return_exceptions=True)
+        finally:
+            heartbeat.cancel()
+
+    async def _execute(self, job) -> None:
+        kind = JOB_KINDS.get(job.kind)
+        try:
+            if kind is None:
+                await run_in_threadpool(
+                    _in_session, fail, job.id, self.worker_id, f"No handler for job kind {job.kind!r}",
+                    job.attempts, job.max_attempts, retry=False
+                )
+                return
+            if job.attempts > job.max_attempts:
+                # Reclaimed after its worker stopped heartbeating once too often
+                await run_in_threadpool(
+                    _in_session, fail, job.id, self.worker_id, "Worker lost while running the last attempt",
+                    job.attempts, job.max_attempts, retry=False
+                )
+                return
+            context = JobContext(job.id, job.attempts, job.max_attempts, self.worker_id)
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(kind.func(context, job.payload or {}), kind.timeout)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+                logger.warning(f"Job {job.id} ({job.kind}) attempt {job.attempts}/{job.max_attempts} failed: {error}")
+                await run_in_threadpool(_in_session, fail, job.id, self.worker_id, error, job.attempts, job.max_attempts)
+                return
+            await run_in_threadpool(_in_session, complete, job.id, self.worker_id, result)
+            logger.info(f"Job {job.id} ({job.kind}) succeeded in {time.perf_counter() - started:.1f}s")
+        except Exception:
+            # Recording the outcome failed; the lock lapses and the job is retried elsewhere
+            logger.exception(f"Could not record the outcome of job {job.id}")
+        finally:
+            self.processed += 1
+            self.running.pop(job.id, None)
+            self._wakeup.set()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            if not self.running:
+                continue
+            try:
+                await run_in_threadpool(
+                    _in_session, extend_locks, list(self.running), self.worker_id, self.visibility_timeout
+                )
+            except Exception:
+                logger.exception("Extending job locks failed")
+
+    async def _schedule(self) -> None:
+        now = time.monotonic()
+        due = [
+            kind for kind in JOB_KINDS.values()
+            if kind.every and (self.kinds is None or kind.name in self.kinds)
+            and (kind.name not in self._scheduled or now - self._scheduled[kind.name] >= kind.every)
+        ]
+        if not due:
+            return
+        for kind in due:
+            self._scheduled[kind.name] = now
+        try:
+            await run_in_threadpool(_in_session, schedule, due)
+        except Exception:
+            logger.exception("Scheduling periodic jobs failed")
+
+    async def _prune(self) -> None:
+        try:
+            deleted = await run_in_threadpool(_in_session, prune, timedelta(days=settings.JOB_RETENTION_DAYS))
+            if deleted:
+                logger.info(f"Pruned {deleted} finished jobs")
+        except Exception:
+            logger.exception("Pruning finished jobs failed")
+
+
+# Built-in jobs; imports are deferred so workers only load what they run
+
+@job_handler("sync_catalog", max_attempts=3, timeout=6 * 60 * 60)
+async def sync_catalog_job(context: JobContext, payload: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.anilist import anilist_service
+    from app.services.catalog import sync_catalog
+
+    path = payload.get("path", settings.CATALOG_PATH)
+    count = await sync_catalog(
+        anilist_service, path, per_page=payload.get("per_page", 50), max_pages=payload.get("max_pages")
+    )
+    return {"path": path, "count": count}
+
+
+@job_handler("sync_rec_graph", max_attempts=3, timeout=6 * 60 * 60)
+async def sync_rec_graph_job(context: JobContext, payload: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.anilist import anilist_service
+    from app.services.rec_graph import sync_rec_graph
+
+    path = payload.get("path", settings.REC_GRAPH_PATH)
+    nodes, edges = await sync_rec_graph(
+        anilist_service, path, per_page=payload.get("per_page", 50), max_pages=payload.get("max_pages")
+    )
+    return {"path": path, "nodes": nodes, "edges": edges}
+
+
+@job_handler(
+    "refresh_community_stats", max_attempts=3, timeout=30 * 60, every=settings.COMMUNITY_STATS_INTERVAL or None
+)
+async def refresh_community_stats_job(context: JobContext, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Recount community stats for anime whose lists changed; ``{"full": true}`` recounts all of them."""
+    from app.services.community import refresh_community_stats
+
+    full = bool(payload.get("full", False))
+    count = await run_in_threadpool(_in_session, refresh_community_stats, full, settings.COMMUNITY_STATS_OVERLAP)
+    return {"anime": count, "full": full}
+
+
+@job_handler("import_list", timeout=60 * 60)
+async def import_list_job(context: JobContext, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Import a spooled export (see ``IMPORT_USE_JOB_QUEUE``); the file is removed once it's done with."""
+    from app.services.importer import ImportJob, run_import
+
+    path = payload["path"]
+    job = ImportJob(payload["user_id"], payload.get("source", "auto"))
+    job.id = str(context.job_id)
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(2.0)
+            await context.report(job.as_dict())
+
+    # The import runs in this task, so a handler timeout or shutdown cancels it too
+    reporter = asyncio.ensure_future(report_progress())
+    try:
+        await run_import(
+            job, open(path, "rb"), job.source,
+            payload.get("batch_size", settings.IMPORT_BATCH_SIZE), payload.get("score_format"),
+        )
+    finally:
+        reporter.cancel()
+    await context.report(job.as_dict())
+    if job.status == "failed":
+        # Keep the file for the retry
+        if context.final_attempt:
+            os.remove(path)
+        raise RuntimeError(job.error)
+    os.remove(path)
+    return job.as_dict()
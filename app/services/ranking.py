@@ -0,0 +1,232 @@
+"""Re-ranking of recommendation candidates.
+
+Candidate generators (the recommendation graph, AniList's per-title
+recommendations, popular lists) return hundreds to thousands of titles.
+``Ranker.rank`` turns them into feature columns, taken from the catalog
+where it has the title, and scores them all at once. Each registered
+scorer maps the candidates to an array in [0, 1] and the relevance is the
+weighted sum, with weights from ``RANK_WEIGHTS``. Maximal marginal
+relevance then picks the final list greedily, trading each title's
+relevance against its genre similarity to the titles already picked
+(``RANK_MMR_LAMBDA``), so one genre can't fill the whole list.
+
+Register another signal with ``@scorer(name)`` and give it a weight in
+``RANK_WEIGHTS``.
+"""
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.schemas.anime import AnimeBase
+from app.services.catalog import catalog_store, pack_date
+from app.services.community import community_snapshot
+
+
+@dataclass
+class UserProfile:
+    favorite_genres: List[str] = field(default_factory=list)
+    # (anime ID, status, rating) in the order the user added them
+    history: List[Tuple[int, Optional[str], Optional[float]]] = field(default_factory=list)
+
+
+class Candidates:
+    """Feature columns for a candidate list, in its order."""
+
+    def __init__(self, anime: Sequence[AnimeBase], prior: Optional[Sequence[float]] = None):
+        self.anime = anime
+        self.genres = list(catalog_store.genres)
+        n = len(anime)
+        self.ids = ids = np.fromiter((a.id for a in anime), dtype=np.int64, count=n)
+        self.popularity = np.zeros(n, dtype=np.float32)
+        self.average_score = np.full(n, np.nan, dtype=np.float32)
+        self.start_date = np.zeros(n, dtype=np.int32)
+        masks = np.zeros(n, dtype=np.uint64)
+        self.prior = None if prior is None else np.asarray(prior, dtype=np.float32)
+
+        in_catalog = np.zeros(n, dtype=bool)
+        if len(catalog_store):
+            catalog_ids = catalog_store.ids
+            rows = np.minimum(np.searchsorted(catalog_ids, ids), len(catalog_ids) - 1)
+            in_catalog = catalog_ids[rows] == ids
+            rows = rows[in_catalog]
+            columns = catalog_store.columns
+            self.popularity[in_catalog] = columns["popularity"][rows]
+            scores = columns["average_score"][rows].astype(np.float32)
+            scores[scores < 0] = np.nan
+            self.average_score[in_catalog] = scores
+            self.start_date[in_catalog] = columns["start_date"][rows]
+            masks[in_catalog] = columns["genre_mask"][rows]
+
+        vectors = self._unpack(masks)
+        # Titles the catalog doesn't have: what AniList returned for them
+        for i in np.flatnonzero(~in_catalog):
+            item = anime[i]
+            if item.averageScore is not None:
+                self.average_score[i] = item.averageScore
+            self.start_date[i] = pack_date(item.startDate)
+            for genre in item.genres:
+                if genre not in self.genres:
+                    self.genres.append(genre)
+                    vectors = np.pad(vectors, ((0, 0), (0, 1)))
+                vectors[i, self.genres.index(genre)] = 1.0
+        self.genre_vectors = vectors
+
+    def _unpack(self, masks: np.ndarray) -> np.ndarray:
+        """Catalog genre bitmasks as 0/1 rows over ``self.genres``."""
+        bits = np.arange(len(catalog_store.genres), dtype=np.uint64)
+        vectors = ((masks[:, None] >> bits) & np.uint64(1)).astype(np.float32)
+        return np.pad(vectors, ((0, 0), (0, len(self.genres) - len(bits))))
+
+    def __len__(self) -> int:
+        return len(self.anime)
+
+    def profile_vector(self, profile: UserProfile) -> np.ndarray:
+        """The user's genre taste over ``self.genres``: favorite genres and rated history, equally weighted."""
+        favorites = np.zeros(len(self.genres), dtype=np.float32)
+        for genre in profile.favorite_genres:
+            if genre in self.genres:
+                favorites[self.genres.index(genre)] = 1.0
+        history = np.zeros(len(self.genres), dtype=np.float32)
+        if profile.history and len(catalog_store):
+            ids = np.asarray([anime_id for anime_id, _, _ in profile.history], dtype=np.int64)
+            # Liked titles pull towards their genres, disliked ones away, unrated ones slightly towards
+            weights = np.asarray(
+                [0.3 if rating is None else (rating - 5.5) / 4.5 for _, _, rating in profile.history], dtype=np.float32
+            )
+            catalog_ids = catalog_store.ids
+            rows = np.minimum(np.searchsorted(catalog_ids, ids), len(catalog_ids) - 1)
+            known = catalog_ids[rows] == ids
+            history = weights[known] @ self._unpack(np.asarray(catalog_store.columns["genre_mask"][rows[known]]))
+        return _unit(favorites) + _unit(history)
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+Scorer = Callable[[Candidates, UserProfile], np.ndarray]
+
+SCORERS: Dict[str, Scorer] = {}
+
+
+def scorer(name: str):
+    """Register ``func(candidates, profile) -> array in [0, 1]`` as the scorer ``name``."""
+    def register(func: Scorer) -> Scorer:
+        SCORERS[name] = func
+        return func
+    return register
+
+
+@scorer("retrieval")
+def retrieval_score(candidates: Candidates, profile: UserProfile) -> np.ndarray:
+    """The candidate generator's own score (e.g. PageRank), relative to the best candidate."""
+    if candidates.prior is None or not len(candidates) or candidates.prior.max() <= 0:
+        return np.zeros(len(candidates), dtype=np.float32)
+    return candidates.prior / candidates.prior.max()
+
+
+@scorer("popularity")
+def popularity_score(candidates: Candidates, profile: UserProfile) -> np.ndarray:
+    popularity = np.log1p(candidates.popularity)
+    top = popularity.max() if len(popularity) else 0.0
+    return popularity / top if top > 0 else popularity
+
+
+@scorer("score")
+def average_score(candidates: Candidates, profile: UserProfile) -> np.ndarray:
+    # Unknown scores count as middling
+    return np.nan_to_num(candidates.average_score, nan=50.0) / 100.0
+
+
+@scorer("genre_affinity")
+def genre_affinity(candidates: Candidates, profile: UserProfile) -> np.ndarray:
+    """Cosine similarity of each title's genres to the user's taste, mapped from [-1, 1] to [0, 1]."""
+    taste = candidates.profile_vector(profile)
+    norm = np.linalg.norm(taste)
+    if norm == 0:
+        return np.full(len(candidates), 0.5, dtype=np.float32)
+    vectors = candidates.genre_vectors
+    lengths = np.linalg.norm(vectors, axis=1)
+    lengths[lengths == 0] = 1.0
+    return (vectors @ (taste / norm) / lengths + 1.0) / 2.0
+
+
+@scorer("freshness")
+def freshness(candidates: Candidates, profile: UserProfile) -> np.ndarray:
+    """Halves every ``RANK_FRESHNESS_HALF_LIFE_YEARS`` since the start date; 0 when unknown."""
+    start = candidates.start_date
+    years = start // 10000 + np.clip(start // 100 % 100 - 1, 0, 11) / 12.0
+    today = date.today()
+    age = np.maximum(today.year + (today.month - 1) / 12.0 - years, 0.0)
+    return np.where(start > 0, 0.5 ** (age / settings.RANK_FRESHNESS_HALF_LIFE_YEARS), 0.0).astype(np.float32)
+
+
+@scorer("community")
+def community_score(candidates: Candidates, profile: UserProfile) -> np.ndarray:
+    """How widely and well our own users rate each title, relative to the best candidate; 0 when nobody has it listed."""
+    appeal = community_snapshot.appeal(candidates.ids, settings.COMMUNITY_MIN_RATINGS)
+    top = appeal.max() if len(appeal) else 0.0
+    return appeal / top if top > 0 else appeal
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, limit: int, trade_off: float) -> np.ndarray:
+    """Greedy maximal marginal relevance: indices of up to ``limit`` picks, in order."""
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    lengths[lengths == 0] = 1.0
+    unit = vectors / lengths
+    closest = np.zeros(len(relevance), dtype=np.float32)  # similarity to the nearest pick so far
+    gains = np.empty(len(relevance), dtype=np.float32)
+    picked = []
+    for _ in range(min(limit, len(relevance))):
+        np.multiply(closest, trade_off - 1.0, out=gains)
+        gains += trade_off * relevance
+        gains[picked] = -np.inf
+        best = int(np.argmax(gains))
+        picked.append(best)
+        np.maximum(closest, unit @ unit[best], out=closest)
+    return np.asarray(picked, dtype=np.int64)
+
+
+class Ranker:
+    def __init__(self, weights: Dict[str, float], trade_off: float = 0.7, pool_factor: int = 10):
+        unknown = [name for name in weights if name not in SCORERS]
+        if unknown:
+            raise ValueError(f"Unknown ranking scorers: {', '.join(unknown)}")
+        self.weights = {name: weight for name, weight in weights.items() if weight}
+        self.trade_off = trade_off
+        # MMR only considers the best pool_factor * limit titles by relevance
+        self.pool_factor = pool_factor
+
+    def relevance(self, candidates: Candidates, profile: UserProfile) -> np.ndarray:
+        total = np.zeros(len(candidates), dtype=np.float32)
+        for name, weight in self.weights.items():
+            total += weight * SCORERS[name](candidates, profile)
+        return total
+
+    def rank(
+        self,
+        anime: Sequence[AnimeBase],
+        profile: UserProfile,
+        limit: int = 10,
+        prior: Optional[Sequence[float]] = None,
+    ) -> List[AnimeBase]:
+        """The best ``limit`` of ``anime`` for the user, diversified by genre."""
+        if not anime:
+            return []
+        candidates = Candidates(anime, prior)
+        relevance = self.relevance(candidates, profile)
+        pool = np.arange(len(candidates))
+        if len(pool) > limit * self.pool_factor:
+            pool = np.argpartition(-relevance, limit * self.pool_factor)[:limit * self.pool_factor]
+        spread = relevance[pool].max() - relevance[pool].min()
+        # On the same [0, 1] scale as genre similarity
+        scaled = (relevance[pool] - relevance[pool].min()) / spread if spread > 0 else np.ones(len(pool), dtype=np.float32)
+        picked = pool[mmr(scaled, candidates.genre_vectors[pool], limit, self.trade_off)]
+        return [anime[i] for i in picked]
+
+
+ranker = Ranker(settings.RANK_WEIGHTS, settings.RANK_MMR_LAMBDA)
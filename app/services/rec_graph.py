@@ -0,0 +1,219 @@
+"""Multi-hop recommendations over AniList's recommendation graph.
+
+``sync_rec_graph`` harvests every title's user-voted recommendations and
+saves them as a CSR adjacency: node IDs, row pointers, neighbour rows and
+edge weights, one ``.npy`` file each, opened with ``mmap_mode="r"`` like
+the catalog so every worker on a host shares the same pages. Edges are
+undirected (a recommendation links both titles) and weighted by rating.
+Row ``j`` stores, for each neighbour ``i``, the probability of stepping
+from ``i`` to ``j``, so one walk step is a gather over the neighbour
+column and a segmented sum per row.
+
+``RecommendationGraph.recommend`` runs personalized PageRank, a random walk
+that restarts at the user's titles in proportion to how much they liked
+them, with a few dozen vectorized sparse passes over the edge arrays. The
+titles the walk visits most, other than the user's own, are the
+recommendations, so they can be several hops away from anything the user
+has seen.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARRAYS = ("ids", "indptr", "indices", "weights")
+
+
+def restart_weight(status: Optional[str], rating: Optional[float]) -> float:
+    """How strongly a list entry pulls the walk back to its title; 0 leaves it out."""
+    if status == "dropped":
+        return 0.0
+    if rating is not None:
+        # 10 -> 6, 5 -> 1, and 4 or less means the user didn't like it
+        return max(float(rating) - 4.0, 0.0)
+    return 0.5 if status == "plan_to_watch" else 1.0
+
+
+class GraphBuilder:
+    """Accumulates (source, target, rating) edges."""
+
+    def __init__(self):
+        self._sources: List[int] = []
+        self._targets: List[int] = []
+        self._ratings: List[int] = []
+
+    def add(self, source: int, target: int, rating: int) -> None:
+        if source == target:
+            return
+        self._sources.append(source)
+        self._targets.append(target)
+        self._ratings.append(rating)
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def build(self) -> Dict[str, np.ndarray]:
+        sources = np.asarray(self._sources, dtype=np.int64)
+        targets = np.asarray(self._targets, dtype=np.int64)
+        # Downvoted recommendations still connect the titles, just weakly
+        weights = np.maximum(np.asarray(self._ratings, dtype=np.float64), 0.0) + 1.0
+
+        ids = np.unique(np.concatenate([sources, targets]))
+        rows = np.searchsorted(ids, np.concatenate([sources, targets]))
+        cols = np.searchsorted(ids, np.concatenate([targets, sources]))
+        weights = np.concatenate([weights, weights])
+
+        # Both titles usually list the pair; keep the best rated copy of each edge
+        order = np.lexsort((-weights, cols, rows))
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows, cols, weights = rows[first], cols[first], weights[first]
+
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(ids)), out=indptr[1:])
+        # Weights are symmetric, so the step from neighbour i into row j has weight / i's total
+        totals = np.bincount(rows, weights=weights, minlength=len(ids))
+        return {
+            "ids": ids.astype(np.int32),
+            "indptr": indptr,
+            "indices": cols.astype(np.int32),
+            "weights": (weights / totals[cols]).astype(np.float32),
+        }
+
+    def save(self, path: str) -> Tuple[int, int]:
+        """Write the graph to ``path``, atomically replacing any previous one; returns (nodes, edges)."""
+        arrays = self.build()
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), arrays[name])
+        nodes, edges = len(arrays["ids"]), len(arrays["indices"])
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"nodes": nodes, "edges": edges, "built_at": time.time()}, f)
+
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        logger.info(f"Saved recommendation graph with {nodes} titles and {edges} edges to {path}")
+        return nodes, edges
+
+
+class RecommendationGraph:
+    """Read side: memory-mapped CSR arrays and the personalized PageRank scorer."""
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    def load(self, path: str) -> bool:
+        """Map the graph at ``path``; returns False if none has been built yet."""
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            logger.info(f"No recommendation graph found at {path}")
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        self.path = path
+        logger.info(f"Loaded recommendation graph with {meta['nodes']} titles and {meta['edges']} edges from {path}")
+        return True
+
+    @property
+    def available(self) -> bool:
+        return bool(self.arrays) and len(self.arrays["ids"]) > 0
+
+    def __len__(self) -> int:
+        return len(self.arrays["ids"]) if self.arrays else 0
+
+    def rows_of(self, anime_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows of the given titles and a mask of which ones are in the graph."""
+        ids = self.arrays["ids"]
+        wanted = np.asarray(list(anime_ids), dtype=np.int64)
+        rows = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+        return rows, ids[rows] == wanted
+
+    def personalized_pagerank(
+        self, restart: Dict[int, float], alpha: float = 0.3, iterations: int = 30, tol: float = 1e-5
+    ) -> Optional[np.ndarray]:
+        """Visit probability of every row for a walk restarting at ``restart`` (title -> weight).
+
+        Returns None when none of the restart titles are in the graph.
+        """
+        if not self.available:
+            return None
+        anime_ids = [anime_id for anime_id, weight in restart.items() if weight > 0]
+        rows, known = self.rows_of(anime_ids)
+        if not known.any():
+            return None
+        reset = np.zeros(len(self), dtype=np.float32)
+        np.add.at(reset, rows[known], np.asarray([restart[i] for i in anime_ids], dtype=np.float32)[known])
+        reset /= reset.sum()
+
+        # Every title in the graph has an edge, so no segment is empty
+        starts, indices, weights = self.arrays["indptr"][:-1], self.arrays["indices"], self.arrays["weights"]
+        scores = reset
+        for _ in range(iterations):
+            updated = np.add.reduceat(scores[indices] * weights, starts)
+            updated *= 1 - alpha
+            # Restart mass (taken as what the step left over, which also absorbs rounding)
+            updated += (1.0 - updated.sum()) * reset
+            delta = np.abs(updated - scores).sum()
+            scores = updated
+            if delta < tol:
+                break
+        return scores
+
+    def recommend(
+        self,
+        restart: Dict[int, float],
+        limit: int = 10,
+        exclude: Iterable[int] = (),
+        alpha: float = 0.3,
+        iterations: int = 30,
+    ) -> List[Tuple[int, float]]:
+        """Top ``limit`` (anime ID, score) pairs for a user, leaving out ``exclude`` and the restart titles."""
+        scores = self.personalized_pagerank(restart, alpha, iterations)
+        if scores is None:
+            return []
+        excluded = list(restart) + list(exclude)
+        if excluded:
+            rows, known = self.rows_of(excluded)
+            scores[rows[known]] = 0.0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        ids = self.arrays["ids"]
+        return [(int(ids[row]), float(scores[row])) for row in candidates]
+
+
+# Create a singleton instance
+rec_graph = RecommendationGraph()
+
+
+async def sync_rec_graph(service, path: str, per_page: int = 50, max_pages: Optional[int] = None) -> Tuple[int, int]:
+    """Harvest AniList's recommendation edges page by page and save the graph to ``path``.
+
+    ``service`` is an AniListService; every page goes through its rate limiter.
+    """
+    builder = GraphBuilder()
+    page = 1
+    while True:
+        edges, has_next = await service.get_recommendation_edges_page(page, per_page)
+        for source, target, rating in edges:
+            builder.add(source, target, rating)
+        logger.info(f"Recommendation graph sync: page {page}, {len(builder)} edges")
+        if not has_next or (max_pages and page >= max_pages):
+            break
+        page += 1
+    return builder.save(path)
@@ -0,0 +1,118 @@
+"""Recommendation strategies behind ``GET /anime/recommendations``.
+
+Each strategy turns a ``UserProfile`` into up to ``limit`` unseen titles,
+generating candidates its own way and ordering them with the shared
+ranker. ``recommend`` tries them in ``CASCADE`` order and returns the
+first non-empty list. Strategies are registered by name with
+``@strategy`` so offline evaluation (``benchmarks.evaluate``) can run each
+one on its own.
+"""
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+import logging
+
+from app.core.config import settings
+from app.schemas.anime import AnimeBase
+from app.services.anilist import AniListUnavailable, anilist_service
+from app.services.catalog import catalog_store
+from app.services.community import community_snapshot
+from app.services.ranking import UserProfile, ranker
+from app.services.rec_graph import rec_graph, restart_weight
+
+logger = logging.getLogger(__name__)
+
+# Graph recommendations handed to the ranker per request
+GRAPH_CANDIDATES = 200
+
+Strategy = Callable[[UserProfile, int], Awaitable[List[AnimeBase]]]
+
+STRATEGIES: Dict[str, Strategy] = {}
+
+CASCADE = ("graph", "last_watched", "genre_popular", "community", "popular")
+
+# Titles most listed by our users handed to the ranker by the community strategy
+COMMUNITY_CANDIDATES = 200
+
+
+def strategy(name: str):
+    """Register ``async func(profile, limit) -> titles`` as the strategy ``name``."""
+    def register(func: Strategy) -> Strategy:
+        STRATEGIES[name] = func
+        return func
+    return register
+
+
+def _unseen(anime: List[AnimeBase], profile: UserProfile) -> List[AnimeBase]:
+    seen = {anime_id for anime_id, _, _ in profile.history}
+    return [item for item in anime if item.id not in seen]
+
+
+async def _graph_candidates(profile: UserProfile, limit: int) -> Tuple[List[AnimeBase], List[float]]:
+    """The graph's top unseen titles for a history, with their PageRank scores."""
+    restart = {anime_id: restart_weight(status, rating) for anime_id, status, rating in profile.history}
+    ranked = rec_graph.recommend(
+        restart, limit, exclude=restart, alpha=settings.REC_GRAPH_RESTART, iterations=settings.REC_GRAPH_ITERATIONS
+    )
+    anime = {anime_id: catalog_store.get(anime_id) for anime_id, _ in ranked}
+    missing = [anime_id for anime_id, found in anime.items() if found is None]
+    if missing:
+        try:
+            anime.update(await anilist_service.get_anime_by_ids(missing))
+        except AniListUnavailable as e:
+            logger.warning(f"Could not load graph recommendations missing from the catalog: {e}")
+    found = [(anime[anime_id], score) for anime_id, score in ranked if anime.get(anime_id) is not None]
+    return [item for item, _ in found], [score for _, score in found]
+
+
+@strategy("graph")
+async def graph_strategy(profile: UserProfile, limit: int) -> List[AnimeBase]:
+    """Walk the local recommendation graph from the whole history, if it has been synced."""
+    if not profile.history or not rec_graph.available:
+        return []
+    candidates, scores = await _graph_candidates(profile, GRAPH_CANDIDATES)
+    return ranker.rank(candidates, profile, limit, prior=scores)
+
+
+@strategy("last_watched")
+async def last_watched_strategy(profile: UserProfile, limit: int) -> List[AnimeBase]:
+    """AniList's recommendations for the title added last."""
+    if not profile.history:
+        return []
+    recommendations = await anilist_service.get_recommendations(profile.history[-1][0], limit=25)
+    return ranker.rank(_unseen(recommendations, profile), profile, limit)
+
+
+@strategy("genre_popular")
+async def genre_popular_strategy(profile: UserProfile, limit: int) -> List[AnimeBase]:
+    """Popular titles in the user's first favorite genre."""
+    if not profile.favorite_genres:
+        return []
+    popular_anime = await anilist_service.get_popular_anime(genres=profile.favorite_genres[:1], limit=50)
+    return ranker.rank(_unseen(popular_anime, profile), profile, limit)
+
+
+@strategy("community")
+async def community_strategy(profile: UserProfile, limit: int) -> List[AnimeBase]:
+    """The titles on most of our users' lists, without asking AniList (only those in the local catalog)."""
+    seen = {anime_id for anime_id, _, _ in profile.history}
+    candidates, members = [], []
+    for anime_id, count in community_snapshot.most_listed(COMMUNITY_CANDIDATES + len(seen)):
+        anime = None if anime_id in seen else catalog_store.get(anime_id)
+        if anime is not None and len(candidates) < COMMUNITY_CANDIDATES:
+            candidates.append(anime)
+            members.append(count)
+    return ranker.rank(candidates, profile, limit, prior=members)
+
+
+@strategy("popular")
+async def popular_strategy(profile: UserProfile, limit: int) -> List[AnimeBase]:
+    popular_anime = await anilist_service.get_popular_anime(limit=50)
+    return ranker.rank(_unseen(popular_anime, profile), profile, limit)
+
+
+async def recommend(profile: UserProfile, limit: int = 10, strategies: Sequence[str] = CASCADE) -> List[AnimeBase]:
+    """The first non-empty result of ``strategies``, tried in order."""
+    for name in strategies:
+        results = await STRATEGIES[name](profile, limit)
+        if results:
+            return results
+    return []
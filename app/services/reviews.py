@@ -0,0 +1,196 @@
+"""Full-text search over reviews, and per-anime review aggregates.
+
+Postgres keeps each review's ``search_vector`` (title weighted above
+content) as a generated column with a GIN index, so a search is an index
+scan for ``search_vector @@ websearch_to_tsquery(...)``, ranked with
+``ts_rank``. Pages continue by keyset: the cursor is the (rank, id) of the
+last result, and the next page starts strictly below it in the same
+(rank desc, id desc) order, so deep pages cost no more than the first and
+results don't shift when reviews are added in between. Reviews are private,
+so a search only covers its user's own. Snippets are only computed for the
+rows of the page, and come back HTML-escaped with matches in ``<b>``. The column and index are Postgres
+only, so they aren't on the model: ``ensure_search_column`` adds them
+after ``create_all``, and the models stay creatable on other engines
+(e.g. SQLite in the benchmarks).
+
+``anime_review_stats`` holds each anime's review count and rating sum.
+``record_review`` applies a write's delta with one upsert in the writer's
+transaction, so the stats commit or roll back with the review and
+concurrent writers never lose each other's updates.
+``rebuild_review_stats`` recomputes them from scratch, e.g. after a bulk
+load, and ``ensure_review_stats`` backfills them at startup when the table
+is empty but reviews aren't, as after upgrading.
+"""
+from typing import List, Optional, Tuple
+import base64
+import html
+import logging
+
+from sqlalchemy import REAL, cast, func, literal_column, select, text, tuple_
+from sqlalchemy.dialects.postgresql import TSVECTOR, insert
+from sqlalchemy.orm import Session
+
+from app.models.aggregates import AnimeReviewStats
+from app.models.user import Review
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration of the search vector; queries must use the same one
+SEARCH_CONFIG = "english"
+
+# Title matches rank above body matches
+SEARCH_VECTOR_SQL = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(content, '')), 'B')"
+)
+
+search_vector = literal_column("reviews.search_vector", TSVECTOR)
+
+# Matches are marked with control characters, which survive escaping the
+# snippet and then become tags; they're removed from the content beforehand
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\x01", "\x02"
+HEADLINE_OPTIONS = f"MaxFragments=2, MaxWords=30, MinWords=10, StartSel=\"{HIGHLIGHT_START}\", StopSel=\"{HIGHLIGHT_STOP}\""
+
+
+def encode_cursor(rank: float, review_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{rank!r}:{review_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """(rank, id) of the last result on the previous page; ValueError if malformed."""
+    try:
+        rank, _, review_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition(":")
+        return float(rank), int(review_id)
+    except (UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def highlight(snippet: str) -> str:
+    """A ``ts_headline`` snippet as HTML: the text escaped, the matches in ``<b>``."""
+    return html.escape(snippet).replace(HIGHLIGHT_START, "<b>").replace(HIGHLIGHT_STOP, "</b>")
+
+
+def search_reviews(
+    db: Session, query: str, user_id: int, anime_id: Optional[int] = None, limit: int = 20, cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of ``user_id``'s reviews matching ``query`` (web search syntax), best first, and the next page's cursor."""
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+    rank = func.ts_rank(search_vector, tsquery)
+    matches = select(Review.id.label("id"), rank.label("rank")).where(
+        search_vector.op("@@")(tsquery), Review.user_id == user_id
+    )
+    if anime_id is not None:
+        matches = matches.where(Review.anime_id == anime_id)
+    if cursor is not None:
+        after_rank, after_id = decode_cursor(cursor)
+        # ts_rank is a real; compare as one so the last row's rank matches exactly
+        matches = matches.where(tuple_(rank, Review.id) < tuple_(cast(after_rank, REAL), after_id))
+    # One extra row tells whether there is a next page
+    page = matches.order_by(rank.desc(), Review.id.desc()).limit(limit + 1).subquery()
+
+    rows = db.execute(
+        select(
+            Review.id, Review.user_id, Review.anime_id, Review.title, Review.rating, Review.created_at,
+            page.c.rank,
+            func.ts_headline(
+                SEARCH_CONFIG, func.translate(Review.content, HIGHLIGHT_START + HIGHLIGHT_STOP, ""), tsquery, HEADLINE_OPTIONS
+            ).label("snippet"),
+        )
+        .join(page, page.c.id == Review.id)
+        .order_by(page.c.rank.desc(), Review.id.desc())
+    ).mappings().all()
+    results = [dict(row, snippet=highlight(row["snippet"] or "")) for row in rows[:limit]]
+    next_cursor = encode_cursor(results[-1]["rank"], results[-1]["id"]) if len(rows) > limit else None
+    return results, next_cursor
+
+
+def record_review(db: Session, anime_id: int, old_rating: Optional[float], new_rating: Optional[float], created: bool) -> None:
+    """Apply one review write to its anime's stats; call in the writer's transaction, before committing.
+
+    ``old_rating`` is the review's rating before an update (ignored when ``created``).
+    """
+    rated_delta = (new_rating is not None) - (not created and old_rating is not None)
+    sum_delta = (new_rating or 0.0) - (0.0 if created else old_rating or 0.0)
+    if not created and not rated_delta and not sum_delta:
+        return
+    statement = insert(AnimeReviewStats).values(
+        anime_id=anime_id, review_count=int(created), rating_sum=sum_delta, rated_count=rated_delta,
+    )
+    table = AnimeReviewStats.__table__
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.anime_id],
+        set_={
+            "review_count": table.c.review_count + statement.excluded.review_count,
+            "rating_sum": table.c.rating_sum + statement.excluded.rating_sum,
+            "rated_count": table.c.rated_count + statement.excluded.rated_count,
+            "updated_at": func.now(),
+        },
+    ))
+
+
+def review_stats(db: Session, anime_id: int) -> dict:
+    stats = db.get(AnimeReviewStats, anime_id)
+    return {
+        "anime_id": anime_id,
+        "review_count": stats.review_count if stats else 0,
+        "mean_rating": stats.mean_rating if stats else None,
+    }
+
+
+def rebuild_review_stats(db: Session) -> int:
+    """Recompute every anime's stats from ``reviews``; returns the number of anime. The caller commits."""
+    # Hold off review writes until the commit, so none falls between the delete and the insert
+    db.execute(text("LOCK TABLE reviews IN SHARE MODE"))
+    db.execute(AnimeReviewStats.__table__.delete())
+    result = db.execute(insert(AnimeReviewStats).from_select(
+        ["anime_id", "review_count", "rating_sum", "rated_count", "updated_at"],
+        select(
+            Review.anime_id,
+            func.count(),
+            func.coalesce(func.sum(Review.rating), 0.0),
+            func.count(Review.rating),
+            func.now(),
+        ).where(Review.anime_id.isnot(None)).group_by(Review.anime_id),
+    ))
+    return result.rowcount
+
+
+def ensure_search_column(engine) -> None:
+    """Add the search vector and its index to ``reviews``; call after ``create_all``.
+
+    Adding the column rewrites the table, once; a table that has it is left alone.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        exists = connection.execute(text(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = 'reviews' AND column_name = 'search_vector'"
+        )).first()
+        if exists:
+            return
+        connection.execute(text(
+            "ALTER TABLE reviews ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_reviews_search_vector ON reviews USING gin (search_vector)"
+        ))
+
+
+def ensure_review_stats(engine) -> None:
+    """Fill an empty ``anime_review_stats`` from existing reviews; call after ``create_all``."""
+    if engine.dialect.name != "postgresql":
+        return
+    db = Session(bind=engine)
+    try:
+        if db.query(AnimeReviewStats.anime_id).first() is not None:
+            return
+        # Other processes starting up wait here, then find the table filled
+        db.execute(text("LOCK TABLE anime_review_stats IN EXCLUSIVE MODE"))
+        if db.query(AnimeReviewStats.anime_id).first() is not None or db.query(Review.id).first() is None:
+            return
+        count = rebuild_review_stats(db)
+        db.commit()
+        logger.info(f"Backfilled review stats for {count} anime")
+    finally:
+        db.close()
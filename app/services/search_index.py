@@ -0,0 +1,255 @@
+"""Local, typo-tolerant title search over the catalog.
+
+Every catalog row is indexed by the tokens of its english, romaji and native
+titles plus synonyms. Postings are kept per term in CSR arrays and scored
+with BM25, blended with a popularity prior. The last query token is
+matched as a prefix (for autocomplete), and tokens with no exact match fall
+back to vocabulary terms within a small edit distance, found through a
+trigram index over the vocabulary.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+import logging
+import re
+import time
+import unicodedata
+
+import numpy as np
+
+from app.services.catalog import SORT_COLUMNS, CatalogStore, catalog_store
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+POPULARITY_WEIGHT = 0.5
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+MAX_PREFIX_TERMS = 64
+MAX_FUZZY_CANDIDATES = 200
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _TOKEN_RE.findall(text)
+
+
+def max_edits(token: str) -> int:
+    """Typos tolerated for a token of this length."""
+    if len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 7 else 2
+
+
+def _trigrams(term: str) -> List[str]:
+    padded = f"${term}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def edit_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """Edit distance (adjacent transpositions count as one edit) or None if above limit."""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            )
+            if before_previous and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before_previous[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return None
+        before_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class SearchIndex:
+    def __init__(self, store: CatalogStore):
+        self.store = store
+        self._version = None
+        self._size = 0
+        self.terms: List[str] = []
+        self._term_ids: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._trigrams: Dict[str, np.ndarray] = {}
+        self._popularity = np.zeros(0, dtype=np.float32)
+
+    @property
+    def available(self) -> bool:
+        self.ensure_current()
+        return self._size > 0
+
+    def ensure_current(self) -> None:
+        """(Re)build the index if the catalog has been reloaded since the last build."""
+        if self._version == self.store.version:
+            return
+        started = time.perf_counter()
+        self._build()
+        self._version = self.store.version
+        if self._size:
+            logger.info(
+                f"Built search index over {self._size} titles, {len(self.terms)} terms "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+
+    def _build(self) -> None:
+        store = self.store
+        self._size = len(store)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(self._size, dtype=np.float32)
+        for row in range(self._size):
+            texts = [
+                store.string("title_english", row),
+                store.string("title_romaji", row),
+                store.string("title_native", row),
+            ] + store.synonyms(row)
+            tokens = [token for text in texts if text for token in tokenize(text)]
+            lengths[row] = len(tokens)
+            for token in tokens:
+                rows = postings.setdefault(token, {})
+                rows[row] = rows.get(row, 0) + 1
+
+        self.terms = sorted(postings)
+        self._term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+        counts = np.fromiter((len(postings[term]) for term in self.terms), dtype=np.int64, count=len(self.terms))
+        self._offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._offsets[1:])
+        self._rows = np.fromiter(
+            (row for term in self.terms for row in postings[term]), dtype=np.int32, count=int(self._offsets[-1])
+        )
+        tf = np.fromiter(
+            (tf for term in self.terms for tf in postings[term].values()), dtype=np.float32, count=int(self._offsets[-1])
+        )
+
+        # BM25 term-frequency component is fixed per posting, so precompute it
+        avg_length = float(lengths.mean()) if self._size else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[self._rows] / max(avg_length, 1.0))
+        self._weights = (tf * (BM25_K1 + 1) / (tf + norm)).astype(np.float32)
+        self._idf = np.log(1 + (self._size - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+
+        trigrams: Dict[str, List[int]] = {}
+        for term_id, term in enumerate(self.terms):
+            for gram in set(_trigrams(term)):
+                trigrams.setdefault(gram, []).append(term_id)
+        self._trigrams = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in trigrams.items()}
+
+        if self._size:
+            popularity = np.log1p(np.asarray(store.columns["popularity"], dtype=np.float32))
+            self._popularity = popularity / max(float(popularity.max()), 1.0)
+        else:
+            self._popularity = np.zeros(0, dtype=np.float32)
+
+    def _prefix_terms(self, prefix: str) -> List[int]:
+        """Term IDs starting with prefix, most frequent first."""
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix + "\U0010ffff", lo=start)
+        if end - start <= MAX_PREFIX_TERMS:
+            return list(range(start, end))
+        df = self._offsets[start + 1:end + 1] - self._offsets[start:end]
+        top = np.argpartition(-df, MAX_PREFIX_TERMS)[:MAX_PREFIX_TERMS]
+        return (top + start).tolist()
+
+    def _fuzzy_terms(self, token: str) -> List[Tuple[int, int]]:
+        """(term ID, distance) for vocabulary terms within max_edits of token."""
+        limit = max_edits(token)
+        if not limit:
+            return []
+        grams = [self._trigrams[gram] for gram in set(_trigrams(token)) if gram in self._trigrams]
+        if not grams:
+            return []
+        shared = np.bincount(np.concatenate(grams), minlength=len(self.terms))
+        # An edit destroys at most three trigrams of the padded token, a transposition four
+        needed = max(1, len(_trigrams(token)) - 4 * limit)
+        candidates = np.flatnonzero(shared >= needed)
+        if len(candidates) > MAX_FUZZY_CANDIDATES:
+            candidates = candidates[np.argsort(-shared[candidates], kind="stable")[:MAX_FUZZY_CANDIDATES]]
+        matches = []
+        for term_id in candidates.tolist():
+            distance = edit_distance(token, self.terms[term_id], limit)
+            if distance is not None:
+                matches.append((term_id, distance))
+        return matches
+
+    def _expand(self, token: str, is_prefix: bool) -> List[Tuple[int, float]]:
+        """Vocabulary terms a query token matches, with a match-quality weight."""
+        expansions: Dict[int, float] = {}
+        term_id = self._term_ids.get(token)
+        if term_id is not None:
+            expansions[term_id] = 1.0
+        if is_prefix:
+            for prefix_id in self._prefix_terms(token):
+                expansions.setdefault(prefix_id, PREFIX_WEIGHT)
+        if not expansions:
+            for fuzzy_id, distance in self._fuzzy_terms(token):
+                expansions[fuzzy_id] = FUZZY_WEIGHT ** distance
+        return list(expansions.items())
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        genre_mask: int = 0,
+        prefix: bool = True,
+        sort: Optional[str] = None,
+    ) -> List[int]:
+        """Catalog rows matching every query token, best first.
+
+        With ``prefix`` the last token also matches longer terms, which is
+        what autocomplete wants. A non-zero ``genre_mask`` keeps only rows
+        having at least one of those genres. ``sort`` (one of SORT_COLUMNS)
+        orders all matches by that column instead of by relevance.
+        """
+        self.ensure_current()
+        tokens = tokenize(query)
+        if not tokens or not self._size:
+            return []
+
+        scores = np.zeros(self._size, dtype=np.float32)
+        matched = np.zeros(self._size, dtype=np.int16)
+        for position, token in enumerate(tokens):
+            expansions = self._expand(token, prefix and position == len(tokens) - 1)
+            if not expansions:
+                return []
+            hit = np.zeros(self._size, dtype=bool)
+            for term_id, quality in expansions:
+                start, end = self._offsets[term_id], self._offsets[term_id + 1]
+                rows = self._rows[start:end]
+                # Several expansions can hit a row; only the first (best) one counts
+                contribution = quality * self._idf[term_id] * self._weights[start:end]
+                scores[rows] += np.where(hit[rows], 0, contribution)
+                hit[rows] = True
+            matched += hit
+
+        candidates = np.flatnonzero(matched == len(tokens))
+        if genre_mask:
+            masks = self.store.columns["genre_mask"][candidates]
+            candidates = candidates[(masks & np.uint64(genre_mask)) != 0]
+        if not len(candidates):
+            return []
+
+        if sort in SORT_COLUMNS:
+            final = np.asarray(self.store.columns[SORT_COLUMNS[sort]][candidates], dtype=np.float64)
+        else:
+            text_scores = scores[candidates]
+            final = text_scores / max(float(text_scores.max()), 1e-6) + POPULARITY_WEIGHT * self._popularity[candidates]
+        if len(candidates) > limit:
+            top = np.argpartition(-final, limit)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-final[top], kind="stable")]
+        return candidates[top].tolist()
+
+
+# Create a singleton instance
+search_index = SearchIndex(catalog_store)
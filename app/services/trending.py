@@ -0,0 +1,146 @@
+"""Live trending feeds for ``GET /anime/trending/stream``.
+
+Each distinct (genre set, limit) gets one ``TrendingFeed`` that refreshes
+from AniList every ``TRENDING_STREAM_INTERVAL`` seconds while anyone is
+listening, diffs the new ranking against the previous one and broadcasts
+only the changes. New listeners get the current snapshot first, so
+however many clients follow a feed it costs one upstream call per
+interval; the refresh also keeps ``/anime/sort/trending``'s cache warm.
+Feed refreshes don't count against any one client's upstream budget, so
+the subscriber whose request starts a feed pays for it, and at most
+``max_feeds`` feeds are live at once.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.core.rate_limit import RateLimitExceeded, admit_upstream, current_client
+from app.schemas.anime import AnimeBase
+from app.services.anilist import AniListUnavailable, anilist_service, served_stale
+from app.services.broadcast import Subscriber, format_event
+
+logger = logging.getLogger(__name__)
+
+FeedKey = Tuple[Tuple[str, ...], int]
+
+
+def _anime_json(anime: AnimeBase) -> dict:
+    return anime.model_dump(mode="json")
+
+
+def diff_rankings(old: List[AnimeBase], new: List[AnimeBase]) -> dict:
+    """Changes that turn ranking ``old`` into ``new``: added, removed, moved and updated titles."""
+    old_ranks = {anime.id: rank for rank, anime in enumerate(old)}
+    old_by_id = {anime.id: anime for anime in old}
+    new_ids = {anime.id for anime in new}
+    changes = {
+        "added": [],
+        "removed": [anime_id for anime_id in old_ranks if anime_id not in new_ids],
+        "moved": [],
+        "updated": [],
+    }
+    for rank, anime in enumerate(new):
+        previous = old_ranks.get(anime.id)
+        if previous is None:
+            changes["added"].append({"rank": rank, "anime": _anime_json(anime)})
+            continue
+        if previous != rank:
+            changes["moved"].append({"id": anime.id, "from": previous, "rank": rank})
+        if anime.__dict__ != old_by_id[anime.id].__dict__:
+            changes["updated"].append(_anime_json(anime))
+    return changes
+
+
+class TrendingFeed:
+    def __init__(self, genres: Tuple[str, ...], limit: int, interval: float):
+        self.genres = genres
+        self.limit = limit
+        self.interval = interval
+        self.version = 0
+        self.ranking: List[AnimeBase] = []
+        self.snapshot: Optional[bytes] = None  # encoded once per version for joining subscribers
+        self.subscribers: Set[Subscriber] = set()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
+    async def _run(self) -> None:
+        # The task inherits the first subscriber's request context; upstream
+        # calls made for everyone shouldn't spend that client's budget
+        current_client.set(None)
+        while True:
+            served_stale.set(False)
+            try:
+                ranking = await anilist_service.get_trending_anime(list(self.genres) or None, self.limit, refresh=True)
+            except AniListUnavailable as e:
+                logger.warning(f"Trending feed {self.genres or 'all'}/{self.limit} refresh failed: {e}")
+            except Exception:
+                logger.exception(f"Trending feed {self.genres or 'all'}/{self.limit} refresh failed")
+            else:
+                self.publish(ranking)
+            await asyncio.sleep(self.interval)
+
+    def publish(self, ranking: List[AnimeBase]) -> None:
+        """Broadcast the changes from the previous ranking, if there are any."""
+        if self.snapshot is not None:
+            changes = diff_rankings(self.ranking, ranking)
+            if not any(changes.values()):
+                return
+        self.version += 1
+        self.ranking = ranking
+        self.snapshot = format_event(
+            "snapshot", {"version": self.version, "anime": [_anime_json(anime) for anime in ranking]}, str(self.version)
+        )
+        message = self.snapshot if self.version == 1 else format_event(
+            "changes", {"version": self.version, **changes}, str(self.version)
+        )
+        for subscriber in list(self.subscribers):
+            if not subscriber.send(message):
+                self.subscribers.discard(subscriber)
+
+
+class TrendingStreams:
+    """Feeds by key, started with their first subscriber and stopped with their last."""
+
+    def __init__(self, interval: float = 30, max_buffer: int = 100, max_feeds: int = 20):
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.max_feeds = max_feeds
+        self.feeds: Dict[FeedKey, TrendingFeed] = {}
+
+    def subscribe(self, genres: Optional[List[str]], limit: int) -> Tuple[TrendingFeed, Subscriber]:
+        """Join a feed, starting it if needed; RateLimitExceeded if that's over the feed cap or the client's budget."""
+        key = (tuple(sorted(set(genres or ()))), limit)
+        feed = self.feeds.get(key)
+        if feed is None:
+            if len(self.feeds) >= self.max_feeds:
+                raise RateLimitExceeded("Too many trending feeds are live", self.interval)
+            admit_upstream()
+            feed = self.feeds[key] = TrendingFeed(key[0], limit, self.interval)
+            feed.start()
+        subscriber = Subscriber(self.max_buffer)
+        feed.subscribers.add(subscriber)
+        return feed, subscriber
+
+    def unsubscribe(self, feed: TrendingFeed, subscriber: Subscriber) -> None:
+        feed.subscribers.discard(subscriber)
+        if not feed.subscribers and self.feeds.get((feed.genres, feed.limit)) is feed:
+            del self.feeds[(feed.genres, feed.limit)]
+            feed.stop()
+
+    async def close(self) -> None:
+        feeds, self.feeds = list(self.feeds.values()), {}
+        for feed in feeds:
+            feed.stop()
+        await asyncio.gather(*[feed.task for feed in feeds if feed.task], return_exceptions=True)
+
+
+trending_streams = TrendingStreams(
+    settings.TRENDING_STREAM_INTERVAL, settings.SSE_CLIENT_BUFFER, settings.TRENDING_STREAM_MAX_FEEDS
+)
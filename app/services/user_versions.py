@@ -0,0 +1,132 @@
+"""Per-user data versions and cached response snapshots for the user list endpoints.
+
+Every write to a user's row or lists calls ``user_versions.touch(db, user_id)``
+before committing. Once the session commits, the user's version moves to a
+new millisecond timestamp; on Postgres the same version is broadcast with
+``NOTIFY`` (sent on commit) so every worker converges on it. Reads key
+their ETag and cached body on the version, so an unchanged poll costs one
+dict lookup and never touches the database.
+
+A worker that has seen no write for a user since it started uses its own
+start time as that user's version, which is newer than any write it
+could have missed.
+"""
+from typing import Callable, Dict, Hashable, Optional, Tuple
+import logging
+import select
+import threading
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "user_data_version"
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class UserVersions:
+    def __init__(self):
+        self.started = _now_ms()
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        # (user_id, endpoint, version) -> (etag, serialized body)
+        self.snapshots = TTLCache(max_size=20000, default_ttl=60 * 60)
+        # (user_id, version) -> whether the user exists and is active; a
+        # touch moves the version, the TTL bounds changes made outside the app
+        self.active = TTLCache(max_size=20000, default_ttl=60)
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def get(self, user_id: int) -> int:
+        return self._versions.get(user_id, self.started)
+
+    def advance(self, user_id: int, version: int) -> None:
+        """Move a user's version forward; versions never go back."""
+        with self._lock:
+            if version > self._versions.get(user_id, self.started):
+                self._versions[user_id] = version
+
+    def touch(self, db: Session, user_id: int) -> None:
+        """Mark a user's data as changed by the current transaction of ``db``.
+
+        Call before committing. The new version takes effect after the
+        commit, so readers can't cache pre-commit data under it.
+        """
+        version = max(_now_ms(), self.get(user_id) + 1)
+        pending: Dict[int, int] = db.info.setdefault("touched_users", {})
+        pending[user_id] = max(version, pending.get(user_id, 0))
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(func.pg_notify(CHANNEL, f"{user_id}:{version}").select())
+
+    def snapshot(self, user_id: int, endpoint: str, build: Callable[[], bytes]) -> Tuple[str, bytes]:
+        """(etag, body) for a user's endpoint at its current version, building the body on a miss."""
+        version = self.get(user_id)
+        key: Hashable = (user_id, endpoint, version)
+        cached = self.snapshots.get(key)
+        if cached is None:
+            cached = (self.etag(user_id, endpoint, version), build())
+            self.snapshots.set(key, cached)
+        return cached
+
+    @staticmethod
+    def etag(user_id: int, endpoint: str, version: int) -> str:
+        return f'W/"u{user_id}-{endpoint}-{version}"'
+
+    def start_listener(self, engine) -> None:
+        """Follow other workers' writes through LISTEN (Postgres only)."""
+        if engine.dialect.name != "postgresql" or self._listener is not None:
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, args=(engine,), name="user-versions", daemon=True)
+        self._listener.start()
+
+    def stop_listener(self) -> None:
+        self._stop.set()
+        self._listener = None
+
+    def _listen(self, engine) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                connection = engine.raw_connection()
+                try:
+                    dbapi_connection = connection.driver_connection
+                    dbapi_connection.autocommit = True
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute(f"LISTEN {CHANNEL}")
+                    backoff = 1.0
+                    while not self._stop.is_set():
+                        if select.select([dbapi_connection], [], [], 5.0) == ([], [], []):
+                            continue
+                        dbapi_connection.poll()
+                        while dbapi_connection.notifies:
+                            notify = dbapi_connection.notifies.pop(0)
+                            user_id, _, version = notify.payload.partition(":")
+                            self.advance(int(user_id), int(version))
+                finally:
+                    connection.invalidate()
+            except Exception as e:
+                logger.error(f"User version listener failed, retrying in {backoff:.0f}s: {str(e)}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+
+user_versions = UserVersions()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_touched_versions(session: Session) -> None:
+    for user_id, version in session.info.pop("touched_users", {}).items():
+        user_versions.advance(user_id, version)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_touched_versions(session: Session) -> None:
+    session.info.pop("touched_users", None)
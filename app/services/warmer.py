@@ -0,0 +1,229 @@
+"""Predictive cache warming for AniList data.
+
+``AniListService._fetch`` reports every lookup here: how each key was
+served (fresh, stale or miss) and how to query it again. A decayed request
+count per key ranks keys by popularity. Every ``WARM_INTERVAL`` seconds
+the warmer re-runs the top ``WARM_TOP_K`` keys that expire within
+``WARM_LEAD`` seconds (or have been evicted), one at a time, and only
+while more than ``WARM_RESERVE`` of the AniList rate limit is unused, so
+user traffic always goes first. At startup it also precomputes the
+AniList-only sorts for the genres users most often pick as favorites.
+
+``stats()`` reports the hit ratio alongside what it would have been
+without warming: after a warm refresh, the first lookup past the replaced
+entry's expiry would have been stale or a miss, so a fresh hit there is
+counted as saved.
+"""
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import asyncio
+import heapq
+import logging
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.rate_limit import current_client
+from app.db.session import SessionLocal
+from app.models.user import Genre, user_genre
+from app.services.anilist import AniListService, AniListUnavailable, anilist_service
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.genre_index import genre_index
+
+logger = logging.getLogger(__name__)
+
+# Sorts of /anime/sort/{sort_type} and the service methods behind them
+SORT_METHODS = {
+    "popularity": "get_popular_anime",
+    "trending": "get_trending_anime",
+    "score": "get_top_rated_anime",
+    "start_date": "get_newest_anime",
+}
+
+# Keys need about one request per half-life to be kept warm
+MIN_SCORE = 0.5
+
+# Set inside the warmer's own task, so its lookups don't count as traffic
+_warming: ContextVar[bool] = ContextVar("warming", default=False)
+
+
+class KeyStats:
+    __slots__ = ("score", "updated", "ttl", "query", "variables", "parse", "credit_after")
+
+    def __init__(self, ttl: int, query: str, variables: Dict[str, Any], parse, now: float):
+        self.score = 0.0
+        self.updated = now
+        self.ttl = ttl
+        self.query = query
+        self.variables = variables
+        self.parse = parse
+        # Set by a warm refresh: a fresh hit after this time would have been stale or a miss without it
+        self.credit_after: Optional[float] = None
+
+    def decayed(self, now: float, half_life: float) -> float:
+        return self.score * 0.5 ** ((now - self.updated) / half_life)
+
+
+def _popular_favorite_genres(limit: int) -> List[str]:
+    db = SessionLocal()
+    try:
+        rows = db.query(Genre.name).join(user_genre, user_genre.c.genre_id == Genre.id).group_by(Genre.name) \
+            .order_by(func.count().desc()).limit(limit)
+        return [name for name, in rows]
+    finally:
+        db.close()
+
+
+class CacheWarmer:
+    def __init__(
+        self,
+        service: AniListService,
+        top_k: int = 50,
+        interval: float = 15,
+        lead: float = 60,
+        reserve: float = 0.5,
+        half_life: float = 600,
+        max_keys: int = 10000,
+    ):
+        self.service = service
+        self.top_k = top_k
+        self.interval = interval
+        self.lead = lead
+        self.reserve = reserve
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self.keys: Dict[Hashable, KeyStats] = {}
+        self.counts = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0, "saved": 0, "wasted": 0}
+        self._task: Optional[asyncio.Task] = None
+        service.warmer = self
+
+    def record(self, cache_key: Hashable, ttl: int, query: str, variables: Dict[str, Any], parse,
+               entry: Optional[Tuple[Any, bool]]) -> None:
+        """Count one lookup of ``cache_key``; ``entry`` is what the cache returned for it."""
+        now = time.monotonic()
+        stats = self.keys.get(cache_key)
+        if stats is None:
+            if len(self.keys) >= self.max_keys:
+                self._prune(now)
+            stats = self.keys[cache_key] = KeyStats(ttl, query, variables, parse, now)
+            if _warming.get():
+                # Precomputed: keep it warm for a while even before anyone asks
+                stats.score = 1.0
+        if _warming.get():
+            return
+        stats.score = stats.decayed(now, self.half_life) + 1
+        stats.updated = now
+        if entry is None or not entry[1]:
+            self.counts["misses" if entry is None else "stale"] += 1
+            stats.credit_after = None
+            return
+        self.counts["hits"] += 1
+        if stats.credit_after is not None and now >= stats.credit_after:
+            self.counts["saved"] += 1
+            stats.credit_after = None
+
+    def _prune(self, now: float) -> None:
+        """Forget the less popular half of the tracked keys."""
+        ranked = sorted(self.keys, key=lambda key: self.keys[key].decayed(now, self.half_life))
+        for key in ranked[:len(ranked) // 2]:
+            del self.keys[key]
+
+    def stats(self) -> Dict[str, Any]:
+        counts = self.counts
+        lookups = counts["hits"] + counts["stale"] + counts["misses"]
+        return {
+            **counts,
+            "lookups": lookups,
+            "hit_ratio": counts["hits"] / lookups if lookups else None,
+            "hit_ratio_without_warming": (counts["hits"] - counts["saved"]) / lookups if lookups else None,
+            "tracked_keys": len(self.keys),
+            "cached_keys": len(self.service.cache),
+        }
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _has_spare_budget(self) -> bool:
+        limiter = self.service.rate_limiter
+        return (
+            self.service.breaker.state == CircuitBreaker.CLOSED
+            and limiter.remaining() > limiter.max_requests * self.reserve
+        )
+
+    async def _run(self) -> None:
+        _warming.set(True)
+        current_client.set(None)
+        if settings.WARM_PRECOMPUTE_GENRES > 0:
+            try:
+                await self.precompute(await run_in_threadpool(_popular_favorite_genres, settings.WARM_PRECOMPUTE_GENRES))
+            except Exception:
+                logger.exception("Precomputing popular genre lists failed")
+        while True:
+            try:
+                await self.refresh_due()
+            except Exception:
+                logger.exception("Cache warming failed")
+            await asyncio.sleep(self.interval)
+
+    async def precompute(self, genres: List[str]) -> int:
+        """Fetch each sort the genre index can't answer for each genre; returns how many were fetched."""
+        fetched = 0
+        for sort_type, method in SORT_METHODS.items():
+            if genre_index.supports(sort_type):
+                continue
+            for genre in genres:
+                if not self._has_spare_budget():
+                    return fetched
+                try:
+                    await getattr(self.service, method)(genres=[genre], limit=20)
+                    fetched += 1
+                except AniListUnavailable as e:
+                    logger.warning(f"Precomputing {sort_type}/{genre} failed: {e}")
+                    return fetched
+        logger.info(f"Precomputed {fetched} genre lists for {', '.join(genres)}")
+        return fetched
+
+    async def refresh_due(self) -> int:
+        """Refresh the popular keys that expire within ``lead`` seconds; returns how many were refreshed."""
+        now = time.monotonic()
+        top = heapq.nlargest(self.top_k, self.keys.items(), key=lambda item: item[1].decayed(now, self.half_life))
+        refreshed = 0
+        for cache_key, stats in top:
+            if stats.decayed(now, self.half_life) < MIN_SCORE:
+                break
+            expires_in = self.service.cache.expires_in(cache_key)
+            if expires_in is not None and expires_in > self.lead or cache_key in self.service._inflight:
+                continue
+            if not self._has_spare_budget():
+                break
+            if stats.credit_after is not None:
+                # The last warm refresh wasn't needed: nobody asked before it would have expired anyway
+                self.counts["wasted"] += 1
+            try:
+                await self.service._load(cache_key, stats.ttl, stats.query, stats.variables, stats.parse)
+            except AniListUnavailable as e:
+                logger.warning(f"Warming {cache_key} failed: {e}")
+                break
+            stats.credit_after = time.monotonic() + max(0.0, expires_in or 0.0)
+            refreshed += 1
+        self.counts["refreshes"] += refreshed
+        return refreshed
+
+
+cache_warmer = CacheWarmer(
+    anilist_service,
+    top_k=settings.WARM_TOP_K,
+    interval=settings.WARM_INTERVAL,
+    lead=settings.WARM_LEAD,
+    reserve=settings.WARM_RESERVE,
+    half_life=settings.WARM_HALF_LIFE,
+    max_keys=settings.WARM_MAX_KEYS,
+)
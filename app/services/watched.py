@@ -0,0 +1,130 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Set
+import logging
+
+from sqlalchemy import literal_column, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models.user import WatchedAnime
+from app.services.anilist import anilist_service
+from app.services.catalog import catalog_store
+
+logger = logging.getLogger(__name__)
+
+
+async def find_existing_anime(anime_ids: Iterable[int]) -> Set[int]:
+    """IDs that exist on AniList: the local catalog first, then bulk AniList lookups."""
+    anime_ids = set(anime_ids)
+    known = {anime_id for anime_id in anime_ids if catalog_store.row_of(anime_id) is not None}
+    unknown = sorted(anime_ids - known)
+    if unknown:
+        known.update(await anilist_service.get_anime_by_ids(unknown))
+    return known
+
+
+def upsert_watched_anime(db: Session, user_id: int, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert or update a user's watched rows with one INSERT ... ON CONFLICT statement.
+
+    ``rows`` are dicts of WatchedAnime columns, all with the same keys and
+    unique ``anime_id`` values. The caller commits. Returns one
+    ``{"anime_id", "id", "result"}`` dict per row, where result is
+    ``created`` or ``updated``.
+    """
+    if not rows:
+        return []
+    now = datetime.utcnow()
+    statement = insert(WatchedAnime).values([
+        {**row, "user_id": user_id, "created_at": now, "updated_at": now} for row in rows
+    ])
+    updated_columns = {
+        column: statement.excluded[column]
+        for column in rows[0]
+        if column not in ("anime_id", "user_id")
+    }
+    statement = statement.on_conflict_do_update(
+        constraint="uq_watched_anime_user_anime",
+        set_={**updated_columns, "updated_at": now},
+    ).returning(
+        WatchedAnime.id,
+        WatchedAnime.anime_id,
+        # xmax is only zero on freshly inserted row versions
+        literal_column("(xmax = 0)").label("inserted"),
+    )
+    return [
+        {"anime_id": row.anime_id, "id": row.id, "result": "created" if row.inserted else "updated"}
+        for row in db.execute(statement)
+    ]
+
+
+_CONSTRAINT_EXISTS = text("SELECT 1 FROM pg_constraint WHERE conname = 'uq_watched_anime_user_anime'")
+
+# Every (user, anime) row but the most recently updated one, with the ID of the one kept
+_DUPLICATES = text(
+    "SELECT id, kept_id, user_id, anime_id, status, rating, updated_at FROM ("
+    "SELECT id, user_id, anime_id, status, rating, updated_at, "
+    "row_number() OVER latest AS position, first_value(id) OVER latest AS kept_id "
+    "FROM watched_anime WHERE user_id IS NOT NULL AND anime_id IS NOT NULL "
+    "WINDOW latest AS (PARTITION BY user_id, anime_id ORDER BY updated_at DESC NULLS LAST, id DESC)"
+    ") AS ranked WHERE position > 1 ORDER BY user_id, anime_id, position"
+)
+
+_ADD_CONSTRAINT = text(
+    "ALTER TABLE watched_anime ADD CONSTRAINT uq_watched_anime_user_anime UNIQUE (user_id, anime_id)"
+)
+
+
+def _lock_watched(connection) -> None:
+    # Keeps out concurrent writers, and other processes starting up, until the constraint is in
+    connection.execute(text("LOCK TABLE watched_anime IN SHARE ROW EXCLUSIVE MODE"))
+
+
+def ensure_watched_unique(engine) -> None:
+    """Add ``uq_watched_anime_user_anime`` to a ``watched_anime`` created before it; call after ``create_all``.
+
+    Never deletes rows: if duplicate (user, anime) rows block the constraint,
+    raises RuntimeError pointing at the ``dedupe-watched`` command instead.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        if connection.execute(_CONSTRAINT_EXISTS).first():
+            return
+        _lock_watched(connection)
+        if connection.execute(_CONSTRAINT_EXISTS).first():
+            return
+        duplicates = len(connection.execute(_DUPLICATES).all())
+        if duplicates:
+            raise RuntimeError(
+                f"watched_anime has {duplicates} duplicate (user, anime) rows, so uq_watched_anime_user_anime "
+                "can't be added. Review them with `python -m app.cli dedupe-watched`, then remove them "
+                "with `python -m app.cli dedupe-watched --apply`"
+            )
+        connection.execute(_ADD_CONSTRAINT)
+
+
+def dedupe_watched_anime(engine, apply: bool = False) -> List[Dict[str, Any]]:
+    """Duplicate ``watched_anime`` rows, keeping each (user, anime)'s most recently updated one.
+
+    With ``apply`` the duplicates are deleted and the unique constraint added,
+    in one transaction; otherwise nothing is changed. Postgres only, like
+    ``ensure_watched_unique``; other engines get the constraint from ``create_all``.
+    """
+    if engine.dialect.name != "postgresql":
+        return []
+    with engine.begin() as connection:
+        _lock_watched(connection)
+        duplicates = [dict(row) for row in connection.execute(_DUPLICATES).mappings()]
+        if apply:
+            if duplicates:
+                connection.execute(
+                    WatchedAnime.__table__.delete().where(WatchedAnime.id.in_([row["id"] for row in duplicates]))
+                )
+            if not connection.execute(_CONSTRAINT_EXISTS).first():
+                connection.execute(_ADD_CONSTRAINT)
+    if apply and duplicates:
+        # Deletes don't show up in delta refreshes
+        logger.warning(
+            f"Removed {len(duplicates)} duplicate watched_anime rows; run refresh-community-stats --full to recount"
+        )
+    return duplicates
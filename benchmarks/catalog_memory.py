@@ -0,0 +1,94 @@
+"""Measure per-worker memory of the catalog held as AnimeBase objects vs CatalogStore.
+
+Each variant runs in a fresh child process and reports how much its RSS
+and its anonymous (heap, never shared between workers) memory grow. The
+store's file-backed pages are page cache that every worker maps. Run with:
+
+    python -m benchmarks.catalog_memory [--count 20000]
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import tempfile
+
+from benchmarks.payloads import GENRES, make_catalog
+
+
+def _memory_kb():
+    """Return (rss, anonymous) in KiB for the current process."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Anonymous"):
+                values[name] = int(value.split()[0])
+    return values["Rss"], values["Anonymous"]
+
+
+def _measure_models(count, queue):
+    from app.services.anilist import AniListService
+
+    service = AniListService()
+    raw = make_catalog(count)
+    gc.collect()
+    before = _memory_kb()
+    catalog = [service._parse_anime(media) for media in raw]
+    gc.collect()
+    after = _memory_kb()
+    queue.put((after[0] - before[0], after[1] - before[1], len(catalog)))
+
+
+def _measure_store(path, queue):
+    from app.services.catalog import CatalogStore
+
+    gc.collect()
+    before = _memory_kb()
+    store = CatalogStore()
+    store.load(path)
+    # Touch every page, as a full scan by the indexes would
+    for column in store.columns.values():
+        column.sum()
+    for name in store._string_data:
+        store._string_data[name].sum()
+    gc.collect()
+    after = _memory_kb()
+    queue.put((after[0] - before[0], after[1] - before[1], len(store)))
+
+
+def _run(target, *args):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=args + (queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    from app.services.catalog import CatalogBuilder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog")
+        builder = CatalogBuilder(GENRES)
+        for media in make_catalog(args.count):
+            builder.add(media)
+        builder.save(path)
+        del builder
+        file_kb = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) // 1024
+
+        models = _run(_measure_models, args.count)
+        store = _run(_measure_store, path)
+
+    print(f"{args.count} titles")
+    print(f"  List[AnimeBase]  rss +{models[0]:8d} KiB  anonymous +{models[1]:8d} KiB")
+    print(f"  CatalogStore     rss +{store[0]:8d} KiB  anonymous +{store[1]:8d} KiB  (files: {file_kb} KiB, shared)")
+    print(f"  Per-worker reduction: {models[1] / max(store[1], 1):.1f}x anonymous, {models[0] / max(store[0], 1):.1f}x rss")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Generate a synthetic Postgres dataset and time the user list and stats endpoints on it.
+
+Creates N users with M watched rows each (plus a few reviews) through
+COPY, so millions of rows load in seconds, then times the route functions
+behind ``/user/stats``, ``/user/watched``, ``/user/watchlist`` and
+``/user/favorites`` for a sample of users. Uses the app's database
+settings unless ``--database-url`` is given:
+
+    python -m benchmarks.dataset generate --users 1000 --watched 500
+    python -m benchmarks.dataset bench --samples 50
+    python -m benchmarks.dataset drop
+"""
+import argparse
+import io
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from benchmarks.payloads import GENRES
+
+USERNAME_PREFIX = "bench-user-"
+STATUS_WEIGHTS = {"completed": 50, "watching": 15, "plan_to_watch": 20, "dropped": 10, "on_hold": 5}
+# bcrypt is slow and nobody logs in as these users, so share one placeholder hash
+PLACEHOLDER_HASH = "$2b$12$" + "x" * 53
+
+
+def _engine(database_url: str = None) -> Engine:
+    if database_url:
+        return create_engine(database_url)
+    from app.db.session import engine
+    return engine
+
+
+def _copy(connection, table: str, columns: List[str], rows) -> None:
+    """COPY rows (tuples) into table through the raw psycopg2 cursor."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join("\\N" if value is None else str(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def generate(engine: Engine, users: int, watched: int, catalog_size: int, seed: int = 0) -> None:
+    from app.db.session import Base
+    import app.models.user  # noqa: F401 - registers the tables
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    statuses, weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+    started = time.perf_counter()
+
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+            first_id = cursor.fetchone()[0] + 1
+        _copy(raw, "users", ["id", "email", "username", "hashed_password", "is_active"], (
+            (first_id + i, f"{USERNAME_PREFIX}{first_id + i}@example.com", f"{USERNAME_PREFIX}{first_id + i}",
+             PLACEHOLDER_HASH, "t")
+            for i in range(users)
+        ))
+        with raw.cursor() as cursor:
+            cursor.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))")
+            cursor.execute("INSERT INTO genres (name) SELECT unnest(%s) ON CONFLICT DO NOTHING", (GENRES,))
+        raw.commit()
+
+        for offset in range(users):
+            user_id = first_id + offset
+            # Popular titles are watched more often, as on AniList
+            anime_ids = set()
+            while len(anime_ids) < min(watched, catalog_size):
+                anime_ids.add(min(catalog_size, int(rng.paretovariate(0.8))))
+            _copy(raw, "watched_anime", ["user_id", "anime_id", "title", "status", "episodes_watched", "rating"], (
+                (user_id, anime_id, f"Anime {anime_id}", rng.choices(statuses, weights)[0],
+                 rng.randint(0, 26), rng.randint(1, 10) if rng.random() < 0.7 else None)
+                for anime_id in anime_ids
+            ))
+            reviewed = rng.sample(sorted(anime_ids), min(len(anime_ids), max(1, watched // 20)))
+            _copy(raw, "reviews", ["user_id", "anime_id", "title", "content", "rating"], (
+                (user_id, anime_id, f"Review of {anime_id}", "Synthetic review text", rng.randint(1, 10))
+                for anime_id in reviewed
+            ))
+            if (offset + 1) % 100 == 0:
+                raw.commit()
+                print(f"  {offset + 1}/{users} users")
+        raw.commit()
+    finally:
+        raw.close()
+    print(f"Generated {users} users x {watched} watched rows in {time.perf_counter() - started:.1f}s")
+
+
+def bench(engine: Engine, samples: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    from starlette.requests import Request
+
+    from app.api.user import get_favorites, get_user_stats, get_watched_anime, get_watchlist
+    from app.services.user_versions import user_versions
+
+    routes: Dict[str, Callable] = {
+        "/user/stats": get_user_stats,
+        "/user/watched": get_watched_anime,
+        "/user/watchlist": get_watchlist,
+        "/user/favorites": get_favorites,
+    }
+    with Session(engine) as db:
+        user_ids = [row[0] for row in db.execute(
+            text("SELECT id FROM users WHERE username LIKE :prefix"), {"prefix": USERNAME_PREFIX + "%"}
+        )]
+    if not user_ids:
+        raise SystemExit("No benchmark users found; run the generate command first")
+    sample = random.Random(seed).sample(user_ids, min(samples, len(user_ids)))
+
+    results = {}
+    for name, route in routes.items():
+        timings = []
+        for user_id in sample:
+            # A fresh session per call, like a request, so nothing is served from the identity map
+            with Session(engine) as db:
+                # Time the query and serialization, not a response cache hit
+                user_versions.snapshots.clear()
+                request = Request({"type": "http", "method": "GET", "path": name, "headers": []})
+                started = time.perf_counter()
+                route(request=request, db=db, user_id=user_id)
+                timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            "p50_ms": statistics.median(timings),
+            "p95_ms": timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+            "max_ms": timings[-1],
+        }
+        print(f"  {name:<18} p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms  "
+              f"max {results[name]['max_ms']:8.2f} ms")
+    return results
+
+
+def drop(engine: Engine) -> None:
+    with engine.begin() as connection:
+        ids = "SELECT id FROM users WHERE username LIKE :prefix"
+        params = {"prefix": USERNAME_PREFIX + "%"}
+        for table in ("reviews", "watched_anime", "user_genre"):
+            connection.execute(text(f"DELETE FROM {table} WHERE user_id IN ({ids})"), params)
+        deleted = connection.execute(text("DELETE FROM users WHERE username LIKE :prefix"), params).rowcount
+    print(f"Deleted {deleted} benchmark users")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    gen = subparsers.add_parser("generate")
+    gen.add_argument("--users", type=int, default=1000)
+    gen.add_argument("--watched", type=int, default=200, help="Watched rows per user")
+    gen.add_argument("--catalog-size", type=int, default=20000)
+    run = subparsers.add_parser("bench")
+    run.add_argument("--samples", type=int, default=50, help="Users to time each route for")
+    subparsers.add_parser("drop")
+    args = parser.parse_args()
+
+    engine = _engine(args.database_url)
+    if args.command == "generate":
+        generate(engine, args.users, args.watched, args.catalog_size, args.seed)
+    elif args.command == "bench":
+        bench(engine, args.samples, args.seed)
+    else:
+        drop(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Offline evaluation of the recommendation strategies on held-out ratings.
+
+Builds per-user histories, either synthetic ones drawn from the fake
+AniList catalog (users with favorite genres who follow recommendation
+edges, rating titles by how well they match their taste) or a snapshot of
+the app's ``watched_anime`` table, with review ratings filling in
+entries the user didn't rate. The latest ``--holdout`` fraction of
+each history is held out. Each strategy in ``app.services.recommender``
+(and ``cascade``, the fallback chain the endpoint uses) then recommends
+from the rest, against the fake AniList server
+(benchmarks.fake_anilist). Held-out titles the user didn't drop or rate
+below ``--min-rating`` count as relevant.
+
+Reports precision, recall and NDCG at ``k`` per strategy, next to the
+per-request latency and the AniList requests it cost. Users are split
+across a process pool. Each strategy gets a fresh pool, so none of them
+benefits from another's cache. The catalog and recommendation graph are
+harvested from the fake server first, like ``app.cli`` would, and every
+worker memory-maps the same files:
+
+    python -m benchmarks.evaluate --users 500 --k 10 --workers 4
+    python -m benchmarks.evaluate --source database --strategies graph,last_watched
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from benchmarks.fake_anilist import FakeAniList, FakeConfig
+from benchmarks.load import percentile
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# (anime ID, status, rating) in the order the user added them, as in app.services.ranking.UserProfile
+Entry = Tuple[int, Optional[str], Optional[float]]
+User = Dict[str, Any]  # {"id", "favorite_genres", "history"}
+
+
+def synthetic_users(fake: FakeAniList, count: int, history: Tuple[int, int], seed: int = 0) -> List[User]:
+    """Users who mostly watch popular titles in their favorite genres and follow recommendations."""
+    rng = random.Random(seed)
+    genres = sorted({genre for media in fake.catalog for genre in media["genres"]})
+    by_genre: Dict[str, List[Dict[str, Any]]] = {genre: [] for genre in genres}
+    for media in fake.catalog:
+        for genre in media["genres"]:
+            by_genre[genre].append(media)
+    users = []
+    for user_id in range(1, count + 1):
+        favorites = rng.sample(genres, rng.randint(1, 3))
+        pool = [media for genre in favorites for media in by_genre[genre]]
+        weights = [media["popularity"] for media in pool]
+        entries: List[Entry] = []
+        seen = set()
+        for _ in range(rng.randint(*history) * 4):
+            if len(entries) >= history[1]:
+                break
+            liked = [anime_id for anime_id, _, rating in entries if rating is None or rating >= 7]
+            if liked and rng.random() < 0.5:
+                media = fake.by_id[rng.choice(fake._edges.get(rng.choice(liked)) or [liked[0]])]
+            else:
+                media = rng.choices(pool, weights)[0]
+            if media["id"] in seen:
+                continue
+            seen.add(media["id"])
+            overlap = len(set(media["genres"]) & set(favorites)) / len(media["genres"])
+            rating = max(1, min(10, round(rng.gauss(4 + 5 * overlap, 1.5))))
+            status = "dropped" if rating <= 3 and rng.random() < 0.5 else "completed"
+            entries.append((media["id"], status, None if rng.random() < 0.2 else rating))
+        users.append({"id": user_id, "favorite_genres": favorites, "history": entries})
+    return users
+
+
+def database_users(limit: int) -> List[User]:
+    """Histories of the first ``limit`` users with any watched rows, oldest entry first."""
+    from app.db.session import SessionLocal
+    from app.models.user import Genre, Review, WatchedAnime, user_genre
+
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for user_id, in db.query(WatchedAnime.user_id).distinct().order_by(WatchedAnime.user_id).limit(limit)]
+        histories: Dict[int, List[Entry]] = {user_id: [] for user_id in user_ids}
+        rows = db.query(WatchedAnime.user_id, WatchedAnime.anime_id, WatchedAnime.status, WatchedAnime.rating) \
+            .filter(WatchedAnime.user_id.in_(user_ids)).order_by(WatchedAnime.user_id, WatchedAnime.created_at, WatchedAnime.id)
+        reviewed = {
+            (user_id, anime_id): rating
+            for user_id, anime_id, rating in db.query(Review.user_id, Review.anime_id, Review.rating)
+            .filter(Review.user_id.in_(user_ids))
+        }
+        for user_id, anime_id, status, rating in rows:
+            if rating is None:
+                rating = reviewed.get((user_id, anime_id))
+            histories[user_id].append((anime_id, status, rating))
+        favorites: Dict[int, List[str]] = {user_id: [] for user_id in user_ids}
+        genre_rows = db.query(user_genre.c.user_id, Genre.name).join(Genre, Genre.id == user_genre.c.genre_id) \
+            .filter(user_genre.c.user_id.in_(user_ids))
+        for user_id, name in genre_rows:
+            favorites[user_id].append(name)
+    finally:
+        db.close()
+    return [{"id": user_id, "favorite_genres": favorites[user_id], "history": histories[user_id]} for user_id in user_ids]
+
+
+def split(user: User, holdout: float, min_rating: float) -> Optional[Tuple[User, List[int]]]:
+    """The user with the latest entries held out, and the relevant held-out IDs; None if nothing is left to test."""
+    history = user["history"]
+    held = max(1, math.ceil(len(history) * holdout))
+    if len(history) <= held:
+        return None
+    relevant = [
+        anime_id for anime_id, status, rating in history[-held:]
+        if status != "dropped" and (rating is None or rating >= min_rating)
+    ]
+    if not relevant:
+        return None
+    return {**user, "history": history[:-held]}, relevant
+
+
+def community_columns(cases: List[Tuple[User, List[int]]]) -> List[List[float]]:
+    """Community stats columns (see CommunitySnapshot.replace) over the users' visible histories."""
+    stats: Dict[int, List[float]] = {}
+    for user, _ in cases:
+        for anime_id, _, rating in user["history"]:
+            entry = stats.setdefault(anime_id, [0, 0.0, 0])
+            entry[0] += 1
+            if rating is not None:
+                entry[1] += rating
+                entry[2] += 1
+    ids = sorted(stats)
+    return [ids] + [[stats[anime_id][i] for anime_id in ids] for i in range(3)]
+
+
+def metrics(recommended: List[int], relevant: List[int], k: int) -> Dict[str, float]:
+    relevant_set = set(relevant)
+    gains = [1.0 if anime_id in relevant_set else 0.0 for anime_id in recommended[:k]]
+    dcg = sum(gain / math.log2(rank + 2) for rank, gain in enumerate(gains))
+    ideal = sum(1.0 / math.log2(rank + 2) for rank in range(min(k, len(relevant_set))))
+    return {
+        "precision": sum(gains) / k,
+        "recall": sum(gains) / len(relevant_set),
+        "ndcg": dcg / ideal,
+    }
+
+
+# Worker side; each process imports the app once, with the environment set up by the parent
+
+async def _evaluate_chunk(
+    strategy: str, cases: List[Tuple[User, List[int]]], k: int, community: List[List[float]]
+) -> List[Dict[str, float]]:
+    from app.core.config import settings
+    from app.services.anilist import anilist_service
+    from app.services.catalog import catalog_store
+    from app.services.community import community_snapshot
+    from app.services.ranking import UserProfile
+    from app.services.rec_graph import rec_graph
+    from app.services.recommender import STRATEGIES, recommend
+
+    catalog_store.load(settings.CATALOG_PATH)
+    rec_graph.load(settings.REC_GRAPH_PATH)
+    community_snapshot.replace(*community)
+    if strategy == "cascade":
+        run = recommend
+    else:
+        run = STRATEGIES[strategy]
+    results = []
+    try:
+        for user, relevant in cases:
+            profile = UserProfile(favorite_genres=user["favorite_genres"], history=[tuple(e) for e in user["history"]])
+            started = time.perf_counter()
+            try:
+                recommended = [anime.id for anime in await run(profile, k)]
+                failed = False
+            except Exception:
+                recommended, failed = [], True
+            result = metrics(recommended, relevant, k)
+            result.update(latency_ms=(time.perf_counter() - started) * 1000, empty=not recommended, failed=failed)
+            results.append(result)
+    finally:
+        await anilist_service.close()
+    return results
+
+
+def evaluate_chunk(
+    strategy: str, cases: List[Tuple[User, List[int]]], k: int, community: List[List[float]]
+) -> List[Dict[str, float]]:
+    return asyncio.run(_evaluate_chunk(strategy, cases, k, community))
+
+
+def summarize(results: List[Dict[str, float]], upstream: Dict[str, int], k: int) -> Dict[str, Any]:
+    latencies = sorted(result["latency_ms"] for result in results)
+    count = len(results)
+    return {
+        "users": count,
+        f"precision@{k}": statistics.fmean(r["precision"] for r in results) if results else None,
+        f"recall@{k}": statistics.fmean(r["recall"] for r in results) if results else None,
+        f"ndcg@{k}": statistics.fmean(r["ndcg"] for r in results) if results else None,
+        "empty": sum(1 for r in results if r["empty"]),
+        "failed": sum(1 for r in results if r["failed"]),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "upstream_requests_per_request": upstream.get("requests", 0) / count if count else 0.0,
+        "upstream_queries_per_request": upstream.get("queries", 0) / count if count else 0.0,
+        "upstream": upstream,
+    }
+
+
+async def _upstream_stats(upstream_url: str, reset: bool = False) -> Dict[str, int]:
+    async with aiohttp.ClientSession() as session:
+        if reset:
+            async with session.post(f"{upstream_url}/__stats/reset") as response:
+                return await response.json()
+        async with session.get(f"{upstream_url}/__stats") as response:
+            return await response.json()
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+    from aiohttp import web
+
+    config = FakeConfig(count=args.count, seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    fake = FakeAniList(config)
+    runner = web.AppRunner(fake.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.upstream_port).start()
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    data_dir = tempfile.mkdtemp(prefix="evaluate-")
+    # Read by app.core.config in this process and in every (spawned) worker
+    os.environ.update({
+        "ANILIST_API_URL": upstream_url,
+        "ANILIST_RATE_LIMIT": str(args.client_rate_limit),
+        "CATALOG_PATH": os.path.join(data_dir, "catalog"),
+        "REC_GRAPH_PATH": os.path.join(data_dir, "rec_graph"),
+    })
+    try:
+        from app.services.anilist import anilist_service
+        from app.services.catalog import sync_catalog
+        from app.services.rec_graph import sync_rec_graph
+
+        await sync_catalog(anilist_service, os.environ["CATALOG_PATH"])
+        await sync_rec_graph(anilist_service, os.environ["REC_GRAPH_PATH"])
+        await anilist_service.close()
+
+        if args.source == "synthetic":
+            users = synthetic_users(fake, args.users, (args.min_history, args.max_history), args.seed)
+        else:
+            users = database_users(args.users)
+        cases = [case for case in (split(user, args.holdout, args.min_rating) for user in users) if case]
+        chunks = [cases[i::args.workers] for i in range(args.workers)]
+        # What the community stats job would have counted from the visible histories
+        community = community_columns(cases)
+
+        loop = asyncio.get_running_loop()
+        report: Dict[str, Any] = {"cases": len(cases), "strategies": {}}
+        for strategy in args.strategies.split(","):
+            # A fresh pool per strategy, so every one starts with cold caches
+            with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                await _upstream_stats(upstream_url, reset=True)
+                parts = await asyncio.gather(*[
+                    loop.run_in_executor(pool, evaluate_chunk, strategy, chunk, args.k, community) for chunk in chunks if chunk
+                ])
+            upstream = await _upstream_stats(upstream_url)
+            report["strategies"][strategy] = summarize([r for part in parts for r in part], upstream, args.k)
+    finally:
+        await runner.cleanup()
+    report["config"] = {key: value for key, value in vars(args).items() if key != "output"}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", choices=["synthetic", "database"], default="synthetic")
+    parser.add_argument("--strategies", default="graph,last_watched,genre_popular,community,popular,cascade",
+                        help="Comma-separated names from app.services.recommender.STRATEGIES, or cascade")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--min-history", type=int, default=10, help="Synthetic entries per user, at least")
+    parser.add_argument("--max-history", type=int, default=60)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of each history held out, latest first")
+    parser.add_argument("--min-rating", type=float, default=7, help="Lowest held-out rating that counts as relevant")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", type=int, default=3000, help="Titles in the synthetic catalog")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--upstream-port", type=int, default=8100)
+    parser.add_argument("--client-rate-limit", type=int, default=100000, help="ANILIST_RATE_LIMIT for each worker")
+    parser.add_argument("--output", default=None, help="Report path (default: benchmarks/results/evaluate-<time>.json)")
+    args = parser.parse_args()
+
+    started_at = time.strftime("%Y%m%dT%H%M%S")
+    report = asyncio.run(_main(args))
+    report["started_at"] = started_at
+
+    k = args.k
+    print(f"{report['cases']} users with held-out titles, k={k}")
+    print(f"  {'strategy':<14} {'P@k':>7} {'R@k':>7} {'NDCG@k':>7} {'empty':>6} {'p50 ms':>8} {'p95 ms':>8} {'upstream/req':>13}")
+    for strategy, stats in report["strategies"].items():
+        print(f"  {strategy:<14} {stats[f'precision@{k}'] or 0:7.4f} {stats[f'recall@{k}'] or 0:7.4f} "
+              f"{stats[f'ndcg@{k}'] or 0:7.4f} {stats['empty']:>6} {stats['p50_ms'] or 0:8.1f} "
+              f"{stats['p95_ms'] or 0:8.1f} {stats['upstream_requests_per_request']:13.2f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"evaluate-{started_at}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""A local stand-in for graphql.anilist.co, for load tests and offline runs.
+
+Answers ``Page``/``Media``/``GenreCollection`` queries (aliased batches
+included) from a seeded synthetic catalog, where releasing titles air an
+episode every ``--airing-period`` seconds, with configurable latency,
+jitter, error rate and an AniList-style per-minute rate limit that answers
+429 with ``Retry-After``. ``GET /__stats`` reports request counters and
+``POST /__stats/reset`` clears them. Run with:
+
+    python -m benchmarks.fake_anilist --port 8100 --count 5000 --latency-ms 80
+
+and point the app at it with ``ANILIST_API_URL=http://127.0.0.1:8100``.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import web
+from graphql import GraphQLError, build_schema, graphql
+
+from benchmarks.payloads import GENRES, make_catalog
+
+SCHEMA = build_schema("""
+    enum MediaType { ANIME MANGA }
+    enum AiringSort { TIME TIME_DESC }
+    enum RecommendationSort { ID ID_DESC RATING RATING_DESC }
+    enum MediaSort {
+        ID ID_DESC POPULARITY POPULARITY_DESC TRENDING TRENDING_DESC SCORE SCORE_DESC
+        START_DATE START_DATE_DESC SEARCH_MATCH
+    }
+
+    type MediaTitle { english: String romaji: String native: String userPreferred: String }
+    type MediaCoverImage { large: String medium: String color: String extraLarge: String }
+    type FuzzyDate { year: Int month: Int day: Int }
+    type AiringSchedule { id: Int airingAt: Int timeUntilAiring: Int episode: Int mediaId: Int media: Media }
+    type PageInfo { total: Int perPage: Int currentPage: Int lastPage: Int hasNextPage: Boolean }
+    type Recommendation { id: Int rating: Int mediaRecommendation: Media }
+    type RecommendationConnection { nodes: [Recommendation] pageInfo: PageInfo }
+
+    type Media {
+        id: Int
+        idMal: Int
+        type: MediaType
+        title: MediaTitle
+        synonyms: [String]
+        genres: [String]
+        description(asHtml: Boolean): String
+        averageScore: Int
+        meanScore: Int
+        popularity: Int
+        trending: Int
+        favourites: Int
+        episodes: Int
+        status: String
+        coverImage: MediaCoverImage
+        startDate: FuzzyDate
+        endDate: FuzzyDate
+        nextAiringEpisode: AiringSchedule
+        isAdult: Boolean
+        recommendations(page: Int, perPage: Int, sort: [RecommendationSort]): RecommendationConnection
+    }
+
+    type Page {
+        pageInfo: PageInfo
+        media(
+            id: Int, id_in: [Int], idMal: Int, idMal_in: [Int], search: String, type: MediaType,
+            genre_in: [String], genre_not_in: [String], isAdult: Boolean, sort: [MediaSort]
+        ): [Media]
+        airingSchedules(
+            mediaId: Int, mediaId_in: [Int], airingAt_greater: Int, airingAt_lesser: Int, sort: [AiringSort]
+        ): [AiringSchedule]
+    }
+
+    type Query {
+        Page(page: Int, perPage: Int): Page
+        Media(id: Int, idMal: Int, type: MediaType, search: String): Media
+        GenreCollection: [String]
+    }
+""")
+
+MAX_PER_PAGE = 50
+
+_SORT_KEYS = {
+    "ID": ("id", False),
+    "ID_DESC": ("id", True),
+    "POPULARITY": ("popularity", False),
+    "POPULARITY_DESC": ("popularity", True),
+    "TRENDING": ("trending", False),
+    "TRENDING_DESC": ("trending", True),
+    "SCORE": ("averageScore", False),
+    "SCORE_DESC": ("averageScore", True),
+    "START_DATE": ("startDate", False),
+    "START_DATE_DESC": ("startDate", True),
+}
+
+
+class NotFound(Exception):
+    """Rendered like AniList's ``{"message": "Not Found.", "status": 404}`` errors."""
+
+
+@dataclass
+class FakeConfig:
+    count: int = 5000
+    seed: int = 0
+    latency_ms: float = 50.0
+    jitter_ms: float = 20.0
+    error_rate: float = 0.0
+    rate_limit: int = 0  # requests per minute, 0 disables throttling
+    recommendations: int = 10
+    airing_period: int = 7 * 24 * 60 * 60  # seconds between episodes of a releasing title
+
+
+class FakeAniList:
+    """Synthetic catalog plus the GraphQL resolvers that serve it."""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.catalog: List[Dict[str, Any]] = make_catalog(config.count, config.seed)
+        self.by_id: Dict[int, Dict[str, Any]] = {}
+        self.by_mal_id: Dict[int, Dict[str, Any]] = {}
+        for media in self.catalog:
+            media["idMal"] = media["id"] + 100000
+            media["trending"] = int(media["popularity"] * self.rng.random())
+            media["type"] = "ANIME"
+            media["recommendations"] = self._recommendations_resolver(media)
+            self.by_id[media["id"]] = media
+            self.by_mal_id[media["idMal"]] = media
+        self._edges = self._build_recommendations()
+        self._airing_epoch = int(time.time())
+        self._window: Deque[float] = deque()
+        self.stats = {"requests": 0, "queries": 0, "throttled": 0, "errors": 0}
+
+    def _build_recommendations(self) -> Dict[int, List[int]]:
+        """Link each title to popular titles that share a genre with it."""
+        by_genre: Dict[str, List[Dict[str, Any]]] = {genre: [] for genre in GENRES}
+        for media in sorted(self.catalog, key=lambda m: -m["popularity"]):
+            for genre in media["genres"]:
+                by_genre[genre].append(media)
+        edges = {}
+        for media in self.catalog:
+            pool = [m["id"] for genre in media["genres"] for m in by_genre[genre][:100] if m is not media]
+            rng = random.Random(media["id"])
+            edges[media["id"]] = rng.sample(pool, min(len(pool), self.config.recommendations))
+        return edges
+
+    def _recommendations_resolver(self, media: Dict[str, Any]):
+        # Edges are stored best rated first, the order RATING_DESC asks for
+        def resolve(info, page: int = 1, perPage: int = 25, sort: Optional[List[str]] = None):
+            ids = self._edges.get(media["id"], [])
+            start = (page - 1) * perPage
+            return {
+                "nodes": [
+                    {"id": media["id"] * 1000 + i, "rating": 10 - i, "mediaRecommendation": self.by_id[rec_id]}
+                    for i, rec_id in enumerate(ids[start:start + perPage])
+                ],
+                "pageInfo": {"hasNextPage": start + perPage < len(ids), "currentPage": page, "perPage": perPage},
+            }
+        return resolve
+
+    # Root resolvers; graphql-core calls dict values that are callables with (info, **args)
+
+    def root(self) -> Dict[str, Any]:
+        return {"Page": self._page, "Media": self._media, "GenreCollection": lambda info: list(GENRES)}
+
+    def _media(self, info, id: Optional[int] = None, idMal: Optional[int] = None, search: Optional[str] = None, **_):
+        if id is not None:
+            media = self.by_id.get(id)
+        elif idMal is not None:
+            media = self.by_mal_id.get(idMal)
+        else:
+            matches = self._filter(search=search)
+            media = matches[0] if matches else None
+        if media is None:
+            raise NotFound("Not Found.")
+        return media
+
+    def _page(self, info, page: int = 1, perPage: int = MAX_PER_PAGE):
+        perPage = max(1, min(perPage, MAX_PER_PAGE))
+        state = {}
+
+        def media(info, sort: Optional[List[str]] = None, **filters):
+            matches = self._filter(**filters)
+            for key in reversed(sort or []):
+                if key in _SORT_KEYS:
+                    field, descending = _SORT_KEYS[key]
+                    matches.sort(key=lambda m: _sort_value(m, field), reverse=descending)
+            state["total"] = len(matches)
+            start = (page - 1) * perPage
+            return matches[start:start + perPage]
+
+        # Async so it runs after the list field it describes, which AniList queries list first
+        async def page_info(info):
+            total = state.get("total", len(self.catalog))
+            return {
+                "total": total,
+                "perPage": perPage,
+                "currentPage": page,
+                "lastPage": max(1, -(-total // perPage)),
+                "hasNextPage": page * perPage < total,
+            }
+
+        def airing_schedules(info, sort: Optional[List[str]] = None, **filters):
+            matches = self._airing(**filters)
+            if sort and sort[0] == "TIME_DESC":
+                matches.reverse()
+            state["total"] = len(matches)
+            start = (page - 1) * perPage
+            return matches[start:start + perPage]
+
+        return {"media": media, "airingSchedules": airing_schedules, "pageInfo": page_info}
+
+    def _airing(
+        self,
+        mediaId: Optional[int] = None,
+        mediaId_in: Optional[List[int]] = None,
+        airingAt_greater: Optional[int] = None,
+        airingAt_lesser: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Episodes of releasing titles, each airing at a fixed offset within every period, by time."""
+        period = self.config.airing_period
+        ids = [mediaId] if mediaId is not None else mediaId_in
+        titles = [self.by_id[i] for i in ids if i in self.by_id] if ids is not None else self.catalog
+        after = airingAt_greater if airingAt_greater is not None else int(time.time())
+        before = airingAt_lesser if airingAt_lesser is not None else after + period
+        schedules = []
+        for media in titles:
+            if media["status"] != "RELEASING":
+                continue
+            # Episode 1 aired in the period before the server started
+            first = self._airing_epoch - period + media["id"] * 7919 % period
+            episode = max(1, (after - first) // period + 2)  # first episode airing after `after`
+            while first + (episode - 1) * period < before:
+                airing_at = first + (episode - 1) * period
+                schedules.append({
+                    "id": media["id"] * 10000 + episode, "mediaId": media["id"], "episode": episode,
+                    "airingAt": airing_at, "timeUntilAiring": airing_at - int(time.time()), "media": media,
+                })
+                episode += 1
+        schedules.sort(key=lambda s: (s["airingAt"], s["mediaId"]))
+        return schedules
+
+    def _filter(
+        self,
+        id: Optional[int] = None,
+        id_in: Optional[List[int]] = None,
+        idMal: Optional[int] = None,
+        idMal_in: Optional[List[int]] = None,
+        search: Optional[str] = None,
+        genre_in: Optional[List[str]] = None,
+        genre_not_in: Optional[List[str]] = None,
+        isAdult: Optional[bool] = None,
+        **_,
+    ) -> List[Dict[str, Any]]:
+        if id is not None or id_in is not None:
+            ids = [id] if id is not None else id_in
+            matches = [self.by_id[i] for i in ids if i in self.by_id]
+        elif idMal is not None or idMal_in is not None:
+            ids = [idMal] if idMal is not None else idMal_in
+            matches = [self.by_mal_id[i] for i in ids if i in self.by_mal_id]
+        else:
+            matches = self.catalog
+        if search:
+            words = search.lower().split()
+            matches = [m for m in matches if all(word in _search_text(m) for word in words)]
+        if genre_in:
+            wanted = set(genre_in)
+            matches = [m for m in matches if wanted.intersection(m["genres"])]
+        if genre_not_in:
+            unwanted = set(genre_not_in)
+            matches = [m for m in matches if not unwanted.intersection(m["genres"])]
+        if isAdult is not None:
+            matches = [m for m in matches if m["isAdult"] == isAdult]
+        return list(matches)
+
+    def _throttled(self) -> Optional[float]:
+        """Seconds until the next request is allowed, or None if it may proceed."""
+        if not self.config.rate_limit:
+            return None
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 60:
+            self._window.popleft()
+        if len(self._window) >= self.config.rate_limit:
+            return 60 - (now - self._window[0])
+        self._window.append(now)
+        return None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        delay = self.config.latency_ms + self.rng.uniform(-1, 1) * self.config.jitter_ms
+        await asyncio.sleep(max(0.0, delay) / 1000)
+
+        retry_after = self._throttled()
+        if retry_after is not None:
+            self.stats["throttled"] += 1
+            return web.json_response(
+                {"data": None, "errors": [{"message": "Too Many Requests.", "status": 429}]},
+                status=429,
+                headers={"Retry-After": str(int(retry_after) + 1), "X-RateLimit-Remaining": "0"},
+            )
+        if self.rng.random() < self.config.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"data": None, "errors": [{"message": "Internal Server Error", "status": 500}]}, status=500)
+
+        body = await request.json()
+        document = body.get("query") or ""
+        # Root fields in the document, so batched queries count individually
+        self.stats["queries"] += max(1, document.count("Page(") + document.count("Media(") + document.count("GenreCollection"))
+        result = await graphql(SCHEMA, document, root_value=self.root(), variable_values=body.get("variables"))
+        payload: Dict[str, Any] = {"data": result.data}
+        if result.errors:
+            payload["errors"] = [_format_error(error) for error in result.errors]
+        return web.json_response(payload)
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        if request.method == "POST":
+            for key in self.stats:
+                self.stats[key] = 0
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        app.router.add_get("/__stats", self.handle_stats)
+        app.router.add_post("/__stats/reset", self.handle_stats)
+        return app
+
+
+def _sort_value(media: Dict[str, Any], field: str):
+    value = media.get(field)
+    if field == "startDate":
+        value = value or {}
+        return (value.get("year") or 0, value.get("month") or 0, value.get("day") or 0)
+    return value if value is not None else -1
+
+
+def _search_text(media: Dict[str, Any]) -> str:
+    cached = media.get("_search_text")
+    if cached is None:
+        title = media["title"]
+        parts = [title.get("english") or "", title.get("romaji") or "", *media.get("synonyms", [])]
+        cached = media["_search_text"] = " ".join(parts).lower()
+    return cached
+
+
+def _format_error(error: GraphQLError) -> Dict[str, Any]:
+    formatted = error.formatted
+    formatted["status"] = 404 if isinstance(error.original_error, NotFound) else 400
+    return formatted
+
+
+async def start_server(config: FakeConfig, host: str = "127.0.0.1", port: int = 8100) -> web.AppRunner:
+    """Start the fake server on the running loop; call ``runner.cleanup()`` to stop it."""
+    runner = web.AppRunner(FakeAniList(config).app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--count", type=int, default=5000, help="Titles in the synthetic catalog")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Requests per minute before 429s (AniList allows 90)")
+    parser.add_argument("--airing-period", type=int, default=7 * 24 * 60 * 60, help="Seconds between episodes")
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        count=args.count, seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, rate_limit=args.rate_limit, airing_period=args.airing_period,
+    )
+    web.run_app(FakeAniList(config).app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Replay a weighted endpoint mix against the app and record latency percentiles.
+
+By default this starts the fake AniList server (benchmarks.fake_anilist)
+in-process and the app under uvicorn pointed at it through
+``ANILIST_API_URL``; the app still needs its Postgres database. Pass
+``--app-url``/``--upstream-url`` to target servers that are already running.
+Results are written as JSON so runs can be compared over time:
+
+    python -m benchmarks.load --mix browse --duration 30 --concurrency 32
+    python -m benchmarks.load --compare benchmarks/results/load-browse-<old>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from benchmarks.fake_anilist import FakeConfig, start_server
+from benchmarks.payloads import GENRES, WORDS
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+SORT_TYPES = ("popularity", "trending", "score", "start_date")
+
+# Endpoint name -> weight; writes and personalized recommendations need a user
+MIXES: Dict[str, Dict[str, int]] = {
+    "browse": {"search": 30, "sort": 30, "detail": 30, "genres": 5, "autocomplete": 5},
+    "mixed": {"search": 20, "sort": 20, "detail": 25, "recommendations": 15, "watched_write": 15, "genres": 5},
+    "write-heavy": {"detail": 20, "watched_write": 60, "recommendations": 20},
+}
+
+AUTHENTICATED = {"recommendations", "watched_write"}
+
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+def _anime_id(rng: random.Random, catalog_size: int) -> int:
+    # Skewed towards low IDs, like real traffic on popular titles
+    return min(catalog_size, int(rng.paretovariate(1.1)))
+
+
+def build_request(endpoint: str, rng: random.Random, catalog_size: int) -> Request:
+    """Return (method, path, json body) for one call to ``endpoint``."""
+    if endpoint == "search":
+        params = f"query={rng.choice(WORDS)}"
+        if rng.random() < 0.3:
+            params += f"&genres={rng.choice(GENRES)}"
+        return "GET", f"/api/v1/anime/search?{params}", None
+    if endpoint == "autocomplete":
+        word = rng.choice(WORDS)
+        return "GET", f"/api/v1/anime/autocomplete?q={word[:rng.randint(2, len(word))]}", None
+    if endpoint == "sort":
+        params = f"limit={rng.choice((10, 20, 50))}"
+        if rng.random() < 0.6:
+            params += f"&genres={rng.choice(GENRES)}"
+        return "GET", f"/api/v1/anime/sort/{rng.choice(SORT_TYPES)}?{params}", None
+    if endpoint == "detail":
+        return "GET", f"/api/v1/anime/{_anime_id(rng, catalog_size)}", None
+    if endpoint == "genres":
+        return "GET", "/api/v1/anime/genres", None
+    if endpoint == "recommendations":
+        return "GET", "/api/v1/anime/recommendations", None
+    if endpoint == "watched_write":
+        anime_id = _anime_id(rng, catalog_size)
+        return "POST", "/api/v1/user/watched", {
+            "anime_id": anime_id,
+            "title": f"Anime {anime_id}",
+            "rating": rng.randint(1, 10),
+        }
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples: List[Tuple[str, float, int]], elapsed: float, upstream: Dict[str, int]) -> Dict[str, Any]:
+    """Aggregate (endpoint, seconds, status) samples into the report layout."""
+    by_endpoint: Dict[str, List[Tuple[float, int]]] = {}
+    for endpoint, seconds, status in samples:
+        by_endpoint.setdefault(endpoint, []).append((seconds, status))
+
+    def stats(entries: List[Tuple[float, int]]) -> Dict[str, Any]:
+        latencies = sorted(seconds * 1000 for seconds, _ in entries)
+        return {
+            "requests": len(entries),
+            "errors": sum(1 for _, status in entries if status >= 500 or status == 0),
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+        }
+
+    total = len(samples)
+    return {
+        "requests": total,
+        "elapsed_s": elapsed,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "upstream_requests_per_request": upstream.get("requests", 0) / total if total else 0.0,
+        "upstream_queries_per_request": upstream.get("queries", 0) / total if total else 0.0,
+        "upstream": upstream,
+        "overall": stats([(seconds, status) for _, seconds, status in samples]),
+        "endpoints": {endpoint: stats(entries) for endpoint, entries in sorted(by_endpoint.items())},
+    }
+
+
+async def _login(session: aiohttp.ClientSession, app_url: str) -> Optional[str]:
+    """Register a throwaway user and return its bearer token, or None if auth is unavailable."""
+    name = f"load-{uuid.uuid4().hex[:12]}"
+    credentials = {"username": name, "email": f"{name}@example.com", "password": uuid.uuid4().hex}
+    try:
+        async with session.post(f"{app_url}/api/v1/auth/register", json=credentials) as response:
+            if response.status != 200:
+                return None
+        async with session.post(
+            f"{app_url}/api/v1/auth/login",
+            json={"username": name, "password": credentials["password"]},
+        ) as response:
+            if response.status != 200:
+                return None
+            return (await response.json())["access_token"]
+    except aiohttp.ClientError:
+        return None
+
+
+async def _upstream_stats(session: aiohttp.ClientSession, upstream_url: str, reset: bool = False) -> Dict[str, int]:
+    method = session.post if reset else session.get
+    path = "/__stats/reset" if reset else "/__stats"
+    try:
+        async with method(f"{upstream_url}{path}") as response:
+            return await response.json()
+    except aiohttp.ClientError:
+        return {}
+
+
+async def _cache_stats(session: aiohttp.ClientSession, app_url: str) -> Dict[str, Any]:
+    """The app's AniList cache hit ratio, with and without warming (see app.services.warmer)."""
+    try:
+        async with session.get(f"{app_url}/health/cache") as response:
+            return await response.json() if response.status == 200 else {}
+    except aiohttp.ClientError:
+        return {}
+
+
+async def run_load(
+    app_url: str,
+    upstream_url: str,
+    mix: Dict[str, int],
+    duration: float,
+    concurrency: int,
+    catalog_size: int,
+    seed: int = 0,
+    warmup: float = 0.0,
+) -> Dict[str, Any]:
+    """Drive ``concurrency`` closed-loop clients for ``duration`` seconds."""
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        token = None
+        if AUTHENTICATED.intersection(mix):
+            token = await _login(session, app_url)
+            if token is None:
+                print("Could not register a load-test user; skipping authenticated endpoints", file=sys.stderr)
+                mix = {name: weight for name, weight in mix.items() if name not in AUTHENTICATED}
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        endpoints, weights = list(mix), list(mix.values())
+
+        async def client(index: int, deadline: float, samples: Optional[List]) -> None:
+            rng = random.Random(seed * 1000 + index)
+            while time.perf_counter() < deadline:
+                endpoint = rng.choices(endpoints, weights)[0]
+                method, path, body = build_request(endpoint, rng, catalog_size)
+                started = time.perf_counter()
+                try:
+                    async with session.request(method, app_url + path, json=body, headers=headers) as response:
+                        await response.read()
+                        status = response.status
+                except aiohttp.ClientError:
+                    status = 0
+                if samples is not None:
+                    samples.append((endpoint, time.perf_counter() - started, status))
+
+        if warmup:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*[client(i, deadline, None) for i in range(concurrency)])
+
+        await _upstream_stats(session, upstream_url, reset=True)
+        samples: List[Tuple[str, float, int]] = []
+        started = time.perf_counter()
+        await asyncio.gather(*[client(i, started + duration, samples) for i in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        upstream = await _upstream_stats(session, upstream_url)
+        cache = await _cache_stats(session, app_url)
+    report = summarize(samples, elapsed, upstream)
+    report["cache"] = cache
+    return report
+
+
+def _spawn_app(port: int, upstream_url: str, rate_limit: int) -> subprocess.Popen:
+    env = {**os.environ, "ANILIST_API_URL": upstream_url, "ANILIST_RATE_LIMIT": str(rate_limit)}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+
+
+async def _wait_until_up(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"App at {url} did not become healthy within {timeout:.0f}s")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print relative changes of the headline numbers against a stored run."""
+    def line(name: str, new: Optional[float], old: Optional[float]) -> None:
+        if new is None or not old:
+            return
+        print(f"  {name:<34} {old:10.2f} -> {new:10.2f} ({(new - old) / old:+.1%})")
+
+    print(f"Compared with {baseline.get('started_at', 'baseline')}:")
+    for key in ("throughput_rps", "upstream_queries_per_request"):
+        line(key, current.get(key), baseline.get(key))
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        line(f"overall.{key}", current["overall"].get(key), baseline["overall"].get(key))
+    for endpoint, stats in current["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(endpoint)
+        if old:
+            line(f"{endpoint}.p95_ms", stats.get("p95_ms"), old.get("p95_ms"))
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+    fake_runner, app_process = None, None
+    upstream_url = args.upstream_url
+    if upstream_url is None:
+        config = FakeConfig(
+            count=args.count, seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate, rate_limit=args.upstream_rate_limit,
+        )
+        fake_runner = await start_server(config, port=args.upstream_port)
+        upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    app_url = args.app_url
+    try:
+        if app_url is None:
+            app_process = _spawn_app(args.app_port, upstream_url, args.client_rate_limit)
+            app_url = f"http://127.0.0.1:{args.app_port}"
+        await _wait_until_up(app_url)
+        report = await run_load(
+            app_url, upstream_url, MIXES[args.mix], args.duration, args.concurrency,
+            args.count, seed=args.seed, warmup=args.warmup,
+        )
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait()
+        if fake_runner is not None:
+            await fake_runner.cleanup()
+    report["config"] = {
+        key: value for key, value in vars(args).items() if key not in ("output", "compare")
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="browse")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app-url", default=None, help="Target a running app instead of spawning one")
+    parser.add_argument("--app-port", type=int, default=8200)
+    parser.add_argument("--upstream-url", default=None, help="Use a running fake AniList instead of starting one")
+    parser.add_argument("--upstream-port", type=int, default=8100)
+    parser.add_argument("--count", type=int, default=5000, help="Titles in the synthetic catalog")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--upstream-rate-limit", type=int, default=0, help="Fake AniList requests per minute (0 = unlimited)")
+    parser.add_argument("--client-rate-limit", type=int, default=100000, help="ANILIST_RATE_LIMIT for the spawned app")
+    parser.add_argument("--output", default=None, help="Report path (default: benchmarks/results/load-<mix>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    started_at = time.strftime("%Y%m%dT%H%M%S")
+    report = asyncio.run(_main(args))
+    report["started_at"] = started_at
+
+    overall = report["overall"]
+    print(f"{report['requests']} requests in {report['elapsed_s']:.1f}s: {report['throughput_rps']:.1f} req/s, "
+          f"p50 {overall['p50_ms'] or 0:.1f} ms, p95 {overall['p95_ms'] or 0:.1f} ms, p99 {overall['p99_ms'] or 0:.1f} ms, "
+          f"{report['upstream_queries_per_request']:.2f} upstream queries/request")
+    cache = report.get("cache") or {}
+    if cache.get("hit_ratio") is not None:
+        # Cumulative since the app started, warmup included
+        print(f"AniList cache hit ratio {cache['hit_ratio']:.3f} "
+              f"({cache['hit_ratio_without_warming']:.3f} without warming, {cache['refreshes']} warm refreshes)")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"  {endpoint:<16} n={stats['requests']:<6} errors={stats['errors']:<4} "
+              f"p50={stats['p50_ms']:.1f} p95={stats['p95_ms']:.1f} p99={stats['p99_ms']:.1f} ms")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{args.mix}-{started_at}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
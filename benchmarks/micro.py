@@ -0,0 +1,246 @@
+"""Offline microbenchmarks for the per-request hot paths, with a regression gate.
+
+Each benchmark is timed over enough iterations to run for ``--min-time``
+seconds, ``--repeat`` times; the best per-call time is reported, since it
+is the least sensitive to noise from the rest of the machine. Run with:
+
+    python -m benchmarks.micro                       # print results
+    python -m benchmarks.micro --save-baseline       # record benchmarks/results/micro-baseline.json
+    python -m benchmarks.micro --check --threshold 15  # exit 1 if anything is >15% slower
+    python -m benchmarks.micro -k parse -k genre     # only benchmarks whose name matches
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from datetime import timedelta
+from typing import Any, Callable, Dict, List
+
+from benchmarks.payloads import GENRES, make_catalog, make_page
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+BASELINE_PATH = os.path.join(RESULTS_DIR, "micro-baseline.json")
+
+# name -> setup function returning the zero-argument callable to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark("parse_anime")
+def _parse_anime():
+    from app.services.anilist import AniListService
+
+    service = AniListService()
+    media = make_page(1)["Page"]["media"][0]
+    return lambda: service._parse_anime(media)
+
+
+@benchmark("parse_anime_results_50")
+def _parse_anime_results():
+    from app.services.anilist import AniListService
+
+    service = AniListService()
+    page = make_page(50)
+    return lambda: service._parse_anime_results(page)
+
+
+@benchmark("rate_limiter_acquire_contended_100")
+def _rate_limiter():
+    from app.services.anilist import RateLimiter
+
+    async def contend():
+        # A window that never fills, so this measures lock handoff and bookkeeping only
+        limiter = RateLimiter(max_requests=10 ** 9)
+        await asyncio.gather(*[limiter.acquire() for _ in range(100)])
+
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(contend())
+
+
+@benchmark("serialize_response_model_20")
+def _serialize_response_model():
+    return _serialization_setup(20, fast=False)
+
+
+@benchmark("serialize_response_model_500")
+def _serialize_response_model_large():
+    return _serialization_setup(500, fast=False)
+
+
+@benchmark("serialize_fast_path_500")
+def _serialize_fast_path():
+    return _serialization_setup(500, fast=True)
+
+
+def _serialization_setup(size: int, fast: bool):
+    from typing import List as ListType
+
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    from app.core.responses import RawJSONResponse
+    from app.schemas.anime import AnimeBase
+    from app.services.anilist import AniListService
+    from benchmarks.serialization import fast_path_warm
+
+    anime_list = AniListService()._parse_anime_results(make_page(size))
+    if fast:
+        return lambda: fast_path_warm(anime_list)
+    field = create_response_field(name="response", type_=ListType[AnimeBase], mode="serialization")
+    loop = asyncio.new_event_loop()
+    # What a `response_model=List[AnimeBase]` route does, minus event loop setup
+    return lambda: RawJSONResponse(
+        loop.run_until_complete(serialize_response(field=field, response_content=anime_list))
+    ).body
+
+
+@benchmark("jwt_decode")
+def _jwt_decode():
+    from jose import jwt
+
+    from app.auth.auth_utils import create_access_token
+    from app.core.config import settings
+    from app.schemas.token import TokenPayload
+
+    token = create_access_token(42, expires_delta=timedelta(days=1))
+    return lambda: TokenPayload(**jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"]))
+
+
+@benchmark("get_current_user_sqlite")
+def _get_current_user():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from sqlalchemy.pool import StaticPool
+
+    from app.auth.auth_utils import create_access_token
+    from app.auth.deps import get_current_user, get_current_user_id
+    from app.db.session import Base
+    from app.models.user import User
+
+    # In-memory SQLite stands in for Postgres; the user lookup is a primary-key fetch either way
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = Session(engine)
+    user = User(email="bench@example.com", username="bench", hashed_password="x", is_active=True)
+    db.add(user)
+    db.commit()
+    token = create_access_token(user.id, expires_delta=timedelta(days=1))
+    return lambda: get_current_user(db=db, user_id=get_current_user_id(token=token))
+
+
+@benchmark("genre_filter_upstream_50")
+def _genre_filter():
+    from app.api.anime import filter_by_genres
+    from app.services.anilist import AniListService
+
+    results = AniListService()._parse_anime_results(make_page(50))
+    return lambda: filter_by_genres(results, ["Action", "Comedy"], "all", ["Horror"])
+
+
+@benchmark("genre_index_query_20k")
+def _genre_index():
+    from app.services.catalog import CatalogBuilder, CatalogStore
+    from app.services.genre_index import GenreIndex
+
+    builder = CatalogBuilder(GENRES)
+    for media in make_catalog(20000):
+        builder.add(media)
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-catalog-"), "catalog")
+    builder.save(path)
+    store = CatalogStore()
+    store.load(path)
+    index = GenreIndex(store)
+    index.query("score", ["Action"], "any", None, 20)
+    return lambda: index.query("score", ["Action", "Comedy"], "all", ["Horror"], 20)
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, float]:
+    """Best and median seconds per call over ``repeat`` timed runs."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    # autorange targets 0.2 s; scale up to min_time
+    number = max(1, int(number * min_time / 0.2))
+    runs = sorted(t / number for t in timer.repeat(repeat=repeat, number=number))
+    return {"best_us": runs[0] * 1e6, "median_us": runs[len(runs) // 2] * 1e6, "number": number}
+
+
+def run(names: List[str], repeat: int, min_time: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name in names:
+        func = BENCHMARKS[name]()
+        func()  # warm caches and lazy imports outside the timed runs
+        results[name] = measure(func, repeat, min_time)
+        print(f"  {name:<38} {results[name]['best_us']:12.2f} us  (median {results[name]['median_us']:.2f})")
+    return results
+
+
+def check(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Names of benchmarks more than ``threshold`` percent slower than the baseline."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if not old:
+            continue
+        change = (result["best_us"] - old["best_us"]) / old["best_us"] * 100
+        marker = "REGRESSION" if change > threshold else ""
+        print(f"  {name:<38} {old['best_us']:12.2f} -> {result['best_us']:12.2f} us ({change:+6.1f}%) {marker}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="patterns", action="append", default=[], help="Only run benchmarks containing this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per timed run")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="Fail if slower than the baseline")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed slowdown in percent for --check")
+    parser.add_argument("--output", default=None, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.patterns or any(p in name for p in args.patterns)]
+    print(f"Running {len(names)} benchmarks:")
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": run(names, args.repeat, args.min_time),
+    }
+
+    for path in filter(None, (args.output, args.baseline if args.save_baseline else None)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if path == args.baseline and os.path.exists(path):
+            # Keep entries for benchmarks that weren't selected this run
+            with open(path) as f:
+                report["benchmarks"] = {**json.load(f).get("benchmarks", {}), **report["benchmarks"]}
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {path}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}; record one with --save-baseline")
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with baseline from {baseline.get('created_at')} (threshold {args.threshold}%):")
+        regressions = check(report["benchmarks"], baseline, args.threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Synthetic AniList payloads shaped like real `Page`/`Media` responses."""
+import random
+from typing import Any, Dict, List
+
+GENRES = [
+    "Action", "Adventure", "Comedy", "Drama", "Ecchi", "Fantasy", "Horror",
+    "Mahou Shoujo", "Mecha", "Music", "Mystery", "Psychological", "Romance",
+    "Sci-Fi", "Slice of Life", "Sports", "Supernatural", "Thriller",
+]
+
+STATUSES = ["FINISHED", "RELEASING", "NOT_YET_RELEASED", "CANCELLED", "HIATUS"]
+
+WORDS = [
+    "sword", "sky", "academy", "hero", "demon", "love", "star", "ghost",
+    "summer", "dragon", "city", "dream", "blue", "knight", "school", "world",
+]
+
+
+def make_media(anime_id: int, rng: random.Random = None) -> Dict[str, Any]:
+    """Build one Media object with every field the service queries."""
+    rng = rng or random.Random(anime_id)
+    words = rng.sample(WORDS, 3)
+    year = rng.randint(1990, 2025)
+    return {
+        "id": anime_id,
+        "title": {
+            "english": " ".join(w.title() for w in words) if rng.random() < 0.7 else None,
+            "romaji": " no ".join(words),
+            "native": "アニメ{}".format(anime_id),
+        },
+        "synonyms": [" ".join(reversed(words))] if rng.random() < 0.3 else [],
+        "genres": rng.sample(GENRES, rng.randint(1, 4)),
+        "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))),
+        "averageScore": rng.randint(35, 92),
+        "popularity": int(rng.paretovariate(1.2) * 1000),
+        "episodes": rng.choice([1, 12, 13, 24, 25, 26, 50, None]),
+        "status": rng.choice(STATUSES),
+        "coverImage": {
+            "large": "https://s4.anilist.co/file/anilistcdn/media/anime/cover/large/bx{}.jpg".format(anime_id),
+            "medium": "https://s4.anilist.co/file/anilistcdn/media/anime/cover/medium/bx{}.jpg".format(anime_id),
+            "color": "#{:06x}".format(rng.randint(0, 0xFFFFFF)) if rng.random() < 0.8 else None,
+        },
+        "startDate": {"year": year, "month": rng.randint(1, 12), "day": rng.randint(1, 28)},
+        "endDate": {"year": year + rng.randint(0, 2), "month": rng.randint(1, 12), "day": rng.randint(1, 28)},
+        "nextAiringEpisode": None,
+        "isAdult": rng.random() < 0.02,
+    }
+
+
+def make_page(count: int, start_id: int = 1, seed: int = 0) -> Dict[str, Any]:
+    """Build a `Page { media }` response with `count` items."""
+    rng = random.Random(seed)
+    return {"Page": {"media": [make_media(start_id + i, rng) for i in range(count)]}}
+
+
+def make_catalog(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [make_media(i + 1, rng) for i in range(count)]
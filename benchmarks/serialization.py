@@ -0,0 +1,53 @@
+"""Compare FastAPI's response_model path with the pre-serialized fast path.
+
+Run with: python -m benchmarks.serialization
+"""
+import asyncio
+import timeit
+from typing import List
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.core.responses import RawJSONResponse, render_anime_list
+from app.schemas.anime import AnimeBase
+from app.services.anilist import AniListService
+from benchmarks.payloads import make_page
+
+SIZES = (20, 500)
+
+
+def fastapi_path(field, anime_list: List[AnimeBase]) -> bytes:
+    """What a `response_model=List[AnimeBase]` route does for every request."""
+    content = asyncio.run(serialize_response(field=field, response_content=anime_list))
+    return RawJSONResponse(content).body
+
+
+def fast_path_cold(anime_list: List[AnimeBase]) -> bytes:
+    for anime in anime_list:
+        anime.__pydantic_private__["_json"] = None
+    return RawJSONResponse(render_anime_list(anime_list)).body
+
+
+def fast_path_warm(anime_list: List[AnimeBase]) -> bytes:
+    return RawJSONResponse(render_anime_list(anime_list)).body
+
+
+def main():
+    service = AniListService()
+    field = create_response_field(name="response", type_=List[AnimeBase], mode="serialization")
+    for size in SIZES:
+        anime_list = service._parse_anime_results(make_page(size))
+        number = max(1, 20000 // size)
+        print(f"{size} items ({number} iterations):")
+        for name, func in (
+            ("response_model", lambda: fastapi_path(field, anime_list)),
+            ("fast path, cold", lambda: fast_path_cold(anime_list)),
+            ("fast path, warm", lambda: fast_path_warm(anime_list)),
+        ):
+            best = min(timeit.repeat(func, number=number, repeat=5)) / number
+            print(f"  {name:<18} {best * 1e6:10.1f} us/response")
+
+
+if __name__ == "__main__":
+    main()